@@ -357,6 +357,12 @@ setup(
             libraries=['evresp'],
             sources=[pjoin('src', 'evalresp_ext.c')]),
 
+        Extension(
+            'orthodrome_ext',
+            include_dirs=[numpy.get_include()],
+            extra_compile_args=['-Wextra'],
+            sources=[pjoin('src', 'orthodrome_ext.c')]),
+
         Extension(
             'ims_ext',
             include_dirs=[numpy.get_include()],
@@ -372,6 +378,8 @@ setup(
         Extension(
             'autopick_ext',
             include_dirs=[numpy.get_include()],
+            libraries=extension_libs_parstack,
+            extra_compile_args=extension_args_parstack,
             sources=[pjoin('src', 'autopick_ext.c')]),
 
         Extension(
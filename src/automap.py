@@ -6,6 +6,8 @@ import tempfile
 import math
 import random
 import logging
+import hashlib
+import os.path as op
 
 from subprocess import check_call, Popen, PIPE
 from cStringIO import StringIO
@@ -16,7 +18,7 @@ from pyrocko.guts import Object, Float, Bool, Int, Tuple, String, List
 from pyrocko.guts import Unicode, Dict
 from pyrocko.guts_array import Array
 from pyrocko import orthodrome as od
-from pyrocko import gmtpy, topo
+from pyrocko import gmtpy, topo, config, util
 
 logger = logging.getLogger('pyrocko.automap')
 
@@ -449,55 +451,69 @@ class Map(Object):
         gmt = self._gmt
         t, demname = self._get_topo_tile(k)
 
-        if demname not in self._prep_topo_have:
+        if self.illuminate:
+            if k == 'ocean':
+                factor = self.illuminate_factor_ocean
+            else:
+                factor = self.illuminate_factor_land
+        else:
+            factor = None
 
-            grdfile = gmt.tempfilename()
-            gmtpy.savegrd(
-                t.x(), t.y(), t.data, filename=grdfile, naming='lonlat')
+        key = grid_key(t, self.replace_topo_color_only, factor)
 
-            if self.illuminate:
-                if k == 'ocean':
-                    factor = self.illuminate_factor_ocean
-                else:
-                    factor = self.illuminate_factor_land
+        if key not in self._prep_topo_have:
+            cache_dir = grid_cache_dir()
+            grdfile = op.join(cache_dir, '%s.grd' % key)
+            ilumfile = op.join(cache_dir, '%s.ilum.grd' % key)
 
-                ilumfn = gmt.tempfilename()
-                gmt.grdgradient(
-                    grdfile,
-                    N='e%g' % factor,
-                    A=-45,
-                    G=ilumfn,
-                    out_discard=True)
+            if not op.exists(grdfile):
+                logger.debug('preparing topography grid %s' % grdfile)
+                grdfile_tmp = gmt.tempfilename()
+                gmtpy.savegrd(
+                    t.x(), t.y(), t.data, filename=grdfile_tmp,
+                    naming='lonlat')
 
-                ilumargs = ['-I%s' % ilumfn]
-            else:
-                ilumargs = []
+                if self.replace_topo_color_only:
+                    t2 = self.replace_topo_color_only
+                    grdfile2 = gmt.tempfilename()
 
-            if self.replace_topo_color_only:
-                t2 = self.replace_topo_color_only
-                grdfile2 = gmt.tempfilename()
+                    gmtpy.savegrd(
+                        t2.x(), t2.y(), t2.data, filename=grdfile2,
+                        naming='lonlat')
 
-                gmtpy.savegrd(
-                    t2.x(), t2.y(), t2.data, filename=grdfile2,
-                    naming='lonlat')
+                    gmt.grdsample(
+                        grdfile2,
+                        G=grdfile_tmp,
+                        Q='l',
+                        I='%g/%g' % (t.dx, t.dy),
+                        R=grdfile_tmp,
+                        out_discard=True)
+
+                    gmt.grdmath(
+                        grdfile_tmp, '0.0', 'AND', '=', grdfile2,
+                        out_discard=True)
+
+                    grdfile_tmp = grdfile2
 
-                gmt.grdsample(
-                    grdfile2,
-                    G=grdfile,
-                    Q='l',
-                    I='%g/%g' % (t.dx, t.dy),
-                    R=grdfile,
-                    out_discard=True)
+                move_into_cache(grdfile_tmp, grdfile)
 
-                gmt.grdmath(
-                    grdfile, '0.0', 'AND', '=', grdfile2,
-                    out_discard=True)
+            if factor is not None:
+                if not op.exists(ilumfile):
+                    ilumfile_tmp = gmt.tempfilename()
+                    gmtpy.savegrd(
+                        t.x(), t.y(),
+                        illumination(t.data, factor, azimuth=-45.),
+                        filename=ilumfile_tmp, naming='lonlat')
 
-                grdfile = grdfile2
+                    move_into_cache(ilumfile_tmp, ilumfile)
+
+                ilumargs = ['-I%s' % ilumfile]
+            else:
+                ilumargs = []
 
-            self._prep_topo_have[demname] = grdfile, ilumargs
+            self._prep_topo_have[key] = grdfile, ilumargs
 
-        return self._prep_topo_have[demname]
+        return self._prep_topo_have[key]
 
     def _draw_topo(self):
         widget = self._widget
@@ -939,6 +955,59 @@ def rand(mi, ma):
     return random.random() * (ma-mi) + mi
 
 
+def illumination(data, factor, azimuth=-45.):
+    '''
+    Compute shading intensities from elevation grid.
+
+    Replacement for ``grdgradient -Ne<factor> -A<azimuth>``: as in GMT, the
+    negative directional derivative along ``azimuth`` (degrees clockwise from
+    north) is used, so that slopes facing the light come out bright. It is
+    normalized with a cumulative Laplace distribution to the range
+    [-factor, factor]. Rows of *data* are expected to run from south to
+    north.
+    '''
+
+    dzdy, dzdx = num.gradient(data.astype(num.float))
+    az = azimuth * d2r
+    g = -(math.sin(az) * dzdx + math.cos(az) * dzdy)
+
+    offset = num.mean(g)
+    g -= offset
+    sigma = num.mean(num.abs(g))
+    if sigma == 0.0:
+        return num.zeros(g.shape)
+
+    e = num.exp(-math.sqrt(2.0) * num.abs(g) / sigma)
+    return num.sign(g) * factor * (1.0 - e)
+
+
+def grid_cache_dir():
+    return op.join(config.config().cache_dir, 'automap')
+
+
+def grid_key(t, t_replace=None, illuminate_factor=None):
+    '''
+    Get content-addressed key for prepared topography grids.
+    '''
+
+    h = hashlib.sha1()
+    for t_ in (t, t_replace):
+        if t_ is not None:
+            h.update(repr((t_.xmin, t_.ymin, t_.dx, t_.dy, t_.data.shape,
+                           str(t_.data.dtype))))
+            h.update(num.ascontiguousarray(t_.data).data)
+
+    h.update(repr(illuminate_factor))
+    return h.hexdigest()
+
+
+def move_into_cache(fn, fn_cache):
+    util.ensuredirs(fn_cache)
+    fn_tmp = fn_cache + '.%i.temp' % os.getpid()
+    shutil.copy(fn, fn_tmp)
+    os.rename(fn_tmp, fn_cache)
+
+
 def split_region(region):
     west, east, south, north = topo.positive_region(region)
     if east > 180:
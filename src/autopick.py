@@ -25,3 +25,175 @@ def recursive_stalta(tshort, tlong, kshort, klong, kderivative, energytrace, tem
     else:
         return energytrace, temp
 
+
+
+stalta_methods = {
+    'classic': 0,
+    'centered': 1,
+    'recursive': 2}
+
+
+def _nparallel(nparallel):
+    if nparallel is None:
+        import multiprocessing
+        nparallel = multiprocessing.cpu_count()
+
+    return nparallel
+
+
+def sta_lta(data, nshort, nlong, method='classic', quad=True, nparallel=None):
+    '''Run STA/LTA on many equally sampled channels at once.
+
+    :param data: 2D array with one channel per row (1D arrays are treated
+        as a single channel)
+    :param nshort: length of short time window in samples
+    :param nlong: length of long time window in samples
+    :param method: ``'classic'`` (trailing windows), ``'centered'``
+        (windows centered on each sample, as in
+        :py:meth:`pyrocko.trace.Trace.sta_lta_centered`) or ``'recursive'``
+        (exponentially weighted averages)
+    :param quad: whether to square the data prior to applying the filter
+    :param nparallel: number of threads to use, by default the number of
+        CPUs
+    :returns: array with the STA/LTA ratios, same shape as *data*
+
+    The centered variant needs more than *nlong* samples per channel. For the
+    classic and recursive variants, the ratio is zero for the first
+    *nlong* - 1 samples. To process data in consecutive blocks, use
+    :py:class:`STALTA`.
+    '''
+
+    return STALTA(nshort, nlong, method, quad, nparallel).process(data)
+
+
+class STALTA(object):
+    '''Multi-channel STA/LTA processing data block by block.
+
+    The state of the filter is carried from one call of :py:meth:`process`
+    or :py:meth:`process_traces` to the next, so that a continuous data
+    stream can be processed in consecutive windows, e.g. those of
+    :py:meth:`pyrocko.pile.Pile.chopper`, without padding. The result is the
+    same as when processing the complete stream at once. This does not work
+    for the ``'centered'`` method, which looks at future samples; for it,
+    each block is processed independently.
+
+    See :py:func:`sta_lta` for a description of the arguments.
+    '''
+
+    def __init__(self, nshort, nlong, method='classic', quad=True,
+                 nparallel=None):
+
+        if method not in stalta_methods:
+            raise AutopickError('invalid STA/LTA method: %s' % method)
+
+        nshort, nlong = int(nshort), int(nlong)
+        if not (1 <= nshort < nlong):
+            raise AutopickError('need 1 <= nshort < nlong')
+
+        self.nshort = nshort
+        self.nlong = nlong
+        self.method = method
+        self.quad = quad
+        self.nparallel = _nparallel(nparallel)
+        self.reset()
+
+    def reset(self):
+        '''Forget the state of all channels.'''
+
+        self._state = None
+        self._nseen = None
+        self._trace_states = {}
+
+    def _new_state(self, nchannels):
+        if self.method == 'classic':
+            nstate = self.nlong
+        else:
+            nstate = 2
+
+        return (num.zeros((nchannels, nstate), dtype=num.float64),
+                num.zeros(nchannels, dtype=num.int64))
+
+    def _run(self, data, state, nseen):
+        # convert before squaring, integer data would overflow
+        data = num.asarray(data, dtype=num.float64)
+        if self.method == 'centered' and data.shape[-1] <= self.nlong:
+            raise AutopickError(
+                'centered STA/LTA needs more than nlong samples')
+
+        if self.quad:
+            data = data**2
+
+        return autopick_ext.stalta(
+            stalta_methods[self.method], self.nshort, self.nlong,
+            data, state, nseen, self.nparallel)
+
+    def process(self, data):
+        '''Process next block of data.
+
+        :param data: 2D array (channels, samples) or 1D array (one channel);
+            the number of channels must not change between calls
+        :returns: array with the STA/LTA ratios, same shape as *data*
+        '''
+
+        data = num.asarray(data)
+        shape = data.shape
+        data2 = data.reshape((-1, shape[-1]))
+        nchannels = data2.shape[0]
+
+        if self._state is None:
+            self._state, self._nseen = self._new_state(nchannels)
+
+        if self._state.shape[0] != nchannels:
+            raise AutopickError(
+                'number of channels changed from %i to %i' % (
+                    self._state.shape[0], nchannels))
+
+        return self._run(data2, self._state, self._nseen).reshape(shape)
+
+    def process_traces(self, traces):
+        '''Process next block of data given as traces.
+
+        The state is kept separately for each channel (identified by its
+        nslc code). It is reset for a channel when its data does not
+        seamlessly continue the data of the previous call. Traces with equal
+        sampling rate and number of samples are processed together.
+
+        :param traces: list of :py:class:`pyrocko.trace.Trace` objects
+        :returns: list of new traces with the STA/LTA ratios
+        '''
+
+        groups = {}
+        for tr in traces:
+            k = (tr.deltat, tr.data_len())
+            groups.setdefault(k, []).append(tr)
+
+        out_traces = []
+        for (deltat, nsamples), group in sorted(groups.items()):
+            states, nseens = [], []
+            for tr in group:
+                st = self._trace_states.get(tr.nslc_id, None)
+                if st is None or st[0] != deltat or \
+                        abs(st[1] - tr.tmin) > 0.01 * deltat:
+
+                    state, nseen = self._new_state(1)
+                else:
+                    state, nseen = st[2], st[3]
+
+                states.append(state)
+                nseens.append(nseen)
+
+            state = num.concatenate(states)
+            nseen = num.concatenate(nseens)
+            data = num.vstack([tr.get_ydata() for tr in group])
+            result = self._run(data, state, nseen)
+
+            for i, tr in enumerate(group):
+                self._trace_states[tr.nslc_id] = (
+                    deltat, tr.tmin + nsamples*deltat,
+                    state[i:i+1].copy(), nseen[i:i+1].copy())
+
+                out_tr = tr.copy(data=False)
+                out_tr.set_ydata(result[i])
+                out_traces.append(out_tr)
+
+        return out_traces
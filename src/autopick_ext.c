@@ -5,6 +5,11 @@
 
 static PyObject *AutoPickError;
 #include<math.h>
+#include <stdlib.h>
+#include <string.h>
+#if !noomp
+# include <omp.h>
+#endif
 
 #ifndef max
 	#define max( a, b ) ( ((a) > (b)) ? (a) : (b) )
@@ -146,9 +151,287 @@ static PyObject* autopick_recursive_stalta_wrapper(PyObject *dummy, PyObject *ar
     return Py_None;
 }
 
+#define STALTA_CLASSIC 0
+#define STALTA_CENTERED 1
+#define STALTA_RECURSIVE 2
+
+/*
+ * Classic STA/LTA with trailing windows on one channel.
+ *
+ * hist holds the last nl input samples of the previous call, nseen the
+ * number of samples seen so far. The ratio is set to zero until the long
+ * window is filled.
+ */
+int stalta_classic(size_t ns, size_t nl, size_t nsamples, const double *in,
+                   double *hist, npy_int64 *nseen, double *out)
+{
+    size_t i;
+    double ssum, lsum, lta;
+    double *buf;
+
+    buf = (double*)malloc((nl+nsamples)*sizeof(double));
+    if (buf == NULL) {
+        return 1;
+    }
+
+    memcpy(buf, hist, nl*sizeof(double));
+    memcpy(buf+nl, in, nsamples*sizeof(double));
+
+    ssum = 0.0;
+    for (i=nl-ns+1; i<nl; i++) {
+        ssum += buf[i];
+    }
+
+    lsum = 0.0;
+    for (i=1; i<nl; i++) {
+        lsum += buf[i];
+    }
+
+    for (i=nl; i<nl+nsamples; i++) {
+        ssum += buf[i];
+        lsum += buf[i];
+        *nseen += 1;
+        lta = lsum / nl;
+        if (*nseen >= (npy_int64)nl && lta > 0.0) {
+            out[i-nl] = (ssum / ns) / lta;
+        } else {
+            out[i-nl] = 0.0;
+        }
+        ssum -= buf[i-ns+1];
+        lsum -= buf[i-nl+1];
+    }
+
+    memcpy(hist, buf+nsamples, nl*sizeof(double));
+    free(buf);
+    return 0;
+}
+
+/*
+ * Recursive (exponentially weighted) STA/LTA on one channel.
+ *
+ * state holds the current STA and LTA values.
+ */
+int stalta_recursive(size_t ns, size_t nl, size_t nsamples, const double *in,
+                     double *state, npy_int64 *nseen, double *out)
+{
+    size_t i;
+    double csta, clta, sta, lta;
+
+    csta = 1.0 / ns;
+    clta = 1.0 / nl;
+    sta = state[0];
+    lta = state[1];
+
+    for (i=0; i<nsamples; i++) {
+        sta = csta * in[i] + (1.0 - csta) * sta;
+        lta = clta * in[i] + (1.0 - clta) * lta;
+        *nseen += 1;
+        if (*nseen >= (npy_int64)nl && lta > 0.0) {
+            out[i] = sta / lta;
+        } else {
+            out[i] = 0.0;
+        }
+    }
+
+    state[0] = sta;
+    state[1] = lta;
+    return 0;
+}
+
+/*
+ * Centered moving average, same as pyrocko.trace.moving_avg.
+ */
+void moving_avg(size_t n, size_t nsamples, const double *in, double *out)
+{
+    size_t i, h;
+    double s;
+
+    h = n/2;
+    s = 0.0;
+    for (i=1; i<=n; i++) {
+        s += in[i];
+    }
+
+    out[h] = s / n;
+    for (i=1; i<nsamples-n; i++) {
+        s += in[i+n] - in[i];
+        out[h+i] = s / n;
+    }
+
+    for (i=0; i<h; i++) {
+        out[i] = out[h];
+    }
+
+    for (i=h+nsamples-n; i<nsamples; i++) {
+        out[i] = out[h+nsamples-n-1];
+    }
+}
+
+/*
+ * Centered STA/LTA on one channel. Gives the ratio of the centered short
+ * and long window averages.
+ */
+int stalta_centered(size_t ns, size_t nl, size_t nsamples, const double *in,
+                    double *out)
+{
+    size_t i;
+    double *lta;
+
+    if (nsamples <= nl) {
+        return 1;
+    }
+
+    lta = (double*)malloc(nsamples*sizeof(double));
+    if (lta == NULL) {
+        return 1;
+    }
+
+    moving_avg(ns, nsamples, in, out);
+    moving_avg(nl, nsamples, in, lta);
+    for (i=0; i<nsamples; i++) {
+        out[i] /= lta[i];
+    }
+
+    free(lta);
+    return 0;
+}
+
+int stalta_multi(int method, size_t ns, size_t nl, size_t nchannels,
+                 size_t nsamples, const double *in, double *state,
+                 npy_int64 *nseen, double *out, int nparallel)
+{
+    int ichannel, err, nerr;
+    size_t nstate;
+
+    (void) nparallel;
+
+    nstate = (method == STALTA_CLASSIC) ? nl : 2;
+    nerr = 0;
+
+    #if !noomp
+    #pragma omp parallel for private(ichannel, err) reduction(+:nerr) schedule(dynamic) num_threads(nparallel)
+    #endif
+    for (ichannel=0; ichannel<(int)nchannels; ichannel++) {
+        if (method == STALTA_CLASSIC) {
+            err = stalta_classic(
+                ns, nl, nsamples, in + ichannel*nsamples,
+                state + ichannel*nstate, nseen + ichannel,
+                out + ichannel*nsamples);
+        } else if (method == STALTA_RECURSIVE) {
+            err = stalta_recursive(
+                ns, nl, nsamples, in + ichannel*nsamples,
+                state + ichannel*nstate, nseen + ichannel,
+                out + ichannel*nsamples);
+        } else {
+            err = stalta_centered(
+                ns, nl, nsamples, in + ichannel*nsamples,
+                out + ichannel*nsamples);
+        }
+        nerr += err;
+    }
+
+    return nerr != 0;
+}
+
+static PyObject* autopick_stalta_wrapper(PyObject *dummy, PyObject *args) {
+    PyObject *in_array_obj, *state_array_obj, *nseen_array_obj;
+    PyArrayObject *in_array = NULL;
+    PyArrayObject *state_array = NULL;
+    PyArrayObject *nseen_array = NULL;
+    PyArrayObject *out_array = NULL;
+    int method, ns, nl, nparallel;
+    size_t nchannels, nsamples, nstate;
+    double *state = NULL;
+    npy_int64 *nseen = NULL;
+
+    (void) dummy;
+
+    if (!PyArg_ParseTuple(args, "iiiOOOi", &method, &ns, &nl, &in_array_obj,
+                          &state_array_obj, &nseen_array_obj, &nparallel)) {
+        PyErr_SetString(AutoPickError, "usage stalta(method, ns, nl, data, state, nseen, nparallel)");
+        return NULL;
+    }
+
+    if (method != STALTA_CLASSIC && method != STALTA_CENTERED && method != STALTA_RECURSIVE) {
+        PyErr_SetString(AutoPickError, "invalid method");
+        return NULL;
+    }
+
+    if (!(1 <= ns && ns < nl)) {
+        PyErr_SetString(AutoPickError, "need 1 <= ns < nl");
+        return NULL;
+    }
+
+    in_array = (PyArrayObject*)PyArray_ContiguousFromAny(in_array_obj, NPY_FLOAT64, 2, 2);
+    if (in_array == NULL) {
+        PyErr_SetString(AutoPickError, "cannot create a contiguous 2D float64 array from data.");
+        return NULL;
+    }
+
+    nchannels = PyArray_DIM(in_array, 0);
+    nsamples = PyArray_DIM(in_array, 1);
+
+    if (method == STALTA_CENTERED && nsamples <= (size_t)nl) {
+        PyErr_SetString(AutoPickError, "centered STA/LTA needs more than nl samples per channel.");
+        Py_DECREF(in_array);
+        return NULL;
+    }
+
+    if (method != STALTA_CENTERED) {
+        nstate = (method == STALTA_CLASSIC) ? (size_t)nl : 2;
+
+        if (!PyArray_Check(state_array_obj) || !PyArray_Check(nseen_array_obj)) {
+            PyErr_SetString(AutoPickError, "state and nseen must be NumPy arrays.");
+            Py_DECREF(in_array);
+            return NULL;
+        }
+
+        state_array = (PyArrayObject*)state_array_obj;
+        nseen_array = (PyArrayObject*)nseen_array_obj;
+
+        if (PyArray_TYPE(state_array) != NPY_FLOAT64 || !PyArray_ISCARRAY(state_array) ||
+                (size_t)PyArray_SIZE(state_array) != nchannels*nstate) {
+            PyErr_SetString(AutoPickError, "state must be a contiguous float64 array of shape (nchannels, nl) for classic and (nchannels, 2) for recursive STA/LTA.");
+            Py_DECREF(in_array);
+            return NULL;
+        }
+
+        if (PyArray_TYPE(nseen_array) != NPY_INT64 || !PyArray_ISCARRAY(nseen_array) ||
+                (size_t)PyArray_SIZE(nseen_array) != nchannels) {
+            PyErr_SetString(AutoPickError, "nseen must be a contiguous int64 array of length nchannels.");
+            Py_DECREF(in_array);
+            return NULL;
+        }
+
+        state = (double*)PyArray_DATA(state_array);
+        nseen = (npy_int64*)PyArray_DATA(nseen_array);
+    }
+
+    out_array = (PyArrayObject*)PyArray_SimpleNew(2, PyArray_DIMS(in_array), NPY_FLOAT64);
+    if (out_array == NULL) {
+        Py_DECREF(in_array);
+        return NULL;
+    }
+
+    if (0 != stalta_multi(method, ns, nl, nchannels, nsamples,
+                          (double*)PyArray_DATA(in_array), state, nseen,
+                          (double*)PyArray_DATA(out_array), nparallel)) {
+        PyErr_SetString(AutoPickError, "running STA/LTA failed.");
+        Py_DECREF(in_array);
+        Py_DECREF(out_array);
+        return NULL;
+    }
+
+    Py_DECREF(in_array);
+    return (PyObject*)out_array;
+}
+
 static PyMethodDef AutoPickMethods[] = {
     {"recursive_stalta",  autopick_recursive_stalta_wrapper, METH_VARARGS, 
         "Recursive STA/LTA picker." },
+
+    {"stalta",  autopick_stalta_wrapper, METH_VARARGS,
+        "Multi-channel STA/LTA." },
         
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
@@ -578,13 +578,7 @@ def plot_beachball_mpl_pixmap(
     x = num.linspace(-1., 1., nx)
     y = num.linspace(-1., 1., ny)
 
-    vecs2 = num.zeros((nx*ny, 2), dtype=num.float)
-    vecs2[:, 0] = num.tile(x, ny)
-    vecs2[:, 1] = num.repeat(y, nx)
-
-    ii_ok = vecs2[:, 0]**2 + vecs2[:, 1]**2 <= 1.0
-
-    vecs3_ok = inverse_project(vecs2[ii_ok, :], projection)
+    ii_ok, vecs3_ok = pixmap_grid(projection, nx)
 
     to_e = num.vstack((vn, vt, vp))
 
@@ -629,6 +623,185 @@ def plot_beachball_mpl_pixmap(
         zorder=zorder,
         alpha=alpha)
 
+
+g_pixmap_grids = {}
+
+
+def pixmap_grid(projection='lambert', npix=200):
+    '''
+    Get unit vectors of a regular pixel grid on the projected focal sphere.
+
+    The grid is shared by all mechanisms and is cached per
+    ``(projection, npix)``.
+
+    :returns: ``(ii_ok, vecs3_ok)``, boolean mask of the ``npix*npix`` grid
+        points inside the unit circle (first coordinate varying fastest) and
+        the corresponding unit vectors, shape ``(nok, 3)``
+    '''
+
+    k = projection, npix
+    if k not in g_pixmap_grids:
+        x = num.linspace(-1., 1., npix)
+
+        vecs2 = num.zeros((npix*npix, 2), dtype=num.float)
+        vecs2[:, 0] = num.tile(x, npix)
+        vecs2[:, 1] = num.repeat(x, npix)
+
+        ii_ok = vecs2[:, 0]**2 + vecs2[:, 1]**2 <= 1.0
+
+        vecs3_ok = inverse_project(vecs2[ii_ok, :], projection)
+
+        if len(g_pixmap_grids) > 16:
+            g_pixmap_grids.clear()
+
+        g_pixmap_grids[k] = ii_ok, vecs3_ok
+
+    return g_pixmap_grids[k]
+
+
+def as_mts(mts):
+    if isinstance(mts, mtm.MomentTensors):
+        return mts
+    else:
+        return mtm.MomentTensors.from_moment_tensors(
+            [mtm.as_mt(mt) for mt in mts])
+
+
+def deco_parts(mts, mt_type='full'):
+    mts = as_mts(mts)
+    if mt_type == 'full':
+        return mts
+
+    res = mts.standard_decompositions()
+    ms = dict(
+        dc=res[1][2],
+        deviatoric=res[3][2])[mt_type]
+
+    return mtm.MomentTensors.from_ms(ms)
+
+
+def beachball_pixmaps(
+        mts,
+        beachball_type='deviatoric',
+        npix=50,
+        projection='lambert',
+        nchunk=1000):
+
+    '''
+    Evaluate radiation pattern polarities of many mechanisms on a pixel grid.
+
+    :param mts: :py:class:`pyrocko.moment_tensor.MomentTensors` object or
+        sequence of moment tensors as accepted by
+        :py:func:`pyrocko.moment_tensor.as_mt`
+    :returns: ``int8`` array of shape ``(N, npix, npix)``, ``1`` in
+        compressional (T) quadrants, ``-1`` in dilatational (P) quadrants,
+        ``0`` outside of the focal sphere. Rows run from south to north,
+        columns from west to east.
+    '''
+
+    mts = deco_parts(mts, beachball_type)
+    m6s = mts.m6s()
+    n = len(mts)
+
+    ii_ok, vecs3_ok = pixmap_grid(projection, npix)
+    x, y, z = vecs3_ok.T
+
+    # v.T * m * v for all grid vectors v, as a product with the m6 arrays
+    basis = num.vstack((x*x, y*y, z*z, 2.*x*y, 2.*x*z, 2.*y*z))
+
+    pixmaps = num.zeros((n, npix*npix), dtype=num.int8)
+    for i in xrange(0, n, nchunk):
+        amps = num.dot(m6s[i:i+nchunk], basis)
+        pixmaps[i:i+nchunk, ii_ok] = num.where(amps > 0., 1, -1)
+
+    return pixmaps.reshape((n, npix, npix)).transpose((0, 2, 1))
+
+
+def plot_beachballs_mpl_pixmap(
+        mts, axes, positions,
+        beachball_type='deviatoric',
+        size=None,
+        zorder=0,
+        color_t='red',
+        color_p='white',
+        edgecolor='black',
+        alpha=1.0,
+        projection='lambert',
+        npix=50,
+        max_image_size=4096):
+
+    '''
+    Plot many beachballs at once, composited into a single raster image.
+
+    Much faster than calling :py:func:`plot_beachball_mpl` for each
+    mechanism, e.g. for catalog overview maps. Positions and *size* are in
+    data units. Mechanisms later in the list are drawn on top. If the image
+    would be larger than *max_image_size* pixels, *npix* is reduced.
+
+    :param mts: moment tensors, see :py:func:`beachball_pixmaps`
+    :param positions: array of shape ``(N, 2)`` with the beachball centers
+    :returns: the :py:class:`matplotlib.image.AxesImage` created
+    '''
+
+    from matplotlib.colors import colorConverter
+
+    _, _, size = choose_transform(axes, 'data', (0., 0.), size)
+
+    positions = num.asarray(positions, dtype=num.float).reshape((-1, 2))
+    xmin, ymin = num.min(positions, axis=0) - size
+    xmax, ymax = num.max(positions, axis=0) + size
+
+    nmax = max(xmax - xmin, ymax - ymin) / (2.*size) * npix
+    if nmax > max_image_size:
+        npix = max(4, int(npix * max_image_size / nmax))
+
+    delta = 2.*size / npix
+    ncols = int(num.ceil((xmax - xmin) / delta))
+    nrows = int(num.ceil((ymax - ymin) / delta))
+
+    pixmaps = beachball_pixmaps(
+        mts, beachball_type=beachball_type, npix=npix,
+        projection=projection)
+
+    # 0: outside, 1: P, 2: T, 3: edge
+    codes = num.where(pixmaps > 0, 2, num.where(pixmaps < 0, 1, 0)) \
+        .astype(num.int8)
+
+    padded = num.zeros((pixmaps.shape[0], npix+2, npix+2), dtype=num.int8)
+    padded[:, 1:-1, 1:-1] = pixmaps
+    edge = num.zeros(pixmaps.shape, dtype=num.bool)
+    for sl in ((slice(0, -2), slice(1, -1)), (slice(2, None), slice(1, -1)),
+               (slice(1, -1), slice(0, -2)), (slice(1, -1), slice(2, None))):
+        edge |= padded[(slice(None),) + sl] != pixmaps
+
+    codes[num.logical_and(edge, pixmaps != 0)] = 3
+
+    irows = num.round((positions[:, 1] - size - ymin) / delta).astype(num.int)
+    icols = num.round((positions[:, 0] - size - xmin) / delta).astype(num.int)
+    irows = num.clip(irows, 0, nrows - npix)
+    icols = num.clip(icols, 0, ncols - npix)
+
+    canvas = num.zeros((nrows, ncols), dtype=num.int8)
+    for code, irow, icol in zip(codes, irows, icols):
+        sub = canvas[irow:irow+npix, icol:icol+npix]
+        mask = code != 0
+        sub[mask] = code[mask]
+
+    palette = num.array([
+        (0., 0., 0., 0.),
+        colorConverter.to_rgba(color_p, alpha),
+        colorConverter.to_rgba(color_t, alpha),
+        colorConverter.to_rgba(edgecolor, alpha)])
+
+    return axes.imshow(
+        palette[canvas],
+        origin='lower',
+        extent=(xmin, xmin + ncols*delta, ymin, ymin + nrows*delta),
+        interpolation='nearest',
+        aspect=axes.get_aspect(),
+        zorder=zorder)
+
+
 if __name__ == '__main__':
     import sys
     import matplotlib.pyplot as plt
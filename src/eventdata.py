@@ -1,4 +1,5 @@
 from pyrocko import trace, util, model
+from pyrocko.parimap import parimap
 
 import logging, copy
 import numpy as num
@@ -26,6 +27,10 @@ class Problems:
             self._problems[kind] = set()
         problem = self._problems[kind]
         problem.add(nslct)
+
+    def update(self, other):
+        for kind, problem in other._problems.iteritems():
+            self._problems.setdefault(kind, set()).update(problem)
         
     def dump(self, fn):
         f = open(fn, 'w')
@@ -46,7 +51,24 @@ class Problems:
             p[kind] = nsl
         
         return p
-        
+
+
+def _pack(traces):
+    # pickled traces do not carry their data, so it is passed alongside when
+    # traces are sent to or from worker processes
+    return [(tr, tr.ydata, tr.meta) for tr in traces]
+
+
+def _unpack(ptraces):
+    traces = []
+    for tr, ydata, meta in ptraces:
+        tr.ydata = ydata
+        tr.meta = meta
+        traces.append(tr)
+
+    return traces
+
+
 class EventDataAccess:
     '''Abstract base class for event data access (see rdseed.py)'''
     
@@ -160,7 +182,7 @@ class EventDataAccess:
         
         return to_delete
   
-    def iter_displacement_traces( self, tfade, freqband, 
+    def iter_displacement_traces( self, tfade, freqband,
                                   deltat=None,
                                   rotations=None,
                                   projections=None,
@@ -175,129 +197,222 @@ class EventDataAccess:
                                   redundant_channel_priorities=None,
                                   restitution_off_hack=False,
                                   preprocess=None,
-                                  progress='Processing traces'):
-        
+                                  progress='Processing traces',
+                                  nparallel=1,
+                                  batch=True):
+
+        '''Iterate over restituted traces, grouped by station.
+
+        With *nparallel* > 1, stations are processed in a pool of worker
+        processes. At most *nparallel* station groups are in flight at any
+        time and the groups are yielded in the same order as in sequential
+        mode. If *batch* is ``True``, traces of a station with equal
+        sampling rate and length are restituted in one vectorized call.
+        '''
+
         stations = self.get_stations(relative_event=relative_event)
         if out_stations is not None:
             out_stations.clear()
         else:
             out_stations = {}
 
-        for xtraces in self.get_pile().chopper_grouped(
-                gather=lambda tr: (tr.network, tr.station, tr.location),
-                group_selector=group_selector,
-                trace_selector=trace_selector,
-                progress=progress):
-            
-            xxtraces = []
-            nslcs = set()
-            for tr in xtraces:
-                nsl = tr.network, tr.station, tr.location
-                if nsl not in stations:
-                    logger.warn('No station description for trace %s.%s.%s.%s' % tr.nslc_id) 
+        def groups():
+            for xtraces in self.get_pile().chopper_grouped(
+                    gather=lambda tr: (tr.network, tr.station, tr.location),
+                    group_selector=group_selector,
+                    trace_selector=trace_selector,
+                    progress=progress):
+
+                traces = self._weed_traces(
+                    xtraces, stations, redundant_channel_priorities)
+
+                if traces:
+                    # all traces belong to the same station here
+                    yield _pack(traces), stations[traces[0].nslc_id[:3]]
+
+        def process(args):
+            ptraces, station = args
+            displacements, out_station, problems = \
+                self._restitute_station_traces(
+                    _unpack(ptraces), station, tfade, freqband,
+                    deltat=deltat,
+                    rotations=rotations,
+                    projections=projections,
+                    maxdisplacement=maxdisplacement,
+                    extend=extend,
+                    allowed_methods=allowed_methods,
+                    crop=crop,
+                    restitution_off_hack=restitution_off_hack,
+                    preprocess=preprocess,
+                    batch=batch)
+
+            return _pack(displacements), out_station, problems
+
+        for pdisplacements, out_station, problems in parimap(
+                process, groups(), nprocs=nparallel):
+
+            self.problems().update(problems)
+            if out_station is not None:
+                out_stations[out_station.nsl()] = out_station
+
+            yield _unpack(pdisplacements)
+
+    def _weed_traces(self, xtraces, stations, redundant_channel_priorities):
+        xxtraces = []
+        nslcs = set()
+        for tr in xtraces:
+            nsl = tr.network, tr.station, tr.location
+            if nsl not in stations:
+                logger.warn('No station description for trace %s.%s.%s.%s' % tr.nslc_id)
+                continue
+
+            nslcs.add(tr.nslc_id)
+            xxtraces.append(tr)
+
+        to_delete = self._redundant_channel_weeder(redundant_channel_priorities, nslcs)
+        traces = []
+        for tr in xxtraces:
+            if tr.nslc_id in to_delete:
+                logger.info('Skipping channel %s.%s.%s.%s due to redunancies.' % tr.nslc_id)
+                continue
+            traces.append(tr)
+
+        traces.sort( lambda a,b: cmp(a.full_id, b.full_id) )
+
+        return trace.degapper(traces)  # mainly to get rid if overlaps and duplicates
+
+    def _restitute_station_traces(self, traces, station, tfade, freqband,
+                                  deltat=None,
+                                  rotations=None,
+                                  projections=None,
+                                  maxdisplacement=None,
+                                  extend=None,
+                                  allowed_methods=None,
+                                  crop=True,
+                                  restitution_off_hack=False,
+                                  preprocess=None,
+                                  batch=True):
+
+        # May run in a worker process, therefore problems are collected
+        # locally and returned, together with the output station.
+
+        problems = Problems()
+
+        prepared = []
+        for tr in traces:
+
+            if preprocess is not None:
+                preprocess(tr)
+
+            tr.ydata = tr.ydata - num.mean(tr.ydata)
+
+            if deltat is not None:
+                try:
+                    tr.downsample_to(deltat, snap=True, allow_upsample_max=5)
+                except util.UnavailableDecimation, e:
+                    problems.add('cannot_downsample', tr.full_id)
+                    logger.warn( 'Cannot downsample %s.%s.%s.%s: %s' % (tr.nslc_id + (e,)))
                     continue
-                
-                nslcs.add(tr.nslc_id)
-                xxtraces.append(tr)
-            
-            to_delete = self._redundant_channel_weeder(redundant_channel_priorities, nslcs)
-            traces = []
-            for tr in xxtraces:
-                if tr.nslc_id in to_delete:
-                    logger.info('Skipping channel %s.%s.%s.%s due to redunancies.' % tr.nslc_id)
+
+            try:
+                trans = self.get_restitution(tr, allowed_methods)
+            except NoRestitution, e:
+                problems.add('no_response', tr.full_id)
+                logger.warn( 'Cannot restitute trace %s.%s.%s.%s: %s' % (tr.nslc_id + (e,)))
+                continue
+
+            try:
+                if extend:
+                    tr.extend(tr.tmin+extend[0], tr.tmax+extend[1], fillmethod='repeat')
+            except trace.TraceTooShort, e:
+                problems.add('gappy', tr.full_id)
+                logger.warn( '%s' % e )
+                continue
+
+            prepared.append((tr, trans))
+
+        restituted = {}
+        if batch and not restitution_off_hack:
+            by_shape = {}
+            for i, (tr, trans) in enumerate(prepared):
+                by_shape.setdefault((tr.deltat, tr.ydata.size), []).append(i)
+
+            for ii in by_shape.itervalues():
+                if len(ii) < 2:
                     continue
-                traces.append(tr)
-                               
-            traces.sort( lambda a,b: cmp(a.full_id, b.full_id) )
-            
-            traces = trace.degapper(traces)  # mainly to get rid if overlaps and duplicates
-            if traces:
-                nsl = traces[0].nslc_id[:3]
-                station = stations[nsl] # all traces belong to the same station here
-                
-                displacements = []
-                for tr in traces:
-                   
-                    if preprocess is not None:
-                        preprocess(tr)
-
-                    tr.ydata = tr.ydata - num.mean(tr.ydata)
-                    
-                    if deltat is not None:
-                        try:
-                            tr.downsample_to(deltat, snap=True, allow_upsample_max=5)
-                        except util.UnavailableDecimation, e:
-                            self.problems().add('cannot_downsample', tr.full_id)
-                            logger.warn( 'Cannot downsample %s.%s.%s.%s: %s' % (tr.nslc_id + (e,)))
-                            continue
-                        
-                    try:
-                        trans = self.get_restitution(tr, allowed_methods)
-                    except NoRestitution, e:
-                        self.problems().add('no_response', tr.full_id)
-                        logger.warn( 'Cannot restitute trace %s.%s.%s.%s: %s' % (tr.nslc_id + (e,)))
-                        continue
-                    
+
+                try:
+                    outputs = trace.transfer_traces(
+                        [prepared[i][0] for i in ii], tfade, freqband,
+                        transfer_function=[prepared[i][1] for i in ii],
+                        cut_off_fading=crop)
+
+                except Exception:
+                    # handled trace by trace below
+                    continue
+
+                restituted.update(zip(ii, outputs))
+
+        displacements = []
+        for i, (tr, trans) in enumerate(prepared):
+            try:
+                if restitution_off_hack:
+                    displacement = tr.copy()
+                elif i in restituted:
+                    displacement = restituted[i]
+                else:
                     try:
-                        if extend:
-                            tr.extend(tr.tmin+extend[0], tr.tmax+extend[1], fillmethod='repeat')
-                        if restitution_off_hack:
-                            displacement = tr.copy()
-                        else:
-                            try:
-                                displacement = tr.transfer( tfade, freqband, transfer_function=trans, cut_off_fading=crop )
-                            except Exception, e:
-                                if isinstance(e, trace.TraceTooShort):
-                                    raise
-
-                                logger.warn('An error while applying transfer function to trace %s.%s.%s.%s.' % tr.nslc_id)
-                                continue
-
-                        amax = num.max(num.abs(displacement.get_ydata()))
-                        if maxdisplacement is not None and amax > maxdisplacement:
-                            self.problems().add('unrealistic_amplitude', tr.full_id)
-                            logger.warn( 'Trace %s.%s.%s.%s has too large displacement: %g' % (tr.nslc_id + (amax,)) )
-                            continue
-                        
-                        if not num.all(num.isfinite(displacement.get_ydata())):
-                            self.problems().add('has_nan_or_inf', tr.full_id)
-                            logger.warn( 'Trace %s.%s.%s.%s has NaNs or Infs' % tr.nslc_id )
-                            continue
-                            
-                    except trace.TraceTooShort, e:
-                        self.problems().add('gappy', tr.full_id)
-                        logger.warn( '%s' % e )
+                        displacement = tr.transfer( tfade, freqband, transfer_function=trans, cut_off_fading=crop )
+                    except Exception, e:
+                        if isinstance(e, trace.TraceTooShort):
+                            raise
+
+                        logger.warn('An error while applying transfer function to trace %s.%s.%s.%s.' % tr.nslc_id)
                         continue
-                    
-                    displacements.append(displacement)
-                    if nsl not in out_stations:
-                        out_stations[nsl] = copy.deepcopy(station)
-                        out_station = out_stations[nsl]
-                
-                
-                if displacements:
-                    if projections:
-                        for project in projections:
-                            matrix, in_channels, out_channels = project(out_station)
-                            projected = trace.project(displacements, matrix, in_channels, out_channels)
-                            displacements.extend(projected)
-                            for tr in projected:
-                                for ch in out_channels:
-                                    if ch.name == tr.channel:
-                                        out_station.add_channel(ch)
-                    
-                    if rotations:
-                        for rotate in rotations:
-                            angle, in_channels, out_channels  = rotate(out_station)
-                            rotated = trace.rotate(displacements, angle, in_channels, out_channels)
-                            displacements.extend(rotated)
-                            for tr in rotated:
-                                for ch in out_channels:
-                                    if ch.name == tr.channel:
-                                        out_station.add_channel(ch)
-                        
-                yield displacements
-                
+
+                amax = num.max(num.abs(displacement.get_ydata()))
+                if maxdisplacement is not None and amax > maxdisplacement:
+                    problems.add('unrealistic_amplitude', tr.full_id)
+                    logger.warn( 'Trace %s.%s.%s.%s has too large displacement: %g' % (tr.nslc_id + (amax,)) )
+                    continue
+
+                if not num.all(num.isfinite(displacement.get_ydata())):
+                    problems.add('has_nan_or_inf', tr.full_id)
+                    logger.warn( 'Trace %s.%s.%s.%s has NaNs or Infs' % tr.nslc_id )
+                    continue
+
+            except trace.TraceTooShort, e:
+                problems.add('gappy', tr.full_id)
+                logger.warn( '%s' % e )
+                continue
+
+            displacements.append(displacement)
+
+        out_station = None
+        if displacements:
+            out_station = copy.deepcopy(station)
+            if projections:
+                for project in projections:
+                    matrix, in_channels, out_channels = project(out_station)
+                    projected = trace.project(displacements, matrix, in_channels, out_channels)
+                    displacements.extend(projected)
+                    for tr in projected:
+                        for ch in out_channels:
+                            if ch.name == tr.channel:
+                                out_station.add_channel(ch)
+
+            if rotations:
+                for rotate in rotations:
+                    angle, in_channels, out_channels  = rotate(out_station)
+                    rotated = trace.rotate(displacements, angle, in_channels, out_channels)
+                    displacements.extend(rotated)
+                    for tr in rotated:
+                        for ch in out_channels:
+                            if ch.name == tr.channel:
+                                out_station.add_channel(ch)
+
+        return displacements, out_station, problems
+
     def get_restitution(self, tr, allowed_methods):
         if 'integration' in allowed_methods:
             trace.IntegrationResponse()
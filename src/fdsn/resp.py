@@ -481,6 +481,37 @@ iload_filename, iload_dirname, iload_glob, iload = util.make_iload_family(
     iload_fh, 'RESP', ':py:class:`ChannelResponse`')
 
 
+def load_epochs_filename(filename):
+    '''Read only channel codes and time spans from a RESP file.
+
+    Much faster than :py:func:`iload_filename`, as the response stages are
+    not parsed.
+
+    :returns: list of tuples ``(codes, tmin, tmax)``, where *tmin* and *tmax*
+        are ``None`` for open epochs
+    '''
+
+    epochs = []
+    with open(filename, 'r') as f:
+        for sc, cc, _ in parse3(f):
+            nslc = (
+                get1(sc, '16'),
+                get1(sc, '03'),
+                ploc(get1(cc, '03', '')),
+                get1(cc, '04'))
+
+            try:
+                tmin = pdate(get1(cc, '22'))
+                tmax = pdate(get1(cc, '23'))
+            except util.TimeStrError, e:
+                raise RespError(
+                    'invalid date in RESP information. (%s)' % str(e))
+
+            epochs.append((nslc, tmin, tmax))
+
+    return epochs
+
+
 def make_stationxml(pyrocko_stations, channel_responses):
     '''Create stationxml from pyrocko station list and RESP information.
 
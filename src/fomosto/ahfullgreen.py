@@ -139,6 +139,8 @@ class AhfullgreenRunner:
 
 
 class AhfullGFBuilder(gf.builder.Builder):
+    splittable = True
+
     def __init__(self, store_dir, step, shared, block_size=None, tmp=None):
 
         self.store = gf.store.Store(store_dir, 'w')
@@ -187,8 +189,7 @@ class AhfullGFBuilder(gf.builder.Builder):
 
         conf = copy.deepcopy(self.ahfullgreen_config)
 
-        logger.info('Starting block %i / %i' %
-                    (index+1, self.nblocks))
+        logger.info('Starting block %s' % self.str_block(index))
 
         conf.source_depth = float(sz)
         conf.receiver_depth = float(rz)
@@ -325,8 +326,7 @@ class AhfullGFBuilder(gf.builder.Builder):
 
             conf.gf_sw_source_types = (0, 0, 0, 0, 0, 0)
 
-        logger.info('Done with block %i / %i' %
-                    (index+1, self.nblocks))
+        logger.info('Done with block %s' % self.str_block(index))
 
 
 def init(store_dir, variant):
@@ -28,6 +28,8 @@ class Interrupted(gf.store.StoreError):
 
 
 class DummyGFBuilder(gf.builder.Builder):
+    splittable = True
+
     def __init__(self, store_dir, step, shared):
         self.store = gf.store.Store(store_dir, 'w')
         gf.builder.Builder.__init__(self, self.store.config, step, block_size=(1,51))
@@ -36,8 +38,7 @@ class DummyGFBuilder(gf.builder.Builder):
         (sz, firstx), (sz, lastx), (ns, nx) = \
                 self.get_block_extents(index)
 
-        logger.info('Starting block %i / %i' % 
-                (index+1, self.nblocks))
+        logger.info('Starting block %s' % self.str_block(index))
 
         interrupted = []
         def signal_handler(signum, frame):
@@ -73,8 +74,7 @@ class DummyGFBuilder(gf.builder.Builder):
         if interrupted:
             raise KeyboardInterrupt()
 
-        logger.info('Done with block %i / %i' % 
-                (index+1, self.nblocks))
+        logger.info('Done with block %s' % self.str_block(index))
 
 
 km = 1000.
@@ -717,6 +717,8 @@ in the directory %s'''.lstrip() % (
 
 
 class QSeisGFBuilder(gf.builder.Builder):
+    splittable = True
+
     def __init__(self, store_dir, step, shared, block_size=None, tmp=None):
 
         self.store = gf.store.Store(store_dir, 'w')
@@ -772,8 +774,7 @@ class QSeisGFBuilder(gf.builder.Builder):
 
         conf = copy.deepcopy(self.qseis_config)
 
-        logger.info('Starting block %i / %i' %
-                    (index+1, self.nblocks))
+        logger.info('Starting block %s' % self.str_block(index))
 
         conf.source_depth = float(sz/km)
         conf.receiver_depth = float(rz/km)
@@ -949,8 +950,7 @@ class QSeisGFBuilder(gf.builder.Builder):
 
             conf.gf_sw_source_types = (0, 0, 0, 0, 0, 0)
 
-        logger.info('Done with block %i / %i' %
-                    (index+1, self.nblocks))
+        logger.info('Done with block %s' % self.str_block(index))
 
 
 def init(store_dir, variant):
@@ -527,6 +527,9 @@ class QSSPGFBuilder(gf.builder.Builder):
 
         self.store = gf.store.Store(store_dir, 'w')
 
+        # step 0 computes one Green's function database per source depth
+        self.splittable = step != 0
+
         if step == 0:
             block_size = (1,1,self.store.config.ndistances)
         else:
@@ -577,12 +580,12 @@ class QSSPGFBuilder(gf.builder.Builder):
         gf_path = os.path.join(conf.gf_directory, '?_' + gf_filename)
 
         if self.step == 0 and len(glob.glob(gf_path)) == 7:
-            logger.info('Skipping step %i / %i, block %i / %i (GF already exists)' %
-                (self.step+1, self.nsteps, iblock+1, self.nblocks))
+            logger.info('Skipping step %i / %i, block %s (GF already exists)' %
+                (self.step+1, self.nsteps, self.str_block(iblock)))
             return 
 
-        logger.info('Starting step %i / %i, block %i / %i' % 
-                (self.step+1, self.nsteps, iblock+1, self.nblocks))
+        logger.info('Starting step %i / %i, block %s' % 
+                (self.step+1, self.nsteps, self.str_block(iblock)))
 
         runner = QSSPRunner(tmp=self.tmp)
         
@@ -721,8 +724,8 @@ class QSSPGFBuilder(gf.builder.Builder):
                 if interrupted:
                     raise KeyboardInterrupt()
 
-        logger.info('Done with step %i / %i, block %i / %i' % 
-                (self.step+1, self.nsteps, iblock+1, self.nblocks))
+        logger.info('Done with step %i / %i, block %s' % 
+                (self.step+1, self.nsteps, self.str_block(iblock)))
 
 
 km = 1000.
@@ -2,6 +2,7 @@
 import os
 import signal
 import errno
+import multiprocessing
 from os.path import join as pjoin
 import numpy as num
 
@@ -21,6 +22,12 @@ class Interrupted(store.StoreError):
 class Builder:
     nsteps = 1
 
+    # Set to True in builders which can compute arbitrary sub-ranges along
+    # the last (distance) axis of a block. Such builders must only access
+    # their blocks through get_block_extents() and identify them in log
+    # messages through str_block().
+    splittable = False
+
     def __init__(self, gf_config, step, block_size=None):
         if block_size is None:
             if len(gf_config.ns) == 3:
@@ -46,10 +53,24 @@ class Builder:
         return num.arange(self.nblocks)
 
     def get_block(self, index):
+        '''
+        Get index ranges of a block or of a part of a block.
+
+        :param index: block index or ``(iblock, ipart, nparts)`` tuple to
+            select part ``ipart`` of block ``iblock``, when the block is split
+            into ``nparts`` parts along its last axis
+        '''
+
+        index, ipart, nparts = split_block_index(index)
         dims = self.block_dims
         iblock = num.unravel_index(index, dims)
         ibegins = iblock * self._block_size
         iends = num.minimum(ibegins + self._block_size, self.gf_config.ns)
+        if nparts != 1:
+            b, n = ibegins[-1], iends[-1] - ibegins[-1]
+            ibegins[-1] = b + (n * ipart) // nparts
+            iends[-1] = b + (n * (ipart+1)) // nparts
+
         return ibegins, iends
 
     def get_block_extents(self, index):
@@ -57,7 +78,88 @@ class Builder:
         begins = self.gf_config.mins + ibegins * self.gf_config.deltas
         ends = self.gf_config.mins + (iends-1) * self.gf_config.deltas
         return begins, ends, iends - ibegins
-    
+
+    def str_block(self, index):
+        index, ipart, nparts = split_block_index(index)
+        if nparts == 1:
+            return '%i / %i' % (index+1, self.nblocks)
+        else:
+            return '%i / %i (part %i / %i)' % (
+                index+1, self.nblocks, ipart+1, nparts)
+
+    def estimate_block_cost(self, index):
+        '''
+        Get rough relative estimate of the computational cost of a block.
+
+        The default implementation counts the GF nodes in the block and
+        weights them with their distance, as most modelling codes get more
+        expensive with growing distance. Builders may override this with a
+        model specific to their modelling code.
+        '''
+
+        begins, ends, ns = self.get_block_extents(index)
+        nnodes = float(num.prod(ns))
+        if self.gf_config.short_type not in ('A', 'B'):
+            return nnodes
+
+        # last axis is distance in type A and B stores
+        dmin = self.gf_config.mins[-1]
+        drange = self.gf_config.effective_maxs[-1] - dmin
+        if drange <= 0.0:
+            return nnodes
+
+        dmid = 0.5 * (begins[-1] + ends[-1])
+        return nnodes * (1.0 + (dmid - dmin) / drange)
+
+    def schedule(self, iblocks, nworkers, parts_done=()):
+        '''
+        Order and split blocks for processing with parallel workers.
+
+        Blocks are sorted by decreasing estimated cost (longest job first),
+        so that expensive blocks do not end up as stragglers while the other
+        workers are idle. If the builder is :py:attr:`splittable`, blocks
+        estimated to be more expensive than half of the average load per
+        worker are split into parts along their last axis.
+
+        :param iblocks: indices of the blocks to be processed
+        :param nworkers: number of parallel workers
+        :param parts_done: set of ``(iblock, ipart, nparts)`` tuples, parts
+            which have been completed in a previous run
+        :returns: list with block indices and ``(iblock, ipart, nparts)``
+            tuples, in the order in which they should be processed
+        '''
+
+        costs = dict(
+            (iblock, self.estimate_block_cost(iblock)) for iblock in iblocks)
+
+        nparts_done = dict(
+            (iblock, nparts) for (iblock, _, nparts) in parts_done)
+
+        max_cost = None
+        if self.splittable and nworkers > 1 and costs:
+            max_cost = 0.5 * sum(costs.values()) / nworkers
+
+        jobs = []
+        for iblock in iblocks:
+            if iblock in nparts_done:
+                nparts = nparts_done[iblock]
+            elif max_cost:
+                nlast = self.get_block_extents(iblock)[2][-1]
+                nparts = int(min(nlast, num.ceil(costs[iblock] / max_cost)))
+            else:
+                nparts = 1
+
+            if nparts == 1:
+                jobs.append((costs[iblock], iblock))
+            else:
+                for ipart in xrange(nparts):
+                    index = (iblock, ipart, nparts)
+                    if index not in parts_done:
+                        jobs.append((self.estimate_block_cost(index), index))
+
+        jobs.sort(key=lambda job: -job[0])
+        return [index for (_, index) in jobs]
+
     @classmethod
     def __work_block(cls, args):
         try:
@@ -105,6 +207,9 @@ class Builder:
                     except IOError:
                         raise store.StoreError('nothing to continue')
 
+        if nworkers is None:
+            nworkers = multiprocessing.cpu_count()
+
         shared = {}
         for step in steps:
             builder = cls(store_dir, step, shared)
@@ -114,6 +219,8 @@ class Builder:
             if iblock in (None, -1):
                 iblocks = [x for x in builder.all_block_indices()
                            if (step, x) not in done]
+                parts_done = set(x[1:] for x in done
+                                 if len(x) == 4 and x[0] == step)
             else:
                 if not (0 <= iblock < builder.nblocks):
                     raise store.StoreError('invalid block index %i' % (iblock+1))
@@ -135,6 +242,9 @@ class Builder:
 
                 return
 
+            if iblock is None:
+                iblocks = builder.schedule(iblocks, nworkers, parts_done)
+
             del builder
 
             original = signal.signal(signal.SIGINT, signal.SIG_IGN)
@@ -147,11 +257,27 @@ class Builder:
 
                     store_dir, step, i = x
                     with open(status_fn, 'a') as status:
-                        status.write('%i %i\n' % (step, i))
+                        status.write(' '.join(
+                            '%i' % v for v in (step,) + index_tuple(i)) + '\n')
 
             finally:
                 signal.signal(signal.SIGINT, original)
 
         os.remove(status_fn)
 
+
+def split_block_index(index):
+    if isinstance(index, tuple):
+        return index
+    else:
+        return index, 0, 1
+
+
+def index_tuple(index):
+    if isinstance(index, tuple):
+        return index
+    else:
+        return (index,)
+
+
 __all__ = ['Builder']
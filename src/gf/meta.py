@@ -24,9 +24,9 @@ vicinity_eps = 1e-5
 
 def latlondepth_to_carthesian(lat, lon, depth):
     radius = config().earthradius - depth
-    x = radius * math.cos(d2r*lat) * math.cos(d2r*lon)
-    y = radius * math.cos(d2r*lat) * math.sin(d2r*lon)
-    z = radius * math.sin(d2r*lat)
+    x = radius * num.cos(d2r*lat) * num.cos(d2r*lon)
+    y = radius * num.cos(d2r*lat) * num.sin(d2r*lon)
+    z = radius * num.sin(d2r*lat)
     return x, y, z
 
 
@@ -476,8 +476,7 @@ class Location(Object):
             except AttributeError:
                 rlat, rlon = other.lat, other.lon
 
-            return float(orthodrome.distance_accurate50m_numpy(
-                slat, slon, rlat, rlon)[0])
+            return orthodrome.azibazidist(slat, slon, rlat, rlon)[2]
 
     def distance_3d_to(self, other):
         '''
@@ -522,8 +521,7 @@ class Location(Object):
                 rlat, rlon = other.effective_latlon
             except AttributeError:
                 rlat, rlon = other.lat, other.lon
-            azi = orthodrome.azimuth_numpy(slat, slon, rlat, rlon)
-            bazi = orthodrome.azimuth_numpy(rlat, rlon, slat, slon)
+            azi, bazi, _ = orthodrome.azibazidist(slat, slon, rlat, rlon)
 
         return float(azi), float(bazi)
 
@@ -694,8 +692,7 @@ class DiscretizedSource(Object):
         else:
             slats, slons = self.effective_latlons
             rlat, rlon = receiver.effective_latlon
-            azis = orthodrome.azimuth_numpy(slats, slons, rlat, rlon)
-            bazis = orthodrome.azimuth_numpy(rlat, rlon, slats, slons)
+            azis, bazis = orthodrome.azibazi_many(slats, slons, rlat, rlon)
 
         return azis, bazis
 
@@ -711,8 +708,7 @@ class DiscretizedSource(Object):
         else:
             slats, slons = self.effective_latlons
             rlat, rlon = receiver.effective_latlon
-            return orthodrome.distance_accurate50m_numpy(slats, slons,
-                                                         rlat, rlon)
+            return orthodrome.distance_many(slats, slons, rlat, rlon)
 
     def element_coords(self, i):
         if self.lats is not None and self.lons is not None:
@@ -1979,7 +1975,8 @@ class ConfigTypeC(Config):
             (num.arange(self.ncomponents),)
         self.nreceiver_depths, self.nsource_depths, self.ndistances = self.ns
 
-        self._distances_cache = {}
+        self._receiver_tree = None
+        self._ireceiver_cache = {}
 
     def _make_index_functions(self):
 
@@ -2107,24 +2104,95 @@ class ConfigTypeC(Config):
         self._vicinity_function = vicinity_function
         self._vicinities_function = vicinities_function
 
-    def lookup_ireceiver(self, receiver):
-        k = (receiver.lat, receiver.lon,
-             receiver.north_shift, receiver.east_shift)
+    def _receiver_points(self, receivers):
+        # Earth-centered carthesian coordinates at the surface plus depth,
+        # scaled, so that distances are in units of the source grid spacing
+        dh = min(self.source_north_shift_delta, self.source_east_shift_delta)
+        dv = self.source_depth_delta
+
+        lats, lons, norths, easts, depths = num.array(
+            [(r.lat, r.lon, r.north_shift, r.east_shift, r.depth)
+             for r in receivers], dtype=num.float).T
+
+        # same as Location.effective_latlon, but for all receivers at once
+        shifted = num.logical_or(norths != 0.0, easts != 0.0)
+        if num.any(shifted):
+            lats[shifted], lons[shifted] = orthodrome.ne_to_latlon(
+                lats[shifted], lons[shifted], norths[shifted], easts[shifted])
+
+        x, y, z = latlondepth_to_carthesian(lats, lons, 0.0)
+
+        return num.vstack((x/dh, y/dh, z/dh, depths/dv)).T
+
+    def _receiver_distance(self, receiver, irec):
         dh = min(self.source_north_shift_delta, self.source_east_shift_delta)
         dv = self.source_depth_delta
+        rec = self.receivers[irec]
+        return math.sqrt(
+            (receiver.distance_to(rec)/dh)**2 +
+            ((rec.depth - receiver.depth)/dv)**2)
+
+    def _get_receiver_tree(self):
+        if self._receiver_tree is None or \
+                self._receiver_tree.n != len(self.receivers):
+
+            from scipy.spatial import cKDTree
+            self._receiver_tree = cKDTree(
+                self._receiver_points(self.receivers))
+            self._ireceiver_cache.clear()
+
+        return self._receiver_tree
+
+    def lookup_ireceivers(self, receivers):
+        '''
+        Get indices of the stored receivers matching the given receivers.
+
+        Candidates are found with a spatial index built once for the store's
+        receivers, so that lookups do not depend on the number of receivers.
+        Raises :py:exc:`OutOfBounds` if any of the receivers is not
+        available.
+        '''
+
+        ireceivers = num.empty(len(receivers), dtype=num.int)
+        if not receivers:
+            return ireceivers
+
+        tree = self._get_receiver_tree()
+
+        # the tree works on chord distances on a sphere, so candidates are
+        # searched in a wider radius and checked with the exact distances
+        candidates = tree.query_ball_point(
+            self._receiver_points(receivers), 0.2)
+
+        for i, (receiver, icandidates) in enumerate(
+                zip(receivers, candidates)):
+
+            for irec in sorted(icandidates):
+                if self._receiver_distance(receiver, irec) < 0.1:
+                    ireceivers[i] = irec
+                    break
+            else:
+                raise OutOfBounds(
+                    reason='No GFs available for receiver at (%g, %g).' %
+                    receiver.effective_latlon)
+
+        return ireceivers
+
+    def lookup_ireceiver(self, receiver):
+        # (re)builds the index and drops cached lookups if receivers changed
+        self._get_receiver_tree()
+
+        k = (receiver.lat, receiver.lon,
+             receiver.north_shift, receiver.east_shift, receiver.depth)
 
-        for irec, rec in enumerate(self.receivers):
-            if (k, irec) not in self._distances_cache:
-                self._distances_cache[k, irec] = math.sqrt(
-                    (receiver.distance_to(rec)/dh)**2 +
-                    ((rec.depth - receiver.depth)/dv)**2)
+        if k not in self._ireceiver_cache:
+            irec = int(self.lookup_ireceivers([receiver])[0])
+            if len(self._ireceiver_cache) >= 10000:
+                self._ireceiver_cache.clear()
 
-            if self._distances_cache[k, irec] < 0.1:
-                return irec
+            self._ireceiver_cache[k] = irec
 
-        raise OutOfBounds(
-            reason='No GFs available for receiver at (%g, %g).' %
-            receiver.effective_latlon)
+        return self._ireceiver_cache[k]
 
     def make_indexing_args(self, source, receiver, icomponents):
         nc = icomponents.size
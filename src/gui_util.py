@@ -3,6 +3,7 @@ import numpy as num
 import logging
 
 import pyrocko.util, pyrocko.plot, pyrocko.model, pyrocko.trace, pyrocko.plot
+import pyrocko.pile
 from pyrocko.util import TableWriter, TableReader
 
 from PyQt4.QtCore import *
@@ -1114,6 +1115,282 @@ class PhaseMarker(Marker):
         return marker
 
 
+class MarkerEntry(object):
+    '''Index entry of a marker in a :py:class:`MarkerStore`.
+
+    Holds the time span and the channel codes of the marker at the time it
+    was indexed.
+    '''
+
+    __slots__ = ('marker', 'tmin', 'tmax', 'tlen', 'nslc_ids', 'tlen_class')
+
+    def __init__(self, marker):
+        self.marker = marker
+        self.tmin = marker.tmin
+        self.tmax = marker.tmax
+        self.tlen = marker.tmax - marker.tmin
+        self.nslc_ids = set(tuple(nslc_id) for nslc_id in marker.nslc_ids)
+        self.tlen_class = tlen_class(self.tlen)
+
+    def is_plain(self):
+        '''Check if the marker has NSLC codes, none of them a pattern.'''
+
+        return bool(self.nslc_ids) and not any(
+            is_nslc_pattern(nslc_id) for nslc_id in self.nslc_ids)
+
+
+def tlen_class(tlen):
+    '''Get exponent of the power of two above *tlen*, ``None`` for zero
+    length.'''
+
+    if tlen <= 0.0:
+        return None
+
+    k = int(math.ceil(math.log(tlen, 2.0)))
+    while 2.0**k < tlen:
+        k += 1
+
+    return k
+
+
+def is_nslc_pattern(nslc_id):
+    return any(c in x for x in nslc_id for c in '*?[')
+
+
+class MarkerTimeIndex(object):
+    '''
+    Index of :py:class:`MarkerEntry` objects by time span.
+
+    Entries are kept in separate sorted containers for each class of
+    similar length (by powers of two). A query for a time window only has to
+    look back by the maximum length in each class, so that a few long
+    markers do not make queries for the many short ones expensive.
+    '''
+
+    def __init__(self, entries=()):
+        by_class = {}
+        for entry in entries:
+            by_class.setdefault(entry.tlen_class, []).append(entry)
+
+        self._by_class = dict(
+            (k, pyrocko.pile.Sorted(v, 'tmin'))
+            for (k, v) in by_class.iteritems())
+
+        self._n = sum(len(v) for v in by_class.itervalues())
+
+    def __len__(self):
+        return self._n
+
+    def insert(self, entry):
+        if entry.tlen_class not in self._by_class:
+            self._by_class[entry.tlen_class] = pyrocko.pile.Sorted(
+                [], 'tmin')
+
+        self._by_class[entry.tlen_class].insert(entry)
+        self._n += 1
+
+    def remove(self, entry):
+        by_tmin = self._by_class[entry.tlen_class]
+        by_tmin.remove(entry)
+        if len(by_tmin) == 0:
+            del self._by_class[entry.tlen_class]
+
+        self._n -= 1
+
+    def in_range(self, tmin, tmax):
+        '''Get entries overlapping with a time window, unsorted.'''
+
+        entries = []
+        for k, by_tmin in self._by_class.iteritems():
+            tlenmax = 0.0 if k is None else 2.0**k
+            entries.extend(
+                entry for entry in by_tmin.with_key_in(tmin - tlenmax, tmax)
+                if entry.tmax >= tmin)
+
+        return entries
+
+
+class MarkerStore(object):
+    '''
+    Container for markers with an index on their time spans and channels.
+
+    The markers are kept in insertion order and can be accessed by position
+    like in a list. Additionally, they are indexed by time (see
+    :py:class:`MarkerTimeIndex`) and by their NSLC codes, so that the markers
+    overlapping a given time window, optionally restricted to those relevant
+    for a given trace, can be found without looking at all markers.
+    Inserting and removing single markers are O(log n) operations (apart
+    from the list maintenance).
+
+    A marker can only be contained once, adding it again has no effect. If
+    the time span or the NSLC codes of a marker in the store are changed,
+    :py:meth:`update` must be called to keep the index in sync.
+
+    :param markers: initial markers, the index is built in one pass
+    '''
+
+    def __init__(self, markers=()):
+        self._build(list(markers))
+
+    def _build(self, markers):
+        self._markers = []
+        self._entries = {}
+        for marker in markers:
+            if id(marker) not in self._entries:
+                self._entries[id(marker)] = MarkerEntry(marker)
+                self._markers.append(marker)
+
+        entries = [self._entries[id(marker)] for marker in self._markers]
+        self._by_tmin = pyrocko.pile.Sorted(entries, 'tmin')
+        self._by_time = MarkerTimeIndex(entries)
+
+        # markers with plain NSLC codes are indexed by code, those with
+        # patterns or without codes are relevant for any trace
+        by_nslc = {}
+        other = []
+        for entry in entries:
+            if entry.is_plain():
+                for nslc_id in entry.nslc_ids:
+                    by_nslc.setdefault(nslc_id, []).append(entry)
+            else:
+                other.append(entry)
+
+        self._by_nslc = dict(
+            (k, MarkerTimeIndex(v)) for (k, v) in by_nslc.iteritems())
+        self._nslc_other = MarkerTimeIndex(other)
+
+        self._positions = None
+
+    def __len__(self):
+        return len(self._markers)
+
+    def __iter__(self):
+        return iter(self._markers)
+
+    def __getitem__(self, i):
+        return self._markers[i]
+
+    def __contains__(self, marker):
+        return id(marker) in self._entries
+
+    def index(self, marker):
+        '''Get position of *marker* in insertion order.'''
+
+        if id(marker) not in self._entries:
+            raise ValueError('marker not in store')
+
+        if self._positions is None:
+            self._positions = dict(
+                (id(m), i) for (i, m) in enumerate(self._markers))
+
+        return self._positions[id(marker)]
+
+    def append(self, marker):
+        if id(marker) in self._entries:
+            return
+
+        self._insert(marker)
+        if self._positions is not None:
+            self._positions[id(marker)] = len(self._markers)
+
+        self._markers.append(marker)
+
+    def extend(self, markers):
+        markers = list(markers)
+        if not self._markers:
+            self._build(markers)
+            return
+
+        for marker in markers:
+            self.append(marker)
+
+    def remove(self, marker):
+        self.remove_range(self.index(marker), self.index(marker)+1)
+
+    def remove_range(self, istart, istop):
+        '''Remove markers at positions *istart* to *istop*-1.'''
+
+        for marker in self._markers[istart:istop]:
+            self._unindex(self._entries.pop(id(marker)))
+
+        del self._markers[istart:istop]
+        self._positions = None
+
+    def update(self, marker):
+        '''Re-index *marker* after its time span or NSLC codes have been
+        changed.'''
+
+        self._unindex(self._entries.pop(id(marker)))
+        self._insert(marker)
+
+    def _insert(self, marker):
+        entry = MarkerEntry(marker)
+        self._entries[id(marker)] = entry
+        self._by_tmin.insert(entry)
+        self._by_time.insert(entry)
+        if entry.is_plain():
+            for nslc_id in entry.nslc_ids:
+                if nslc_id not in self._by_nslc:
+                    self._by_nslc[nslc_id] = MarkerTimeIndex()
+
+                self._by_nslc[nslc_id].insert(entry)
+        else:
+            self._nslc_other.insert(entry)
+
+    def _unindex(self, entry):
+        self._by_tmin.remove(entry)
+        self._by_time.remove(entry)
+        if entry.is_plain():
+            for nslc_id in entry.nslc_ids:
+                by_time = self._by_nslc[nslc_id]
+                by_time.remove(entry)
+                if len(by_time) == 0:
+                    del self._by_nslc[nslc_id]
+        else:
+            self._nslc_other.remove(entry)
+
+    def in_range(self, tmin, tmax, nslc_id=None):
+        '''
+        Get markers overlapping with a time window.
+
+        :param nslc_id: if given, only get markers which refer to this NSLC
+            code (exactly or by pattern) or which have no NSLC codes at all
+        :returns: list of markers with ``marker.tmax >= tmin`` and
+            ``marker.tmin <= tmax``, sorted by start time
+        '''
+
+        if nslc_id is None:
+            entries = self._by_time.in_range(tmin, tmax)
+        else:
+            entries = [
+                entry for entry in self._nslc_other.in_range(tmin, tmax)
+                if not entry.nslc_ids or entry.marker.match_nslc(nslc_id)]
+
+            nslc_id = tuple(nslc_id)
+            if nslc_id in self._by_nslc:
+                entries.extend(self._by_nslc[nslc_id].in_range(tmin, tmax))
+
+        entries.sort(key=lambda entry: entry.tmin)
+        return [entry.marker for entry in entries]
+
+    def iter_after(self, t):
+        '''Iterate over markers starting after *t*, in order of start time.'''
+
+        i = self._by_tmin.span(t, t)[1]
+        while i < len(self._by_tmin):
+            yield self._by_tmin[i].marker
+            i += 1
+
+    def iter_before(self, t):
+        '''Iterate over markers starting before *t*, in reverse order of
+        start time.'''
+
+        i = self._by_tmin.span(t, t)[0] - 1
+        while i >= 0:
+            yield self._by_tmin[i].marker
+            i -= 1
+
+
 def load_markers(filename):
     '''
     Load markers from file. 
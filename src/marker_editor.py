@@ -144,7 +144,7 @@ class MarkerTableModel(QAbstractTableModel):
     def rowCount(self, parent):
         if not self.pile_viewer:
             return 0
-        return len(self.pile_viewer.get_markers())
+        return len(self.pile_viewer.markers)
 
     def columnCount(self, parent):
         return len(_column_mapping)
@@ -0,0 +1,541 @@
+'''Grid-search location of seismic sources by migration (backprojection).
+
+Characteristic functions of the recordings of a station network (e.g.
+envelopes or STA/LTA traces) are shifted according to the traveltimes from
+each node of a 3-D source grid to the receivers and stacked with
+:py:func:`pyrocko.parstack.parstack`. The node and time of maximum coherence
+indicate the location and origin time of a source.
+
+Traveltimes are computed once per receiver and grid, either from the stored
+phases of a GF store or with :py:mod:`pyrocko.cake`, and are cached on disk.
+Data is processed in windows from :py:meth:`pyrocko.pile.Pile.chopper` and
+the grid nodes are stacked in chunks, so that the memory needed is bounded.
+'''
+
+import os
+import hashlib
+import logging
+import numpy as num
+
+from pyrocko import orthodrome as od, util, config
+from pyrocko.guts import Object, Float
+from pyrocko.parstack import parstack
+
+guts_prefix = 'pf'
+
+logger = logging.getLogger('pyrocko.migration')
+
+km = 1000.
+
+
+class MigrationError(Exception):
+    pass
+
+
+def _coords(vmin, vmax, delta):
+    n = int(round((vmax - vmin) / delta)) + 1
+    return vmin + num.arange(n, dtype=num.float) * delta
+
+
+class MigrationGrid(Object):
+    '''Regular 3-D grid of source points around a reference location.
+
+    Nodes are numbered in C order with indices ``(inorth, ieast, idepth)``.
+    '''
+
+    lat = Float.T(default=0.0)
+    lon = Float.T(default=0.0)
+    north_min = Float.T(default=-10*km)
+    north_max = Float.T(default=10*km)
+    north_delta = Float.T(default=1*km)
+    east_min = Float.T(default=-10*km)
+    east_max = Float.T(default=10*km)
+    east_delta = Float.T(default=1*km)
+    depth_min = Float.T(default=0.0)
+    depth_max = Float.T(default=10*km)
+    depth_delta = Float.T(default=1*km)
+
+    def _norths(self):
+        return _coords(self.north_min, self.north_max, self.north_delta)
+
+    def _easts(self):
+        return _coords(self.east_min, self.east_max, self.east_delta)
+
+    def _depths(self):
+        return _coords(self.depth_min, self.depth_max, self.depth_delta)
+
+    @property
+    def shape(self):
+        return (self._norths().size, self._easts().size, self._depths().size)
+
+    @property
+    def nnodes(self):
+        return int(num.prod(self.shape))
+
+    def coords(self):
+        '''Get north shifts, east shifts and depths of all nodes.
+
+        :returns: tuple of three arrays of length :py:attr:`nnodes`
+        '''
+
+        n, e, d = num.meshgrid(
+            self._norths(), self._easts(), self._depths(), indexing='ij')
+
+        return n.ravel(), e.ravel(), d.ravel()
+
+    def latlons(self):
+        '''Get latitudes and longitudes of all nodes.
+
+        :returns: tuple of two arrays of length :py:attr:`nnodes`
+        '''
+
+        norths, easts = num.meshgrid(
+            self._norths(), self._easts(), indexing='ij')
+
+        lats, lons = od.ne_to_latlon(
+            self.lat, self.lon, norths.ravel(), easts.ravel())
+
+        ndepths = self._depths().size
+        return num.repeat(lats, ndepths), num.repeat(lons, ndepths)
+
+    def distances_to(self, receiver):
+        '''Get surface distances [m] from all nodes to a receiver.'''
+
+        lats, lons = self.latlons()
+        return od.distance_accurate50m_numpy(
+            lats, lons, receiver.lat, receiver.lon)
+
+    def node(self, inode):
+        '''Get location of a node.
+
+        :returns: tuple ``(lat, lon, north_shift, east_shift, depth)``
+        '''
+
+        inorth, ieast, idepth = num.unravel_index(inode, self.shape)
+        lats, lons = self.latlons()
+        return (
+            float(lats[inode]), float(lons[inode]),
+            float(self._norths()[inorth]), float(self._easts()[ieast]),
+            float(self._depths()[idepth]))
+
+
+class TraveltimeProvider(object):
+    '''Base class for traveltime computation on a source grid.'''
+
+    def ident(self):
+        '''Get string identifying the setup, used as part of cache keys.'''
+        raise NotImplementedError()
+
+    def traveltimes(self, grid, receiver):
+        '''Get traveltimes from all nodes of the grid to a receiver.
+
+        :param grid: :py:class:`MigrationGrid` object
+        :param receiver: object with attributes ``lat``, ``lon`` and
+            ``depth``, e.g. :py:class:`pyrocko.model.Station`
+        :returns: array of length ``grid.nnodes``, undefined traveltimes are
+            set to NaN
+        '''
+        raise NotImplementedError()
+
+
+class StoreTraveltimes(TraveltimeProvider):
+    '''Traveltimes from the phases defined in a GF store.
+
+    :param store: :py:class:`pyrocko.gf.store.Store` object
+    :param timing: timing definition, e.g. ``'stored:P'`` or
+        ``'first{stored:P|stored:p}'``, see
+        :py:class:`pyrocko.gf.meta.Timing`
+
+    Stored phases of stores of type A and B are interpolated for all nodes at
+    once. Other phase providers are evaluated node by node.
+    '''
+
+    def __init__(self, store, timing):
+        from pyrocko.gf import meta
+        if not isinstance(timing, meta.Timing):
+            timing = meta.Timing(timing)
+
+        self.store = store
+        self.timing = timing
+
+    def ident(self):
+        return 'store %s %s %s' % (
+            self.store.config.id,
+            hashlib.sha1(self.store.config.dump()).hexdigest(),
+            self.timing)
+
+    def _args(self, grid, receiver):
+        config = self.store.config
+        dists = grid.distances_to(receiver)
+        depths = grid.coords()[2]
+        if config.short_type == 'A':
+            return num.vstack((depths, dists)).T
+        elif config.short_type == 'B':
+            receiver_depths = num.empty(dists.size)
+            receiver_depths.fill(receiver.depth)
+            return num.vstack((receiver_depths, depths, dists)).T
+        else:
+            raise MigrationError(
+                'traveltimes can only be computed for GF stores of type A '
+                'or B')
+
+    def _phase_times(self, phase_def, args):
+        provider, phase_id = phase_def.split(':', 1)
+        if provider == 'stored':
+            spt = self.store.get_stored_phase(phase_id)
+            times = spt.interpolate_many(args)
+            outside = num.any(num.logical_or(
+                args < spt.xbounds[:, 0], spt.xbounds[:, 1] < args), axis=1)
+
+            times[outside] = num.nan
+            return times
+        else:
+            phase = self.store.get_phase(phase_def)
+            times = num.empty(args.shape[0], dtype=num.float)
+            for i, x in enumerate(args):
+                t = phase(tuple(x))
+                times[i] = t if t is not None else num.nan
+
+            return times
+
+    def traveltimes(self, grid, receiver):
+        args = self._args(grid, receiver)
+        timing = self.timing
+        if not timing.phase_defs:
+            times = num.empty(args.shape[0], dtype=num.float)
+            times.fill(timing.offset)
+            return times
+
+        all_times = [
+            self._phase_times(phase_def, args)
+            for phase_def in timing.phase_defs]
+
+        times = all_times[0]
+        for times2 in all_times[1:]:
+            if timing.select == 'first':
+                times = num.fmin(times, times2)
+            elif timing.select == 'last':
+                times = num.fmax(times, times2)
+            else:
+                undefined = num.isnan(times)
+                times[undefined] = times2[undefined]
+
+        return times + timing.offset
+
+
+class CakeTraveltimes(TraveltimeProvider):
+    '''Traveltimes of first arrivals computed with cake.
+
+    :param earthmodel: :py:class:`pyrocko.cake.LayeredModel` object
+    :param phases: list of :py:class:`pyrocko.cake.PhaseDef` objects or
+        phase definition strings
+    :param distance_delta: spacing [m] of the distances at which rays are
+        traced, traveltimes in between are linearly interpolated
+
+    Rays are traced once for each distinct node depth.
+    '''
+
+    def __init__(self, earthmodel, phases, distance_delta=1*km):
+        from pyrocko import cake
+        self.earthmodel = earthmodel
+        self.phases = [
+            cake.PhaseDef(phase) if isinstance(phase, basestring) else phase
+            for phase in phases]
+        self.distance_delta = distance_delta
+
+    def ident(self):
+        return 'cake %s %s %g' % (
+            hashlib.sha1(
+                repr(self.earthmodel.to_scanlines())).hexdigest(),
+            ','.join(phase.definition() for phase in self.phases),
+            self.distance_delta)
+
+    def traveltimes(self, grid, receiver):
+        from pyrocko import cake
+        dists = grid.distances_to(receiver)
+        depths = grid.coords()[2]
+        dtable = num.arange(
+            0., num.max(dists) + 2*self.distance_delta, self.distance_delta)
+
+        times = num.empty(dists.size, dtype=num.float)
+        for depth in num.unique(depths):
+            ttable = num.empty(dtable.size, dtype=num.float)
+            ttable.fill(num.nan)
+            rays = self.earthmodel.arrivals(
+                phases=self.phases,
+                distances=dtable * cake.m2d,
+                zstart=depth,
+                zstop=receiver.depth)
+
+            for ray in rays:
+                i = int(round(ray.x * cake.d2m / self.distance_delta))
+                ttable[i] = num.fmin(ttable[i], ray.t)
+
+            mask = depths == depth
+            times[mask] = num.interp(dists[mask], dtable, ttable)
+
+        return times
+
+
+def traveltime_cache_dir():
+    return os.path.join(config.config().cache_dir, 'traveltimes')
+
+
+def traveltime_key(provider, grid, receiver):
+    '''
+    Get content-addressed key for cached traveltimes.
+    '''
+
+    h = hashlib.sha1()
+    h.update(provider.ident())
+    h.update(grid.dump())
+    h.update('%.8f %.8f %.3f' % (receiver.lat, receiver.lon, receiver.depth))
+    return h.hexdigest()
+
+
+def get_traveltimes(provider, grid, receivers, cache_dir=None):
+    '''Get traveltimes from all grid nodes to several receivers.
+
+    Traveltimes are computed per receiver and cached in *cache_dir*, by
+    default in the subdirectory ``traveltimes`` of the configured cache
+    directory. Set *cache_dir* to ``False`` to disable caching.
+
+    :returns: array of shape ``(len(receivers), grid.nnodes)``
+    '''
+
+    if cache_dir is None:
+        cache_dir = traveltime_cache_dir()
+
+    times = num.empty((len(receivers), grid.nnodes), dtype=num.float)
+    for ireceiver, receiver in enumerate(receivers):
+        fn = None
+        if cache_dir:
+            fn = os.path.join(
+                cache_dir, traveltime_key(provider, grid, receiver) + '.npy')
+
+            if os.path.exists(fn):
+                times[ireceiver, :] = num.load(fn)
+                continue
+
+        logger.debug('computing traveltimes for receiver %i/%i' % (
+            ireceiver+1, len(receivers)))
+
+        times[ireceiver, :] = provider.traveltimes(grid, receiver)
+
+        if fn:
+            util.ensuredirs(fn)
+            fn_temp = fn + '.%i.temp' % os.getpid()
+            with open(fn_temp, 'wb') as f:
+                num.save(f, times[ireceiver, :])
+
+            os.rename(fn_temp, fn)
+
+    return times
+
+
+class MigrationResult(object):
+    '''Maximum of coherence found in a processing window.
+
+    :ivar wmin,wmax: time span of the window (origin times)
+    :ivar time: origin time at the maximum
+    :ivar value: maximum of the stack
+    :ivar inode: index of the grid node at the maximum
+    :ivar nchannels: number of channels used
+    :ivar image: maximum of the stack for each grid node, array of shape
+        ``grid.shape``
+    '''
+
+    def __init__(self, grid, wmin, wmax, time, value, inode, nchannels,
+                 image):
+
+        self.grid = grid
+        self.wmin = wmin
+        self.wmax = wmax
+        self.time = time
+        self.value = value
+        self.inode = inode
+        self.nchannels = nchannels
+        self.image = image
+
+    @property
+    def location(self):
+        '''Location of the maximum as ``(lat, lon, north, east, depth)``.'''
+        return self.grid.node(self.inode)
+
+    def __str__(self):
+        lat, lon, _, _, depth = self.location
+        return '%s %.5f %.5f %.1f %g %i' % (
+            util.time_to_str(self.time), lat, lon, depth, self.value,
+            self.nchannels)
+
+
+def migrate(pile, grid, receivers, provider, tmin=None, tmax=None, tinc=None,
+            tpad=0., weights=None, chunk_size=1000, nparallel=None,
+            cache_dir=None, trace_selector=None):
+
+    '''Locate sources by stacking characteristic functions on a source grid.
+
+    The traces in the pile are used as given, so they should contain
+    positive characteristic functions (e.g. envelopes or STA/LTA traces) all
+    sampled at the same rate. Traces are assigned to receivers by
+    network, station and location code; several channels per receiver are
+    stacked with equal weights.
+
+    :param pile: :py:class:`pyrocko.pile.Pile` with the characteristic
+        functions
+    :param grid: :py:class:`MigrationGrid` object
+    :param receivers: list of :py:class:`pyrocko.model.Station` objects
+    :param provider: :py:class:`TraveltimeProvider` object, e.g.
+        :py:class:`StoreTraveltimes` or :py:class:`CakeTraveltimes`
+    :param tmin,tmax: span of origin times to scan, by default the time span
+        of the pile
+    :param tinc: length of the processing windows, by default ten times the
+        maximum traveltime
+    :param tpad: additional padding of the processing windows
+    :param weights: optional weights of the receivers, array of shape
+        ``(len(receivers),)``
+    :param chunk_size: number of grid nodes stacked at once; determines,
+        together with *tinc*, the memory needed
+    :param nparallel: number of threads used for stacking
+    :param cache_dir: traveltime cache directory, see
+        :py:func:`get_traveltimes`
+    :param trace_selector: additional trace selector passed to the chopper
+    :returns: generator yielding a :py:class:`MigrationResult` object for
+        each window in which data is available
+    '''
+
+    times = get_traveltimes(provider, grid, receivers, cache_dir=cache_dir)
+    defined = num.isfinite(times)
+    if not num.any(defined):
+        raise MigrationError('no traveltimes defined on grid')
+
+    ttmin = num.min(times[defined])
+    ttmax = num.max(times[defined])
+
+    if tinc is None:
+        tinc = 10. * max(ttmax, 1.)
+
+    if weights is None:
+        weights = num.ones(len(receivers), dtype=num.float)
+
+    ireceivers = dict(
+        (receiver.nsl(), i) for (i, receiver) in enumerate(receivers))
+
+    def selector(tr):
+        return tr.nslc_id[:3] in ireceivers and (
+            trace_selector is None or trace_selector(tr))
+
+    # window times refer to origin times, recordings are ttmin to ttmax later
+    if tmin is None:
+        tmin = pile.tmin - ttmax
+    if tmax is None:
+        tmax = pile.tmax - ttmin
+
+    for traces in pile.chopper(
+            tmin=tmin + 0.5*(ttmin+ttmax),
+            tmax=tmax + 0.5*(ttmin+ttmax),
+            tinc=tinc,
+            tpad=0.5*(ttmax-ttmin) + tpad,
+            want_incomplete=True,
+            trace_selector=selector):
+
+        if not traces:
+            continue
+
+        wmin = traces[0].wmin - 0.5*(ttmin+ttmax)
+        wmax = traces[0].wmax - 0.5*(ttmin+ttmax)
+
+        result = migrate_window(
+            traces, grid, ireceivers, times, weights, wmin, wmax,
+            chunk_size=chunk_size, nparallel=nparallel)
+
+        if result is not None:
+            yield result
+
+
+def migrate_window(traces, grid, ireceivers, times, weights, wmin, wmax,
+                   chunk_size=1000, nparallel=None):
+
+    '''Stack characteristic functions for origin times in a single window.
+
+    Used by :py:func:`migrate`.
+
+    :param traces: list of :py:class:`pyrocko.trace.Trace` objects
+    :param ireceivers: dict with receiver indices, keyed by
+        ``(network, station, location)``
+    :param times: traveltimes, as returned by :py:func:`get_traveltimes`
+    :param weights: weights of the receivers
+    :returns: :py:class:`MigrationResult` object or ``None`` if no
+        traces could be used
+    '''
+
+    deltat = traces[0].deltat
+
+    arrays = []
+    offsets = []
+    channel_receivers = []
+    receiver_channels = {}
+    for tr in traces:
+        if abs(tr.deltat - deltat) > deltat * 1e-6:
+            logger.warn(
+                'skipping trace %s.%s.%s.%s with deviating sampling rate' %
+                tr.nslc_id)
+            continue
+
+        arrays.append(tr.get_ydata().astype(num.float))
+        offsets.append(int(round((tr.tmin - wmin) / deltat)))
+        ireceiver = ireceivers[tr.nslc_id[:3]]
+        channel_receivers.append(ireceiver)
+        receiver_channels.setdefault(ireceiver, set()).add(tr.nslc_id)
+
+    if not arrays:
+        return None
+
+    nchannels = sum(len(x) for x in receiver_channels.values())
+
+    offsets = num.array(offsets, dtype=num.int32)
+    channel_receivers = num.array(channel_receivers, dtype=num.int)
+    nsamples = int(round((wmax - wmin) / deltat))
+
+    # distribute receiver weights among channels of the same receiver,
+    # traces with gaps may come in several pieces
+    nchannels_receiver = num.array([
+        len(receiver_channels[ireceiver])
+        for ireceiver in channel_receivers], dtype=num.float)
+
+    channel_weights = weights[channel_receivers] / nchannels_receiver
+
+    ctimes = num.ascontiguousarray(times[channel_receivers, :].T)
+    defined = num.isfinite(ctimes)
+    shifts = num.zeros(ctimes.shape, dtype=num.int32)
+    shifts[defined] = -num.round(ctimes[defined] / deltat).astype(num.int32)
+    cweights = num.where(defined, channel_weights[num.newaxis, :], 0.0)
+    norm = num.sum(cweights, axis=1)
+    norm[norm == 0.0] = 1.0
+    cweights /= norm[:, num.newaxis]
+
+    image = num.empty(grid.nnodes, dtype=num.float)
+    for inode in xrange(0, grid.nnodes, chunk_size):
+        sl = slice(inode, inode+chunk_size)
+        image[sl], _ = parstack(
+            arrays, offsets, shifts[sl], cweights[sl], 1,
+            lengthout=nsamples,
+            offsetout=0,
+            nparallel=nparallel)
+
+    inode = int(num.argmax(image))
+    stack, _ = parstack(
+        arrays, offsets, shifts[inode:inode+1], cweights[inode:inode+1], 0,
+        lengthout=nsamples,
+        offsetout=0,
+        nparallel=nparallel)
+
+    isample = int(num.argmax(stack[0]))
+
+    return MigrationResult(
+        grid, wmin, wmax,
+        time=wmin + isample*deltat,
+        value=float(stack[0, isample]),
+        inode=inode,
+        nchannels=nchannels,
+        image=image.reshape(grid.shape))
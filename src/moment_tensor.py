@@ -743,4 +743,429 @@ def other_plane( strike, dip, rake ):
         return both_sdr[0]
 
 
+def _m6s_to_ms(m6s):
+    m6s = num.asarray(m6s, dtype=num.float)
+    ms = num.empty((m6s.shape[0], 3, 3), dtype=num.float)
+    for k, (i, j) in enumerate(((0, 0), (1, 1), (2, 2), (0, 1), (0, 2),
+                                (1, 2))):
+        ms[:, i, j] = m6s[:, k]
+        ms[:, j, i] = m6s[:, k]
+
+    return ms
+
+
+def _ms_to_m6s(ms):
+    return num.vstack((ms[:, 0, 0], ms[:, 1, 1], ms[:, 2, 2],
+                       ms[:, 0, 1], ms[:, 0, 2], ms[:, 1, 2])).T.copy()
+
+
+def _euler_to_matrices(alpha, beta, gamma):
+    # vectorized version of euler_to_matrix
+    ca = num.cos(alpha)
+    cb = num.cos(beta)
+    cg = num.cos(gamma)
+    sa = num.sin(alpha)
+    sb = num.sin(beta)
+    sg = num.sin(gamma)
+
+    mats = num.empty((ca.size, 3, 3), dtype=num.float)
+    mats[:, 0, 0] = cb*cg-ca*sb*sg
+    mats[:, 0, 1] = sb*cg+ca*cb*sg
+    mats[:, 0, 2] = sa*sg
+    mats[:, 1, 0] = -cb*sg-ca*sb*cg
+    mats[:, 1, 1] = -sb*sg+ca*cb*cg
+    mats[:, 1, 2] = sa*cg
+    mats[:, 2, 0] = sa*sb
+    mats[:, 2, 1] = -sa*cb
+    mats[:, 2, 2] = ca
+    return mats
+
+
+def _random_rotations(x):
+    # vectorized version of random_rotation
+    x1, x2, x3 = x.T
+    n = x1.size
 
+    phi = math.pi*2.0*x1
+    zrot = num.zeros((n, 3, 3), dtype=num.float)
+    zrot[:, 0, 0] = num.cos(phi)
+    zrot[:, 0, 1] = num.sin(phi)
+    zrot[:, 1, 0] = -num.sin(phi)
+    zrot[:, 1, 1] = num.cos(phi)
+    zrot[:, 2, 2] = 1.0
+
+    lam = math.pi*2.0*x2
+    v = num.vstack((num.cos(lam)*num.sqrt(x3),
+                    num.sin(lam)*num.sqrt(x3),
+                    num.sqrt(1.-x3))).T
+
+    house = num.identity(3)[num.newaxis, :, :] \
+        - 2.0 * v[:, :, num.newaxis] * v[:, num.newaxis, :]
+
+    return -num.matmul(house, zrot)
+
+
+def _unique_sdr(normals, slips):
+    '''Strike, dip and rake [deg] of fault planes given by normal and slip
+    vectors in north-east-down convention, with conventions as in
+    :py:func:`unique_euler`.'''
+
+    flip = normals[:, 2] > 0.
+    normals = num.where(flip[:, num.newaxis], -normals, normals)
+    slips = num.where(flip[:, num.newaxis], -slips, slips)
+
+    dip = num.arccos(num.clip(-normals[:, 2], -1., 1.))
+    strike = num.arctan2(-normals[:, 0], normals[:, 1])
+    sindip = num.sin(dip)
+    rake = num.arctan2(
+        -slips[:, 2] / num.where(sindip == 0., 1., sindip),
+        slips[:, 0]*num.cos(strike) + slips[:, 1]*num.sin(strike))
+
+    # horizontal planes: only strike+rake is defined
+    horizontal = dip < 1e-7
+    strike_h = num.arctan2(slips[:, 1], slips[:, 0])
+    strike = num.where(horizontal, strike_h, strike)
+    rake = num.where(horizontal, 0., rake)
+
+    strike = num.mod(strike, 2.*math.pi)
+    rake = num.mod(rake+math.pi, 2.*math.pi) - math.pi
+
+    dip = num.where(num.abs(dip - 0.5*math.pi) < 1e-10, 0.5*math.pi, dip)
+    strike = num.where(num.abs(strike - math.pi) < 1e-10, math.pi, strike)
+    strike = num.where(num.abs(strike - 2.*math.pi) < 1e-10, 0., strike)
+    strike = num.where(num.abs(strike) < 1e-10, 0., strike)
+
+    # vertical planes: look at them such that strike is in [0, 180)
+    other_side = num.logical_and(dip == 0.5*math.pi, strike >= math.pi)
+    strike = num.where(other_side, strike - math.pi, strike)
+    rake = num.where(
+        other_side, num.mod(-rake+math.pi, 2.*math.pi) - math.pi, rake)
+
+    return r2d*strike, r2d*dip, r2d*rake
+
+
+class MomentTensors(object):
+    '''
+    Container for many moment tensors, backed by NumPy arrays.
+
+    Batched counterpart of :py:class:`MomentTensor`, for operations on large
+    ensembles of moment tensors, e.g. from bootstrapping or catalogs.
+    Eigensystems and decompositions are computed for all tensors at once.
+
+    :param m6s: array of shape ``(N, 6)`` with moment tensor components
+        ``(mnn, mee, mdd, mne, mnd, med)`` in [Nm]
+    '''
+
+    def __init__(self, m6s):
+        m6s = num.array(m6s, dtype=num.float)
+        if m6s.ndim != 2 or m6s.shape[1] != 6:
+            raise ValueError('m6s must be of shape (N, 6)')
+
+        m6s.flags.writeable = False
+        self._m6s = m6s
+        self._eigensystems = None
+
+    @classmethod
+    def from_moment_tensors(cls, mts):
+        '''Create from a list of :py:class:`MomentTensor` objects.'''
+
+        return cls(num.array([mt.m6() for mt in mts], dtype=num.float)
+                   .reshape((len(mts), 6)))
+
+    @classmethod
+    def from_ms(cls, ms):
+        '''Create from array of symmetric matrices, shape ``(N, 3, 3)``.'''
+
+        return cls(_ms_to_m6s(num.asarray(ms, dtype=num.float)))
+
+    @classmethod
+    def from_strike_dip_rake(cls, strikes, dips, rakes, scalar_moments=1.0,
+                             magnitudes=None):
+        '''Create double couples from fault plane angles in [deg].'''
+
+        strikes, dips, rakes = [
+            num.atleast_1d(num.asarray(x, dtype=num.float))
+            for x in (strikes, dips, rakes)]
+
+        if magnitudes is not None:
+            scalar_moments = magnitude_to_moment(
+                num.asarray(magnitudes, dtype=num.float))
+
+        scalar_moments = num.broadcast_to(
+            num.asarray(scalar_moments, dtype=num.float), strikes.shape)
+
+        rotmats = _euler_to_matrices(d2r*dips, d2r*strikes, -d2r*rakes)
+        ms = num.matmul(num.matmul(
+            rotmats.transpose((0, 2, 1)), MomentTensor._m_unrot.A), rotmats)
+
+        return cls(_ms_to_m6s(ms * scalar_moments[:, num.newaxis, num.newaxis]))
+
+    @classmethod
+    def random_mt(cls, n, x=None, scalar_moment=1.0, magnitude=None):
+        '''Create *n* random moment tensors, see
+        :py:meth:`MomentTensor.random_mt`.'''
+
+        if magnitude is not None:
+            scalar_moment = magnitude_to_moment(magnitude)
+
+        if x is None:
+            x = num.random.random((n, 6))
+
+        evals = x[:, :3] * 2. - 1.0
+        evals /= num.sqrt(num.sum(evals**2, axis=1))[:, num.newaxis]
+        rotmats = _random_rotations(x[:, 3:])
+        ms = num.matmul(rotmats * evals[:, num.newaxis, :],
+                        rotmats.transpose((0, 2, 1)))
+
+        return cls(_ms_to_m6s(ms * scalar_moment))
+
+    @classmethod
+    def random_dc(cls, n, x=None, scalar_moment=1.0, magnitude=None):
+        '''Create *n* random double couples, see
+        :py:meth:`MomentTensor.random_dc`.'''
+
+        if magnitude is not None:
+            scalar_moment = magnitude_to_moment(magnitude)
+
+        if x is None:
+            x = num.random.random((n, 3))
+
+        rotmats = _random_rotations(x)
+        ms = num.matmul(num.matmul(rotmats, MomentTensor._m_unrot.A),
+                        rotmats.transpose((0, 2, 1)))
+
+        return cls(_ms_to_m6s(ms * scalar_moment))
+
+    def __len__(self):
+        return self._m6s.shape[0]
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, num.integer)):
+            return self.moment_tensor(i)
+        else:
+            return MomentTensors(self._m6s[i])
+
+    def moment_tensor(self, i):
+        '''Get single tensor as :py:class:`MomentTensor` object.'''
+
+        return MomentTensor(m=symmat6(*self._m6s[i]))
+
+    def moment_tensors(self):
+        '''Get all tensors as list of :py:class:`MomentTensor` objects.'''
+
+        return [self.moment_tensor(i) for i in xrange(len(self))]
+
+    def m6s(self):
+        '''Get moment tensors as array of shape ``(N, 6)``.'''
+
+        return self._m6s.copy()
+
+    def ms(self):
+        '''Get moment tensors as array of shape ``(N, 3, 3)``.'''
+
+        return _m6s_to_ms(self._m6s)
+
+    def eigensystems(self):
+        '''
+        Get eigenvalues and eigenvectors of all moment tensors.
+
+        :returns: ``(evals, evecs)``, eigenvalues in ascending order, shape
+            ``(N, 3)`` and eigenvectors as columns of right-handed
+            orthonormal matrices, shape ``(N, 3, 3)``, i.e. ``evecs[:, :, 0]``
+            are the P axes, ``evecs[:, :, 2]`` the T axes.
+        '''
+
+        if self._eigensystems is None:
+            evals, evecs = num.linalg.eigh(self.ms())
+            evecs[num.linalg.det(evecs) < 0.] *= -1.
+            self._eigensystems = evals, evecs
+
+        return self._eigensystems
+
+    def eigenvals(self):
+        return self.eigensystems()[0]
+
+    def p_axes(self):
+        return self.eigensystems()[1][:, :, 0]
+
+    def null_axes(self):
+        return self.eigensystems()[1][:, :, 1]
+
+    def t_axes(self):
+        return self.eigensystems()[1][:, :, 2]
+
+    def scalar_moments(self):
+        '''Get scalar moments (Frobenius norm based), see
+        :py:meth:`MomentTensor.scalar_moment`.'''
+
+        return num.sqrt(num.sum(self.eigenvals()**2, axis=1))/math.sqrt(2.)
+
+    def moment_magnitudes(self):
+        return moment_to_magnitude(self.scalar_moments())
+
+    def both_strike_dip_rake(self):
+        '''
+        Get both fault planes of all tensors.
+
+        :returns: array of shape ``(N, 2, 3)`` with ``(strike, dip, rake)``
+            in [deg] of both planes
+
+        The planes are ordered like in
+        :py:meth:`MomentTensor.both_strike_dip_rake`, by lexicographic
+        comparison of the absolute values of their rotation matrices, but
+        elements differing by less than *1e-10* are treated as equal, and
+        planes with equal keys are ordered by strike, dip and rake. For
+        mechanisms where :py:class:`MomentTensor` decides on rounding noise,
+        e.g. pure dip-slip on a plane striking north, the order may therefore
+        differ from it, but it is stable.
+        '''
+
+        _, evecs = self.eigensystems()
+        p = evecs[:, :, 0]
+        t = evecs[:, :, 2]
+
+        sdrs = num.empty((len(self), 2, 3), dtype=num.float)
+        sdrs[:, 0, :] = num.array(
+            _unique_sdr((t+p)/math.sqrt(2.), (t-p)/math.sqrt(2.))).T
+        sdrs[:, 1, :] = num.array(
+            _unique_sdr((t-p)/math.sqrt(2.), (t+p)/math.sqrt(2.))).T
+
+        # order planes like MomentTensor does, by lexicographic comparison
+        # of the absolute values of their rotation matrices, ignoring
+        # differences due to rounding
+        rotmats = [
+            num.abs(_euler_to_matrices(
+                d2r*sdrs[:, i, 1], d2r*sdrs[:, i, 0], -d2r*sdrs[:, i, 2]))
+            .reshape((len(self), 9)) for i in (0, 1)]
+
+        differ = num.abs(rotmats[0] - rotmats[1]) > 1e-10
+        ifirst = num.argmax(differ, axis=1)
+        ii = num.arange(len(self))
+        swap = num.logical_and(
+            differ[ii, ifirst],
+            rotmats[0][ii, ifirst] > rotmats[1][ii, ifirst])
+
+        # if these are equal, order by strike, dip and rake
+        tie = num.logical_not(num.any(differ, axis=1))
+        if num.any(tie):
+            keys = num.round(sdrs[tie], 6)
+            keys[:, :, 0] %= 360.
+            keys[:, :, 2] = (keys[:, :, 2] + 180.) % 360. - 180.
+            differ = keys[:, 0, :] != keys[:, 1, :]
+            ifirst = num.argmax(differ, axis=1)
+            ii = num.arange(keys.shape[0])
+            swap[tie] = keys[ii, 0, ifirst] > keys[ii, 1, ifirst]
+
+        sdrs[swap] = sdrs[swap][:, ::-1, :]
+        return sdrs
+
+    def standard_decompositions(self):
+        '''
+        Decompose all tensors into isotropic, DC and CLVD components.
+
+        Batched version of :py:meth:`MomentTensor.standard_decomposition`,
+        returning the same structure, but with arrays of moments and ratios
+        of shape ``(N,)`` and arrays of matrices of shape ``(N, 3, 3)``.
+        '''
+
+        epsilon = 1e-6
+
+        m = self.ms()
+        n = len(self)
+        ii = num.arange(n)[:, num.newaxis]
+
+        trace_m = num.trace(m, axis1=1, axis2=2)
+        m_iso = num.zeros_like(m)
+        for i in xrange(3):
+            m_iso[:, i, i] = trace_m / 3.
+
+        moment_iso = num.abs(trace_m / 3.)
+
+        m_devi = m - m_iso
+
+        evals, evecs = num.linalg.eigh(m_devi)
+
+        moment_devi = num.max(num.abs(evals), axis=1)
+        moment = moment_iso + moment_devi
+
+        iorder = num.argsort(num.abs(evals), axis=1)
+        evals_sorted = evals[ii, iorder]
+        evecs_sorted = evecs.transpose((0, 2, 1))[ii, iorder] \
+            .transpose((0, 2, 1))
+
+        nodevi = moment_devi < epsilon * moment_iso
+        e2 = num.where(nodevi, 1.0, evals_sorted[:, 2])
+        signed_moment_dc = num.where(
+            nodevi, 0.0,
+            evals_sorted[:, 2] * (1.0 + 2.0 * num.minimum(
+                0.0, evals_sorted[:, 0] / e2)))
+
+        moment_dc = num.abs(signed_moment_dc)
+        m_dc = num.matmul(
+            evecs_sorted * (signed_moment_dc[:, num.newaxis] * num.array(
+                [0., -1.0, 1.0]))[:, num.newaxis, :],
+            evecs_sorted.transpose((0, 2, 1)))
+
+        m_clvd = m_devi - m_dc
+
+        moment_clvd = moment_devi - moment_dc
+
+        ratio_dc = moment_dc / moment
+        ratio_clvd = moment_clvd / moment
+        ratio_iso = moment_iso / moment
+        ratio_devi = moment_devi / moment
+
+        return [
+            (moment_iso, ratio_iso, m_iso),
+            (moment_dc, ratio_dc, m_dc),
+            (moment_clvd, ratio_clvd, m_clvd),
+            (moment_devi, ratio_devi, m_devi),
+            (moment, num.ones(n), m)]
+
+    def kagan_angles(self, other, all_pairs=False):
+        '''
+        Get Kagan angles [deg] between the double couple parts of tensors.
+
+        The Kagan angle is the minimum rotation angle needed to turn the
+        principal axes of one double couple into those of the other,
+        considering the symmetries of the double couple.
+
+        :param other: :py:class:`MomentTensors` of same length as this one
+            or of length 1, or with *all_pairs* of any length
+        :param all_pairs: if ``True``, compare all tensors of this container
+            with all tensors of *other*
+        :returns: array of shape ``(N,)`` or ``(N, M)`` with *all_pairs*
+        '''
+
+        _, a = self.eigensystems()
+        _, b = other.eigensystems()
+        if all_pairs:
+            # relative rotations r = a.T * b, for all pairs
+            r = num.einsum('iba,jbc->ijac', a, b)
+            r = r.reshape((-1, 3, 3))
+        else:
+            r = num.matmul(a.transpose((0, 2, 1)), b)
+
+        d = num.diagonal(r, axis1=1, axis2=2)
+        # traces of r times the DC symmetries (identity and 180 degree
+        # rotations around the principal axes)
+        traces = num.vstack((
+            d[:, 0] + d[:, 1] + d[:, 2],
+            d[:, 0] - d[:, 1] - d[:, 2],
+            -d[:, 0] + d[:, 1] - d[:, 2],
+            -d[:, 0] - d[:, 1] + d[:, 2]))
+
+        angles = r2d * num.arccos(
+            num.clip((num.max(traces, axis=0) - 1.) / 2., -1., 1.))
+
+        if all_pairs:
+            return angles.reshape((len(self), len(other)))
+        else:
+            return angles
+
+
+def kagan_angle(mt1, mt2):
+    '''Get Kagan angle [deg] between two moment tensors.'''
+
+    return float(MomentTensors.from_moment_tensors([as_mt(mt1)]).kagan_angles(
+        MomentTensors.from_moment_tensors([as_mt(mt2)]))[0])
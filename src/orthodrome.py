@@ -1,5 +1,6 @@
 import math
 import numpy as num
+from collections import OrderedDict
 from pyrocko.config import config
 
 d2r = math.pi/180.
@@ -119,6 +120,127 @@ def distance_accurate50m_numpy( a_lats, a_lons, b_lats, b_lons ):
 
     return dists
 
+def _pairs_args(*arrays):
+    arrays = num.broadcast_arrays(
+        *[num.asarray(x, dtype=num.float) for x in arrays])
+
+    return arrays[0].shape, [num.ascontiguousarray(x).ravel() for x in arrays]
+
+
+def distance_many(a_lats, a_lons, b_lats, b_lons, method='accurate50m'):
+    '''Surface distances [m] between many pairs of points.
+
+    Coordinates are given in [deg] and the inputs are broadcast against each
+    other, so that e.g. distances from one point to many others can be
+    computed. Computations are done in C.
+
+    :param method: ``'accurate50m'``, for the spheroid approximation of
+        :py:func:`distance_accurate50m` or ``'vincenty'`` for Vincenty's
+        formula on the WGS84 ellipsoid (sub-millimeter accuracy, except for
+        nearly antipodal points, where it falls back to ``'accurate50m'``)
+    '''
+
+    from pyrocko import orthodrome_ext
+
+    if method == 'accurate50m':
+        kernel = orthodrome_ext.distance_accurate50m
+    elif method == 'vincenty':
+        kernel = orthodrome_ext.distance_vincenty
+    else:
+        raise ValueError('unknown method: %s' % method)
+
+    shape, args = _pairs_args(a_lats, a_lons, b_lats, b_lons)
+    dists = num.zeros(args[0].size, dtype=num.float)
+    kernel(*(args + [dists]))
+    return dists.reshape(shape)
+
+
+def azibazi_many(a_lats, a_lons, b_lats, b_lons):
+    '''Azimuths and backazimuths [deg] between many pairs of points.
+
+    Same as :py:func:`azimuth_numpy` for both directions, with broadcasting
+    as in :py:func:`distance_many`.
+
+    :returns: ``(azimuths, backazimuths)``
+    '''
+
+    from pyrocko import orthodrome_ext
+
+    shape, args = _pairs_args(a_lats, a_lons, b_lats, b_lons)
+    azis = num.zeros(args[0].size, dtype=num.float)
+    bazis = num.zeros(args[0].size, dtype=num.float)
+    orthodrome_ext.azibazi(*(args + [azis, bazis]))
+    return azis.reshape(shape), bazis.reshape(shape)
+
+
+def azibazidist_all_pairs(a_lats, a_lons, b_lats, b_lons,
+                          method='accurate50m'):
+    '''Azimuths, backazimuths and distances between all points of two sets.
+
+    :param a_lats, a_lons: coordinates of the first set of points, 1D arrays
+    :param b_lats, b_lons: coordinates of the second set of points, 1D arrays
+    :param method: see :py:func:`distance_many`
+    :returns: ``(azimuths, backazimuths, distances)``, arrays of shape
+        ``(len(a_lats), len(b_lats))``
+    '''
+
+    a_lats, a_lons, b_lats, b_lons = [
+        num.asarray(x, dtype=num.float) for x in (
+            a_lats, a_lons, b_lats, b_lons)]
+
+    args = (a_lats[:, num.newaxis], a_lons[:, num.newaxis],
+            b_lats[num.newaxis, :], b_lons[num.newaxis, :])
+
+    azis, bazis = azibazi_many(*args)
+    return azis, bazis, distance_many(*(args + (method,)))
+
+
+class AzibazidistCache(object):
+    '''
+    Small LRU cache for azimuth, backazimuth and distance of point pairs.
+
+    :param nmax: maximum number of cached pairs
+    '''
+
+    def __init__(self, nmax=10000):
+        self._nmax = nmax
+        self._entries = OrderedDict()
+
+    def get(self, a_lat, a_lon, b_lat, b_lon, method='accurate50m'):
+        k = (a_lat, a_lon, b_lat, b_lon, method)
+        if k in self._entries:
+            v = self._entries.pop(k)
+        else:
+            azis, bazis = azibazi_many(a_lat, a_lon, b_lat, b_lon)
+            dists = distance_many(a_lat, a_lon, b_lat, b_lon, method=method)
+            v = float(azis), float(bazis), float(dists)
+            if len(self._entries) >= self._nmax:
+                self._entries.popitem(last=False)
+
+        self._entries[k] = v
+        return v
+
+    def clear(self):
+        self._entries.clear()
+
+
+g_azibazidist_cache = AzibazidistCache()
+
+
+def azibazidist(a_lat, a_lon, b_lat, b_lon, method='accurate50m'):
+    '''Azimuth, backazimuth [deg] and distance [m] between two points.
+
+    Results are cached, so that repeated calls for the same pairs of points,
+    e.g. when setting up source-receiver geometries for many targets, are
+    cheap.
+
+    :returns: ``(azimuth, backazimuth, distance)``
+    '''
+
+    return g_azibazidist_cache.get(
+        float(a_lat), float(a_lon), float(b_lat), float(b_lon), method)
+
+
 def ne_to_latlon( lat0, lon0, north_m, east_m ):
     '''Transform local carthesian coordinates to latitude and longitude.
     
@@ -0,0 +1,284 @@
+#define NPY_NO_DEPRECATED_API 7
+
+#include "Python.h"
+#include "numpy/arrayobject.h"
+
+#include <stdint.h>
+#include <math.h>
+
+#define D2R (M_PI/180.)
+#define R2D (180./M_PI)
+
+/* as in orthodrome.py */
+static const double EARTHRADIUS_EQUATOR = 6378.14*1000.;
+static const double EARTH_OBLATENESS = 1./298.257223563;
+
+/* WGS84 */
+static const double WGS84_A = 6378137.0;
+static const double WGS84_F = 1./298.257223563;
+
+static const int VINCENTY_MAXITER = 200;
+static const double VINCENTY_EPS = 1e-12;
+
+static PyObject *Error;
+
+static int good_array(const PyObject* o, int typenum) {
+    if (!PyArray_Check(o)) {
+        PyErr_SetString(Error, "not a NumPy array" );
+        return 0;
+    }
+
+    if (PyArray_TYPE((PyArrayObject*)o) != typenum) {
+        PyErr_SetString(Error, "array of unexpected type");
+        return 0;
+    }
+
+    if (!PyArray_ISCARRAY((PyArrayObject*)o)) {
+        PyErr_SetString(Error, "array is not contiguous or not behaved");
+        return 0;
+    }
+
+    return 1;
+}
+
+static double distance_accurate50m(
+        double alat, double alon, double blat, double blon) {
+
+    /* see orthodrome.distance_accurate50m */
+
+    double f, g, l, s, c, w, r, d, h1, h2;
+
+    f = (alat + blat)*D2R / 2.;
+    g = (alat - blat)*D2R / 2.;
+    l = (alon - blon)*D2R / 2.;
+
+    s = pow(sin(g), 2) * pow(cos(l), 2) + pow(cos(f), 2) * pow(sin(l), 2);
+    c = pow(cos(g), 2) * pow(cos(l), 2) + pow(sin(f), 2) * pow(sin(l), 2);
+
+    w = atan(sqrt(s/c));
+
+    if (w == 0.0) {
+        return 0.0;
+    }
+
+    r = sqrt(s*c)/w;
+    d = 2.*w*EARTHRADIUS_EQUATOR;
+    h1 = (3.*r-1.)/(2.*c);
+    h2 = (3.*r+1.)/(2.*s);
+
+    return d * (1. + EARTH_OBLATENESS * h1 * pow(sin(f), 2) * pow(cos(g), 2)
+                   - EARTH_OBLATENESS * h2 * pow(cos(f), 2) * pow(sin(g), 2));
+}
+
+static double distance_vincenty(
+        double alat, double alon, double blat, double blon) {
+
+    /* Vincenty's inverse formula on the WGS84 ellipsoid. Falls back to
+     * distance_accurate50m for nearly antipodal points, where the iteration
+     * does not converge. */
+
+    double a = WGS84_A, f = WGS84_F, b = (1.-f)*WGS84_A;
+    double L, U1, U2, sinU1, cosU1, sinU2, cosU2, lambda, lambdap;
+    double sinlambda, coslambda, sinsigma, cossigma, sigma, sinalpha;
+    double cossqalpha, cos2sigmam, C, usq, A, B, deltasigma;
+    int iter;
+
+    L = (blon - alon)*D2R;
+    U1 = atan((1.-f) * tan(alat*D2R));
+    U2 = atan((1.-f) * tan(blat*D2R));
+    sinU1 = sin(U1);
+    cosU1 = cos(U1);
+    sinU2 = sin(U2);
+    cosU2 = cos(U2);
+
+    lambda = L;
+    for (iter=0; iter<VINCENTY_MAXITER; iter++) {
+        sinlambda = sin(lambda);
+        coslambda = cos(lambda);
+        sinsigma = sqrt(pow(cosU2*sinlambda, 2) +
+                        pow(cosU1*sinU2 - sinU1*cosU2*coslambda, 2));
+
+        if (sinsigma == 0.0) {
+            return 0.0;
+        }
+
+        cossigma = sinU1*sinU2 + cosU1*cosU2*coslambda;
+        sigma = atan2(sinsigma, cossigma);
+        sinalpha = cosU1*cosU2*sinlambda / sinsigma;
+        cossqalpha = 1. - sinalpha*sinalpha;
+        cos2sigmam = cossqalpha != 0.0 ?
+            cossigma - 2.*sinU1*sinU2/cossqalpha : 0.0;
+
+        C = f/16.*cossqalpha*(4.+f*(4.-3.*cossqalpha));
+        lambdap = lambda;
+        lambda = L + (1.-C) * f * sinalpha * (sigma + C*sinsigma*(
+            cos2sigmam + C*cossigma*(-1.+2.*cos2sigmam*cos2sigmam)));
+
+        if (fabs(lambda-lambdap) < VINCENTY_EPS) {
+            break;
+        }
+    }
+
+    if (iter == VINCENTY_MAXITER) {
+        return distance_accurate50m(alat, alon, blat, blon);
+    }
+
+    usq = cossqalpha * (a*a - b*b) / (b*b);
+    A = 1. + usq/16384.*(4096.+usq*(-768.+usq*(320.-175.*usq)));
+    B = usq/1024.*(256.+usq*(-128.+usq*(74.-47.*usq)));
+    deltasigma = B*sinsigma*(cos2sigmam+B/4.*(
+        cossigma*(-1.+2.*cos2sigmam*cos2sigmam) -
+        B/6.*cos2sigmam*(-3.+4.*sinsigma*sinsigma) *
+            (-3.+4.*cos2sigmam*cos2sigmam)));
+
+    return b*A*(sigma-deltasigma);
+}
+
+static double azimuth(double alat, double alon, double blat, double blon) {
+
+    /* see orthodrome.azimuth */
+
+    double cosdelta;
+
+    cosdelta = fmin(1.0, sin(alat*D2R) * sin(blat*D2R) +
+                         cos(alat*D2R) * cos(blat*D2R) * cos(D2R*(blon-alon)));
+
+    return R2D*atan2(cos(alat*D2R) * cos(blat*D2R) * sin(D2R*(blon-alon)),
+                     sin(D2R*blat) - sin(D2R*alat) * cosdelta);
+}
+
+static int parse_pairs(PyObject *args, const char *usage, int nout,
+                       double **in, double **out, npy_intp *n) {
+
+    PyObject *arrs[6];
+    int i;
+
+    if (!PyArg_ParseTuple(args, nout == 1 ? "OOOOO" : "OOOOOO",
+                          &arrs[0], &arrs[1], &arrs[2], &arrs[3],
+                          &arrs[4], &arrs[5])) {
+
+        PyErr_SetString(Error, usage);
+        return 0;
+    }
+
+    for (i=0; i<4+nout; i++) {
+        if (!good_array(arrs[i], NPY_DOUBLE)) {
+            return 0;
+        }
+    }
+
+    *n = PyArray_SIZE((PyArrayObject*)arrs[0]);
+    for (i=0; i<4+nout; i++) {
+        if (PyArray_SIZE((PyArrayObject*)arrs[i]) != *n) {
+            PyErr_SetString(Error, "arrays must have the same size");
+            return 0;
+        }
+    }
+
+    for (i=0; i<4; i++) {
+        in[i] = (double*)PyArray_DATA((PyArrayObject*)arrs[i]);
+    }
+
+    for (i=0; i<nout; i++) {
+        out[i] = (double*)PyArray_DATA((PyArrayObject*)arrs[4+i]);
+    }
+
+    return 1;
+}
+
+static PyObject* w_distance_accurate50m(PyObject *dummy, PyObject *args) {
+    double *in[4], *out[1];
+    npy_intp i, n;
+
+    (void)dummy; /* silence warning */
+
+    if (!parse_pairs(args,
+            "usage distance_accurate50m(a_lats, a_lons, b_lats, b_lons, "
+            "dists_out)", 1, in, out, &n)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (i=0; i<n; i++) {
+        out[0][i] = distance_accurate50m(in[0][i], in[1][i], in[2][i], in[3][i]);
+    }
+    Py_END_ALLOW_THREADS
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject* w_distance_vincenty(PyObject *dummy, PyObject *args) {
+    double *in[4], *out[1];
+    npy_intp i, n;
+
+    (void)dummy; /* silence warning */
+
+    if (!parse_pairs(args,
+            "usage distance_vincenty(a_lats, a_lons, b_lats, b_lons, "
+            "dists_out)", 1, in, out, &n)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (i=0; i<n; i++) {
+        out[0][i] = distance_vincenty(in[0][i], in[1][i], in[2][i], in[3][i]);
+    }
+    Py_END_ALLOW_THREADS
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject* w_azibazi(PyObject *dummy, PyObject *args) {
+    double *in[4], *out[2];
+    npy_intp i, n;
+
+    (void)dummy; /* silence warning */
+
+    if (!parse_pairs(args,
+            "usage azibazi(a_lats, a_lons, b_lats, b_lons, azis_out, "
+            "bazis_out)", 2, in, out, &n)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (i=0; i<n; i++) {
+        out[0][i] = azimuth(in[0][i], in[1][i], in[2][i], in[3][i]);
+        out[1][i] = azimuth(in[2][i], in[3][i], in[0][i], in[1][i]);
+    }
+    Py_END_ALLOW_THREADS
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyMethodDef Methods[] = {
+    {"distance_accurate50m",  w_distance_accurate50m, METH_VARARGS,
+        "surface distances on the ellipsoid, accurate to about 50 m" },
+
+    {"distance_vincenty",  w_distance_vincenty, METH_VARARGS,
+        "surface distances on the WGS84 ellipsoid (Vincenty)" },
+
+    {"azibazi",  w_azibazi, METH_VARARGS,
+        "azimuths and backazimuths on the sphere" },
+
+    {NULL, NULL, 0, NULL}        /* Sentinel */
+};
+
+PyMODINIT_FUNC
+initorthodrome_ext(void)
+{
+    PyObject *m;
+
+    m = Py_InitModule("orthodrome_ext", Methods);
+    if (m == NULL) return;
+    import_array();
+
+    Error = PyErr_NewException("orthodrome_ext.error", NULL, NULL);
+    Py_INCREF(Error);  /* required, because other code could remove `error`
+                               from the module, what would create a dangling
+                               pointer. */
+
+    PyModule_AddObject(m, "OrthodromeExtError", Error);
+}
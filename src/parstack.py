@@ -1,6 +1,13 @@
 import numpy as num
 import parstack_ext
 
+methods = {
+    'stack': 0,
+    'max': 1,
+    'argmax': 2,
+    'sumsq': 3,
+    'semblance': 4}
+
 
 def parstack(arrays, offsets, shifts, weights, method,
              lengthout=-1,
@@ -9,10 +16,38 @@ def parstack(arrays, offsets, shifts, weights, method,
              nparallel=None,
              impl='openmp'):
 
+    '''Weighted delay-and-sum of a set of arrays for many shift combinations.
+
+    :param arrays: list of 1D arrays, either all of type ``float64`` or all
+        of type ``float32``
+    :param offsets: sample offsets of the arrays, ``int32`` array
+    :param shifts: sample shifts, ``int32`` array of shape
+        ``(nshifts, narrays)``
+    :param weights: weights, ``float64`` array of shape ``(nshifts, narrays)``
+    :param method: how to reduce the stacks along the time axis: ``0`` or
+        ``'stack'``: no reduction, ``1`` or ``'max'``: maximum, ``2`` or
+        ``'argmax'``: index of the maximum (``int32``), ``3`` or
+        ``'sumsq'``: sum of squares, ``4`` or ``'semblance'``: semblance,
+        i.e. sum of squares of the stack divided by ``narrays`` times the sum
+        of squares of the weighted array samples in the output window
+    :param lengthout,offsetout: length and sample offset of the output
+        window, by default chosen to cover all contributions
+    :param result: if given, for method 0, the stack is added to this array,
+        otherwise it is overwritten
+    :returns: ``(result, offset)``, where ``result`` has shape
+        ``(nshifts, nsamples)`` for method 0 and shape ``(nshifts,)`` for the
+        others, and ``offset`` is the sample offset of the output window.
+
+    Results are of the same floating point type as the input arrays. With
+    ``float32`` arrays, memory and bandwidth needs are halved.
+    '''
+
     if nparallel is None:
         import multiprocessing
         nparallel = multiprocessing.cpu_count()
 
+    method = methods.get(method, method)
+
     narrays = offsets.size
     assert(len(arrays) == narrays)
     nshifts = shifts.size / narrays
@@ -37,6 +72,50 @@ def parstack(arrays, offsets, shifts, weights, method,
     return result, offset
 
 
+def parstack_topk(arrays, offsets, shifts, weights, k, method='max',
+                  lengthout=-1, offsetout=0, nshifts_chunk=1000,
+                  nparallel=None, impl='openmp'):
+
+    '''Find the shift combinations giving the k largest reduced stacks.
+
+    The shift combinations are processed in chunks of *nshifts_chunk*, so
+    that the intermediate results never need more memory than needed for one
+    chunk. See :py:func:`parstack` for the meaning of the arguments.
+
+    :param method: reduction used for ranking, ``'max'``, ``'sumsq'`` or
+        ``'semblance'``
+    :returns: ``(ishifts, values)``, indices of the best shift combinations
+        and their values, sorted by decreasing value
+    '''
+
+    method = methods.get(method, method)
+    if method not in (1, 3, 4):
+        raise ValueError('parstack_topk: unsupported method: %s' % method)
+
+    nshifts = shifts.shape[0]
+    best_ishifts = num.zeros(0, dtype=num.int)
+    best_values = num.zeros(0, dtype=num.float)
+    for ishift in xrange(0, nshifts, nshifts_chunk):
+        sl = slice(ishift, ishift+nshifts_chunk)
+        values, _ = parstack(
+            arrays, offsets, shifts[sl], weights[sl], method,
+            lengthout=lengthout,
+            offsetout=offsetout,
+            nparallel=nparallel,
+            impl=impl)
+
+        best_ishifts = num.concatenate((
+            best_ishifts, num.arange(ishift, ishift+values.size)))
+        best_values = num.concatenate((best_values, values))
+        if best_values.size > k:
+            ii = num.argpartition(-best_values, k)[:k]
+            best_ishifts = best_ishifts[ii]
+            best_values = best_values[ii]
+
+    order = num.argsort(-best_values, kind='mergesort')
+    return best_ishifts[order], best_values[order]
+
+
 def parstack_numpy(arrays, offsets, shifts, weights, method, lengthout, offsetout, result, nparallel):
 
     # nparallel is ignored here
@@ -61,7 +140,8 @@ def parstack_numpy(arrays, offsets, shifts, weights, method, lengthout, offsetou
         imin = offsetout
 
     nshifts = shifts.size / narrays
-    result = num.zeros(nsamp*nshifts, dtype=num.float)
+    result = num.zeros(nsamp*nshifts, dtype=arrays[0].dtype)
+    energy = num.zeros(nshifts, dtype=num.float)
 
     for ishift in xrange(nshifts):
         for iarray in xrange(narrays):
@@ -73,7 +153,24 @@ def parstack_numpy(arrays, offsets, shifts, weights, method, lengthout, offsetou
             result[istart_r+jstart:istart_r+jstop] += \
                 arrays[iarray][jstart:jstop] * weight
 
+            energy[ishift] += num.sum(
+                (arrays[iarray][jstart:jstop].astype(num.float)
+                 * weight)**2)
+
     if method == 0:
         return result, offsetout
-    elif method == 1:
-        return num.amax(result.reshape((nshifts, nsamp)), axis=1), offsetout
+
+    result = result.reshape((nshifts, nsamp))
+    if method == 1:
+        return num.amax(result, axis=1), offsetout
+    elif method == 2:
+        return num.argmax(result, axis=1).astype(num.int32), offsetout
+
+    sumsq = num.sum(result.astype(num.float)**2, axis=1)
+    if method == 3:
+        return sumsq.astype(result.dtype), offsetout
+    elif method == 4:
+        semblance = num.zeros(nshifts, dtype=num.float)
+        mask = energy > 0.0
+        semblance[mask] = sumsq[mask] / (energy[mask] * narrays)
+        return semblance.astype(result.dtype), offsetout
@@ -6,12 +6,16 @@
 #include "numpy/arrayobject.h"
 
 #include <stdlib.h>
+#include <string.h>
+#include <limits.h>
+#include <math.h>
 #if !noomp
 # include <omp.h>
 #endif
 #include <stdio.h>
 
-#define CHUNKSIZE 10
+#define BLOCKSIZE 1024
+#define SHIFTBLOCK 8
 
 static PyObject *ParstackError;
 
@@ -29,7 +33,8 @@ int parstack_config(
 
 int parstack(
         size_t narrays,
-        double **arrays,
+        void **arrays,
+        int single,
         int *offsets,
         size_t *lengths,
         size_t nshifts,
@@ -38,25 +43,30 @@ int parstack(
         int method,
         size_t lengthout,
         int offsetout,
-        double *result,
+        void *result,
         int nparallel);
 
 
-int min(int a, int b) {
+long min(long a, long b) {
     return (a < b) ? a : b;
 }
 
-int max(int a, int b) {
-    return (a > b) ? a : b;
-}
-
-double dmax(double a, double b) {
+long max(long a, long b) {
     return (a > b) ? a : b;
 }
 
 #define SUCCESS 0
 #define NODATA 1
 #define INVALID 2
+#define ALLOCFAILED 3
+
+/* methods */
+#define STACK 0
+#define MAX 1
+#define ARGMAX 2
+#define SUMSQ 3
+#define SEMBLANCE 4
+#define NMETHODS 5
 
 int parstack_config(
         size_t narrays,
@@ -96,9 +106,49 @@ int parstack_config(
     return SUCCESS;
 }
 
+/* Typed inner loops. These are kept trivial, so that the compiler can
+ * vectorize them. */
+
+#define DEFINE_TYPED(SUFFIX, T) \
+static void axpy_##SUFFIX( \
+        T * restrict out, const T * restrict a, T w, size_t n) { \
+    size_t i; \
+    for (i=0; i<n; i++) { \
+        out[i] += a[i] * w; \
+    } \
+} \
+\
+static double wsumsq_##SUFFIX(const T * restrict a, double w, size_t n) { \
+    size_t i; \
+    double s = 0.0; \
+    for (i=0; i<n; i++) { \
+        s += (double)a[i] * (double)a[i]; \
+    } \
+    return s * w * w; \
+} \
+\
+static void reduce_##SUFFIX( \
+        const T * restrict x, size_t n, size_t ioff, \
+        double *vmax, size_t *imax, double *sumsq) { \
+    size_t i; \
+    double s = 0.0; \
+    for (i=0; i<n; i++) { \
+        s += (double)x[i] * (double)x[i]; \
+        if ((double)x[i] > *vmax) { \
+            *vmax = x[i]; \
+            *imax = ioff + i; \
+        } \
+    } \
+    *sumsq += s; \
+}
+
+DEFINE_TYPED(d, double)
+DEFINE_TYPED(f, float)
+
 int parstack(
         size_t narrays,
-        double **arrays,
+        void **arrays,
+        int single,
         int *offsets,
         size_t *lengths,
         size_t nshifts,
@@ -107,84 +157,163 @@ int parstack(
         int method,
         size_t lengthout,
         int offsetout,
-        double *result,
+        void *result,
         int nparallel) {
 
-	(void) nparallel;
-    int imin, istart, ishift;
-    size_t iarray, nsamp, i;
-    double weight;
-    int chunk;
-    double *temp;
-    double m;
+    size_t nsamp, ngroups, elsize;
+    int imin, failed;
+
+    (void) nparallel;
 
     if (narrays < 1) {
         return NODATA;
     }
 
-    if (nshifts > INT_MAX) {
+    if (nshifts > INT_MAX || method < 0 || method >= NMETHODS) {
         return INVALID;
     }
 
     imin = offsetout;
     nsamp = lengthout;
+    elsize = single ? sizeof(float) : sizeof(double);
+    ngroups = (nshifts + SHIFTBLOCK - 1) / SHIFTBLOCK;
+    failed = 0;
+
+    /* Shifts are processed in groups of SHIFTBLOCK, the time axis in blocks
+     * of BLOCKSIZE samples. Within a group, the array samples needed for a
+     * block are likely to be reused by all shifts of the group, and the
+     * output block stays in cache while contributions of all arrays are
+     * added. For the reducing methods, only a temporary buffer of
+     * SHIFTBLOCK x BLOCKSIZE samples per thread is needed. */
+
+#if !noomp
+    #pragma omp parallel num_threads(nparallel)
+#endif
+    {
+    char *temp;
+    double vmax[SHIFTBLOCK], sumsq[SHIFTBLOCK], energy[SHIFTBLOCK];
+    size_t imax[SHIFTBLOCK];
+    long ig, b0, bn, istart, jmin, jmax;
+    size_t ishift, ishift_begin, ishift_end, iarray, k;
+    double w;
+    char *out;
+
+    temp = NULL;
+    if (method != STACK) {
+        temp = (char*)malloc(SHIFTBLOCK * BLOCKSIZE * elsize);
+        if (temp == NULL) {
+#if !noomp
+            #pragma omp atomic write
+#endif
+            failed = 1;
+        }
+    }
+
+#if !noomp
+    #pragma omp for schedule(dynamic, 1)
+#endif
+    for (ig=0; ig<(long)ngroups; ig++) {
+        if (method != STACK && temp == NULL) {
+            continue;
+        }
+
+        ishift_begin = ig * SHIFTBLOCK;
+        ishift_end = ishift_begin + SHIFTBLOCK;
+        if (ishift_end > nshifts) {
+            ishift_end = nshifts;
+        }
+
+        for (k=0; k<SHIFTBLOCK; k++) {
+            vmax[k] = -HUGE_VAL;
+            imax[k] = 0;
+            sumsq[k] = 0.0;
+            energy[k] = 0.0;
+        }
+
+        for (b0=0; b0<(long)nsamp; b0+=BLOCKSIZE) {
+            bn = min(BLOCKSIZE, (long)nsamp - b0);
+            for (ishift=ishift_begin; ishift<ishift_end; ishift++) {
+                k = ishift - ishift_begin;
+                if (method == STACK) {
+                    out = (char*)result + (ishift*nsamp + b0) * elsize;
+                } else {
+                    out = temp + k * BLOCKSIZE * elsize;
+                    memset(out, 0, bn * elsize);
+                }
 
-    chunk = CHUNKSIZE;
-
-    if (method == 0) {
-	#if !noomp
-        #pragma omp parallel private(ishift, iarray, i, istart, weight) num_threads(nparallel)
-	#endif
-        {
-
-	#if !noomp
-        #pragma omp for schedule(dynamic,chunk) nowait
-	#endif
-        for (ishift=0; ishift<(int)nshifts; ishift++) {
-            for (iarray=0; iarray<narrays; iarray++) {
-                istart = offsets[iarray] + shifts[ishift*narrays + iarray];
-                weight = weights[ishift*narrays + iarray];
-                for (i=(size_t)max(0, imin - istart); i<(size_t)max(0, min(nsamp - istart + imin, lengths[iarray])); i++) {
-                    result[ishift*nsamp + istart-imin+i] += arrays[iarray][i] * weight;
+                for (iarray=0; iarray<narrays; iarray++) {
+                    /* position of the first array sample in the block */
+                    istart = (long)offsets[iarray]
+                        + shifts[ishift*narrays + iarray] - imin - b0;
+                    w = weights[ishift*narrays + iarray];
+                    jmin = max(0, -istart);
+                    jmax = min(bn - istart, (long)lengths[iarray]);
+                    if (jmax <= jmin) {
+                        continue;
+                    }
+
+                    if (single) {
+                        axpy_f((float*)out + istart + jmin,
+                               (float*)arrays[iarray] + jmin,
+                               (float)w, jmax - jmin);
+                    } else {
+                        axpy_d((double*)out + istart + jmin,
+                               (double*)arrays[iarray] + jmin,
+                               w, jmax - jmin);
+                    }
+
+                    if (method == SEMBLANCE) {
+                        energy[k] += single ?
+                            wsumsq_f((float*)arrays[iarray] + jmin, w,
+                                     jmax - jmin) :
+                            wsumsq_d((double*)arrays[iarray] + jmin, w,
+                                     jmax - jmin);
+                    }
+                }
+
+                if (method != STACK) {
+                    if (single) {
+                        reduce_f((float*)out, bn, b0, &vmax[k], &imax[k],
+                                 &sumsq[k]);
+                    } else {
+                        reduce_d((double*)out, bn, b0, &vmax[k], &imax[k],
+                                 &sumsq[k]);
+                    }
                 }
             }
         }
+
+        if (method == STACK) {
+            continue;
         }
 
-    } else if (method == 1) {
-
-	#if !noomp
-        #pragma omp parallel private(ishift, iarray, i, istart, weight, temp, m)
-	#endif
-        {
-        temp = (double*)calloc(nsamp, sizeof(double));
-	#if !noomp
-        #pragma omp for schedule(dynamic,chunk) nowait
-	#endif
-        for (ishift=0; ishift<(int)nshifts; ishift++) {
-            for (i=0; i<nsamp; i++) {
-                temp[i] = 0.0;
-            }
-            for (iarray=0; iarray<narrays; iarray++) {
-                istart = offsets[iarray] + shifts[ishift*narrays + iarray];
-                weight = weights[ishift*narrays + iarray];
-                for (i=(size_t)max(0, imin - istart); i<(size_t)max(0, min(nsamp - istart + imin, lengths[iarray])); i++) {
-                    temp[istart-imin+i] += arrays[iarray][i] * weight;
+        for (ishift=ishift_begin; ishift<ishift_end; ishift++) {
+            k = ishift - ishift_begin;
+            if (method == ARGMAX) {
+                ((int*)result)[ishift] = (int)imax[k];
+            } else {
+                if (method == MAX) {
+                    w = nsamp > 0 ? vmax[k] : 0.0;
+                } else if (method == SUMSQ) {
+                    w = sumsq[k];
+                } else {
+                    w = energy[k] > 0.0 ?
+                        sumsq[k] / (energy[k] * narrays) : 0.0;
+                }
+
+                if (single) {
+                    ((float*)result)[ishift] = (float)w;
+                } else {
+                    ((double*)result)[ishift] = w;
                 }
             }
-            m = 0.;
-            for (i=0; i<nsamp; i++) {
-                //m += temp[i]*temp[i];
-                m = dmax(m, temp[i]);
-            }
-            result[ishift] = m;
-        }
-        free(temp);
         }
     }
-    return SUCCESS;
-}
+    free(temp);
+    }
 
+    return failed ? ALLOCFAILED : SUCCESS;
+}
 
 
 int good_array(PyObject* o, int typenum) {
@@ -217,11 +346,12 @@ static PyObject* w_parstack(PyObject *dummy, PyObject *args) {
     int offsetout;
     int lengthout_arg;
     int *coffsets, *cshifts;
-    double *cweights, *cresult;
-    double **carrays;
+    double *cweights;
+    void *cresult;
+    void **carrays;
     npy_intp array_dims[1];
     size_t i;
-    int err;
+    int err, typenum, result_typenum;
 
     (void)dummy; /* silence warning */
 
@@ -237,10 +367,14 @@ static PyObject* w_parstack(PyObject *dummy, PyObject *args) {
 
         return NULL;
     }
+    if (method < 0 || method >= NMETHODS) {
+        PyErr_SetString(ParstackError, "invalid method");
+        return NULL;
+    }
+
     if (!good_array(offsets, NPY_INT)) return NULL;
     if (!good_array(shifts, NPY_INT)) return NULL;
     if (!good_array(weights, NPY_DOUBLE)) return NULL;
-    if (result != Py_None && !good_array(result, NPY_DOUBLE)) return NULL;
 
     coffsets = PyArray_DATA((PyArrayObject*)offsets);
     narrays = PyArray_SIZE((PyArrayObject*)offsets);
@@ -269,7 +403,23 @@ static PyObject* w_parstack(PyObject *dummy, PyObject *args) {
         return NULL;
     }
 
-    carrays = (double**)calloc(narrays, sizeof(double*));
+    if (narrays < 1) {
+        PyErr_SetString(ParstackError, "need at least one array");
+        return NULL;
+    }
+
+    /* all arrays must be either float64 or float32, the type of the first
+     * array decides */
+    arr = PyList_GetItem(arrays, 0);
+    typenum = NPY_DOUBLE;
+    if (PyArray_Check(arr) && PyArray_TYPE((PyArrayObject*)arr) == NPY_FLOAT) {
+        typenum = NPY_FLOAT;
+    }
+
+    result_typenum = (method == ARGMAX) ? NPY_INT : typenum;
+    if (result != Py_None && !good_array(result, result_typenum)) return NULL;
+
+    carrays = (void**)calloc(narrays, sizeof(void*));
     if (carrays == NULL) {
         PyErr_SetString(ParstackError, "alloc failed");
         return NULL;
@@ -284,7 +434,7 @@ static PyObject* w_parstack(PyObject *dummy, PyObject *args) {
 
     for (i=0; i<narrays; i++) {
         arr = PyList_GetItem(arrays, i);
-        if (!good_array(arr, NPY_DOUBLE)) {
+        if (!good_array(arr, typenum)) {
             free(carrays);
             free(clengths);
             return NULL;
@@ -306,7 +456,7 @@ static PyObject* w_parstack(PyObject *dummy, PyObject *args) {
         lengthout = (size_t)lengthout_arg;
     }
 
-    if (method == 0) {
+    if (method == STACK) {
         array_dims[0] = nshifts * lengthout;
     } else {
         array_dims[0] = nshifts;
@@ -314,19 +464,14 @@ static PyObject* w_parstack(PyObject *dummy, PyObject *args) {
 
     if (result != Py_None) {
         if (PyArray_SIZE((PyArrayObject*)result) != array_dims[0]) {
+            PyErr_SetString(ParstackError, "result array has wrong size");
             free(carrays);
             free(clengths);
             return NULL;
         }
         Py_INCREF(result); 
     } else {
-        result = PyArray_SimpleNew(1, array_dims, NPY_FLOAT64);
-        cresult = PyArray_DATA((PyArrayObject*)result);
-
-        for (i=0; i<(size_t)array_dims[0]; i++) {
-            cresult[i] = 0.0;
-        }
-
+        result = PyArray_ZEROS(1, array_dims, result_typenum, 0);
         if (result == NULL) {
             free(carrays);
             free(clengths);
@@ -335,8 +480,11 @@ static PyObject* w_parstack(PyObject *dummy, PyObject *args) {
     }
     cresult = PyArray_DATA((PyArrayObject*)result);
 
-    err = parstack(narrays, carrays, coffsets, clengths, nshifts, cshifts,
-                   cweights, method, lengthout, offsetout, cresult, nparallel);
+    Py_BEGIN_ALLOW_THREADS
+    err = parstack(narrays, carrays, typenum == NPY_FLOAT, coffsets, clengths,
+                   nshifts, cshifts, cweights, method, lengthout, offsetout,
+                   cresult, nparallel);
+    Py_END_ALLOW_THREADS
 
     if (err != 0) {
         PyErr_SetString(ParstackError, "parstack() failed");
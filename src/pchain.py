@@ -1,21 +1,32 @@
+from collections import OrderedDict
+
 
 class Stage(object):
-    def __init__(self, f):
+    def __init__(self, f, nmax=None):
         self._f = f
         self._parent = None
-        self._cache = {}
+        self._cache = OrderedDict()
+        self._nmax = nmax
 
     def __call__(self, *x, **kwargs):
         if kwargs.get('nocache', False):
             return self.call_nocache(*x)
 
-        if x not in self._cache:
+        if x in self._cache:
+            y = self._cache.pop(x)
+        else:
             if self._parent is not None:
-                self._cache[x] = self._f(self._parent(*x[:-1]), *x[-1])
+                y = self._f(self._parent(*x[:-1]), *x[-1])
             else:
-                self._cache[x] = self._f(*x[-1])
+                y = self._f(*x[-1])
+
+        # least recently used entries are evicted first
+        self._cache[x] = y
+        if self._nmax is not None:
+            while len(self._cache) > self._nmax:
+                self._cache.popitem(last=False)
 
-        return self._cache[x]
+        return y
 
     def call_nocache(self, *x):
         if self._parent is not None:
@@ -28,12 +39,13 @@ class Stage(object):
 
 
 class Chain(object):
-    def __init__(self, *stages):
+    def __init__(self, *stages, **kwargs):
+        nmax = kwargs.get('nmax', None)
         parent = None
         self.stages = []
         for stage in stages:
             if not isinstance(stage, Stage):
-                stage = Stage(stage)
+                stage = Stage(stage, nmax=nmax)
             
             stage._parent = parent
             parent = stage
@@ -3,7 +3,8 @@ from pyrocko import trace, io, util
 from pyrocko import config
 
 import numpy as num
-import os, logging, time, weakref, copy, re, sys, operator, math
+import os, logging, time, weakref, copy, re, sys, operator, math, hashlib
+import threading
 import cPickle as pickle
         
 def sl(s):
@@ -101,10 +102,18 @@ class Sorted(object):
         return iter(self._avl)
 
     def with_key_in(self, kmin, kmax):
-        omin, omax = self._dummy(kmin), self._dummy(kmax)
-        ilo, ihi = self._avl.span(omin,omax)
+        ilo, ihi = self.span(kmin, kmax)
         return self._avl[ilo:ihi]
 
+    def span(self, kmin, kmax):
+        '''Get index range of the elements with key in [kmin, kmax].'''
+
+        omin, omax = self._dummy(kmin), self._dummy(kmax)
+        return self._avl.span(omin,omax)
+
+    def __getitem__(self, i):
+        return self._avl[i]
+
     def min(self):
         return self._avl.min()
     
@@ -259,6 +268,207 @@ def get_cache(cachedir):
         TracesFileCache.caches[cachedir] = TracesFileCache(cachedir)
         
     return TracesFileCache.caches[cachedir]
+
+
+def minmax_reduce(mins, maxs, n):
+    '''Get min and max over consecutive blocks of *n* values.
+
+    The last block may be incomplete.
+    '''
+
+    nfull = mins.size // n
+    rmins = mins[:nfull*n].reshape((nfull, n)).min(axis=1)
+    rmaxs = maxs[:nfull*n].reshape((nfull, n)).max(axis=1)
+    if nfull*n < mins.size:
+        rmins = num.append(rmins, mins[nfull*n:].min())
+        rmaxs = num.append(rmaxs, maxs[nfull*n:].max())
+
+    return rmins, rmaxs
+
+
+def minmax_pyramid(ydata, nblock=64, factor=4):
+    '''Compute multi-resolution min/max envelope of a data array.
+
+    :param ydata: data samples
+    :param nblock: number of samples per bin at the finest level
+    :param factor: increase of bin size from level to level
+    :returns: list of ``(nblock, mins, maxs)`` tuples, from fine to coarse,
+        where bin ``i`` of a level covers samples ``i*nblock`` to
+        ``(i+1)*nblock-1``
+    '''
+
+    ydata = num.asarray(ydata)
+    mins, maxs = minmax_reduce(ydata, ydata, nblock)
+    mins = mins.astype(num.float32)
+    maxs = maxs.astype(num.float32)
+    levels = [(nblock, mins, maxs)]
+    while mins.size > 1:
+        mins, maxs = minmax_reduce(mins, maxs, factor)
+        nblock *= factor
+        levels.append((nblock, mins, maxs))
+
+    return levels
+
+
+def envelope_key(tr):
+    return tr.nslc_id + (tr.tmin, tr.tmax, tr.deltat)
+
+
+class EnvelopeCache(object):
+    '''Manages multi-resolution min/max envelopes of trace files.
+
+    The envelopes are used to quickly display long time spans of densely
+    sampled data. They are computed once for each file, stored in the cache
+    directory and kept in memory up to a size of *max_bytes*.
+    '''
+
+    caches = {}
+
+    def __init__(self, cachedir, max_bytes=256*1024**2):
+        self.cachedir = cachedir
+        self.max_bytes = max_bytes
+        self._pyramids = {}
+        self._order = []
+        self._nbytes = 0
+        util.ensuredir(self.cachedir)
+
+    def _cachepath(self, abspath):
+        return pjoin(self.cachedir, hashlib.sha1(abspath).hexdigest())
+
+    def get(self, file):
+        '''Get envelope pyramids of all traces in a file.
+
+        :param file: :py:class:`TracesFile` or :py:class:`MemTracesFile`
+        :returns: dict with pyramids (see :py:func:`minmax_pyramid`), keyed
+            by trace nslc, tmin, tmax and deltat
+        '''
+
+        if file.abspath is None:
+            return self._make(file)
+
+        k = file.abspath
+        if k in self._pyramids and self._pyramids[k][0] == file.mtime:
+            return self._pyramids[k][1]
+
+        pyramids = self._load(file)
+        if pyramids is None:
+            pyramids = self._make(file)
+            self._dump(file, pyramids)
+
+        self._remember(k, file.mtime, pyramids)
+        return pyramids
+
+    def _make(self, file):
+        logger.debug('computing envelopes for file: %s' % file.abspath)
+        was_loaded = getattr(file, 'data_loaded', True)
+        file.load_data()
+        pyramids = {}
+        try:
+            for tr in file.iter_traces():
+                if tr.ydata is not None:
+                    pyramids[envelope_key(tr)] = minmax_pyramid(tr.ydata)
+
+        finally:
+            if not was_loaded:
+                file.use_data()
+                file.drop_data()
+
+        return pyramids
+
+    def _load(self, file):
+        cachepath = self._cachepath(file.abspath)
+        if not os.path.isfile(cachepath):
+            return None
+
+        try:
+            f = open(cachepath, 'r')
+            abspath, mtime, pyramids = pickle.load(f)
+            f.close()
+        except Exception, e:
+            logger.warn('cannot load envelope cache file %s: %s' % (
+                cachepath, e))
+            return None
+
+        if abspath != file.abspath or mtime != file.mtime:
+            return None
+
+        return pyramids
+
+    def _dump(self, file, pyramids):
+        cachepath = self._cachepath(file.abspath)
+        tmpfn = cachepath+'.%i.tmp' % os.getpid()
+        f = open(tmpfn, 'w')
+        pickle.dump((file.abspath, file.mtime, pyramids), f,
+                    pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmpfn, cachepath)
+
+    def _remember(self, k, mtime, pyramids):
+        nbytes = 0
+        for levels in pyramids.values():
+            for (_, mins, maxs) in levels:
+                nbytes += mins.nbytes + maxs.nbytes
+
+        if k in self._pyramids:
+            self._forget(k)
+
+        self._pyramids[k] = mtime, pyramids, nbytes
+        self._order.append(k)
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes and len(self._order) > 1:
+            self._forget(self._order[0])
+
+    def _forget(self, k):
+        self._order.remove(k)
+        _, _, nbytes = self._pyramids.pop(k)
+        self._nbytes -= nbytes
+
+
+def get_envelope_cache(cachedir=None):
+    '''Get global EnvelopeCache object for given directory.
+
+    By default, envelopes are stored in the subdirectory ``envelopes`` of the
+    configured cache directory.
+    '''
+
+    if cachedir is None:
+        cachedir = pjoin(config.config().cache_dir, 'envelopes')
+
+    if cachedir not in EnvelopeCache.caches:
+        EnvelopeCache.caches[cachedir] = EnvelopeCache(cachedir)
+
+    return EnvelopeCache.caches[cachedir]
+
+
+def envelope_trace(tr, levels, tmin, tmax, resolution):
+    '''Make trace from suitable level of a min/max envelope pyramid.
+
+    The coarsest level with bins not wider than *resolution* is selected. The
+    returned trace has min and max values of consecutive bins interleaved, so
+    that drawing it as a line covers the range of the original data.
+    '''
+
+    nblock, mins, maxs = levels[0]
+    for (nblock_, mins_, maxs_) in levels[1:]:
+        if nblock_ * tr.deltat > resolution:
+            break
+
+        nblock, mins, maxs = nblock_, mins_, maxs_
+
+    tbin = nblock * tr.deltat
+    ibin_min = max(0, int(math.floor((tmin - tr.tmin) / tbin)))
+    ibin_max = min(mins.size, int(math.ceil((tmax - tr.tmin) / tbin)) + 1)
+    if ibin_max <= ibin_min:
+        return None
+
+    ydata = num.empty(2*(ibin_max-ibin_min), dtype=num.float32)
+    ydata[0::2] = mins[ibin_min:ibin_max]
+    ydata[1::2] = maxs[ibin_min:ibin_max]
+
+    return trace.Trace(
+        tr.network, tr.station, tr.location, tr.channel,
+        tmin=tr.tmin + ibin_min*tbin, deltat=0.5*tbin, ydata=ydata,
+        meta={'envelope': True})
     
 def loader(filenames, fileformat, cache, filename_attributes, show_progress=True, update_progress=None):
 
@@ -852,6 +1062,10 @@ class Pile(TracesGroup):
         self.open_files = {}
         self.listeners = []
         self.abspaths = set()
+
+        # guards the file structure and data loading, which may be accessed
+        # from background threads (e.g. in the pile viewer)
+        self.lock = threading.RLock()
     
     def add_listener(self, obj):
         self.listeners.append(weakref.ref(obj))
@@ -871,22 +1085,28 @@ class Pile(TracesGroup):
             self.add_file(file)
         
     def add_file(self, file):
-        if file.abspath is not None and file.abspath in self.abspaths:
-            logger.warn('File already in pile: %s' % file.abspath)
-            return
-
-        subpile = self.dispatch(file)
-        subpile.add_file(file)
-        if file.abspath is not None:
-            self.abspaths.add(file.abspath)
+        with self.lock:
+            if file.abspath is not None and file.abspath in self.abspaths:
+                logger.warn('File already in pile: %s' % file.abspath)
+                return
+
+            subpile = self.dispatch(file)
+            subpile.add_file(file)
+            if file.abspath is not None:
+                self.abspaths.add(file.abspath)
     
     def remove_file(self, file):
-        subpile = file.get_parent()
-        subpile.remove_file(file)
-        if file.abspath is not None:
-            self.abspaths.remove(file.abspath)
+        with self.lock:
+            subpile = file.get_parent()
+            subpile.remove_file(file)
+            if file.abspath is not None:
+                self.abspaths.remove(file.abspath)
         
     def remove_files(self, files):
+        with self.lock:
+            self._remove_files(files)
+
+    def _remove_files(self, files):
         subpile_files = {}
         for file in files:
             subpile = file.get_parent()
@@ -1026,29 +1246,78 @@ class Pile(TracesGroup):
             wmin, wmax = tmin+iwin*tinc, min(tmin+(iwin+1)*tinc, tmax)
             eps = tinc*1e-6
             if wmin >= tmax-eps: break
-            chopped, used_files = self.chop(wmin-tpad, wmax+tpad, group_selector, trace_selector, snap, include_last, load_data) 
-            for file in used_files - open_files:
-                # increment datause counter on newly opened files
-                file.use_data()
+            with self.lock:
+                chopped, used_files = self.chop(wmin-tpad, wmax+tpad, group_selector, trace_selector, snap, include_last, load_data) 
+                for file in used_files - open_files:
+                    # increment datause counter on newly opened files
+                    file.use_data()
                 
-            open_files.update(used_files)
+                open_files.update(used_files)
             
             processed = self._process_chopped(chopped, degap, maxgap, maxlap, want_incomplete, wmax, wmin, tpad)
             yield processed
                         
-            unused_files = open_files - used_files
+            with self.lock:
+                unused_files = open_files - used_files
             
-            while unused_files:
-                file = unused_files.pop()
-                file.drop_data()
-                open_files.remove(file)
+                while unused_files:
+                    file = unused_files.pop()
+                    file.drop_data()
+                    open_files.remove(file)
                 
             iwin += 1
         
         if not keep_current_files_open:
-            while open_files:
-                file = open_files.pop()
-                file.drop_data()
+            with self.lock:
+                while open_files:
+                    file = open_files.pop()
+                    file.drop_data()
+
+    def envelopes(self, tmin, tmax, resolution, group_selector=None,
+                  trace_selector=None, cache=None):
+
+        '''Get min/max envelopes of the data in a time window.
+
+        :param tmin: start time
+        :param tmax: end time
+        :param resolution: desired time resolution [s], e.g. the time span
+            covered by a screen pixel
+        :param group_selector: filter callback taking :py:class:`TracesGroup`
+            objects
+        :param trace_selector: filter callback taking
+            :py:class:`pyrocko.trace.Trace` objects
+        :param cache: :py:class:`EnvelopeCache` object, by default the one
+            returned by :py:func:`get_envelope_cache`
+        :returns: list of :py:class:`pyrocko.trace.Trace` objects with
+            interleaved min and max values (see :py:func:`envelope_trace`)
+
+        Envelopes are computed once per file, which requires loading the full
+        data. Subsequent queries only read the (much smaller) envelopes.
+        '''
+
+        if cache is None:
+            cache = get_envelope_cache()
+
+        envelopes = []
+        pyramids = {}
+        with self.lock:
+            traces = self.relevant(tmin, tmax, group_selector, trace_selector)
+            for tr in traces:
+                if tr.file is None:
+                    continue
+
+                if tr.file not in pyramids:
+                    pyramids[tr.file] = cache.get(tr.file)
+
+                levels = pyramids[tr.file].get(envelope_key(tr), None)
+                if levels is None:
+                    continue
+
+                etr = envelope_trace(tr, levels, tmin, tmax, resolution)
+                if etr is not None:
+                    envelopes.append(etr)
+
+        return envelopes
 
     def all(self, *args, **kwargs):
         '''Shortcut to aggregate :py:meth:`chopper` output into a single list.'''
@@ -1140,8 +1409,9 @@ class Pile(TracesGroup):
    
     def reload_modified(self):
         modified = False
-        for subpile in self.subpiles.values():
-            modified |= subpile.reload_modified()
+        with self.lock:
+            for subpile in self.subpiles.values():
+                modified |= subpile.reload_modified()
         
         return modified
     
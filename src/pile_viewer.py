@@ -1,4 +1,5 @@
 import os, time, calendar, datetime, signal, re, math, logging, operator, copy
+import threading
 from itertools import groupby
 
 import numpy as num 
@@ -10,7 +11,7 @@ from pyrocko.util import hpfloat
 
 from pyrocko.gui_util import ValControl, LinValControl, Marker, EventMarker,\
     PhaseMarker, make_QPolygonF, draw_label, Label, gmtime_x, mystrftime, \
-    Progressbars
+    Progressbars, MarkerStore
 
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
@@ -568,6 +569,370 @@ fkey_map = dict(zip((Qt.Key_F1, Qt.Key_F2, Qt.Key_F3, Qt.Key_F4, Qt.Key_F5, Qt.K
 class PileViewerMainException(Exception):
     pass
 
+class CutoutCancelled(Exception):
+    pass
+
+
+class CutoutRequest(object):
+    '''Description of a processing job for the traces shown in the viewer.
+
+    All parameters are copied from the viewer when the request is created,
+    so that the processing can run in a background thread without touching
+    the GUI state.
+    '''
+
+    def __init__(self, pile, tmin, tmax, tsee, key, trace_selector, degap,
+                 lowpass, highpass, fft_filtering, lphp, ads, rotate,
+                 envelopes, min_deltat_allow, min_deltat_wo_decimate,
+                 resolution, accessor_id, tf_cache,
+                 pre_process_hooks, post_process_hooks):
+
+        self.pile = pile
+        self.tmin = tmin
+        self.tmax = tmax
+        self.tsee = tsee
+        self.key = key
+        self.trace_selector = trace_selector
+        self.degap = degap
+        self.lowpass = lowpass
+        self.highpass = highpass
+        self.fft_filtering = fft_filtering
+        self.lphp = lphp
+        self.ads = ads
+        self.rotate = rotate
+        self.envelopes = envelopes
+        self.min_deltat_allow = min_deltat_allow
+        self.min_deltat_wo_decimate = min_deltat_wo_decimate
+        self.resolution = resolution
+        self.accessor_id = accessor_id
+        self.tf_cache = tf_cache
+        self.pre_process_hooks = pre_process_hooks
+        self.post_process_hooks = post_process_hooks
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise CutoutCancelled()
+
+    def covers(self, tmin, tmax):
+        return self.tmin <= tmin and tmax <= self.tmax
+
+    def iter_process(self):
+        '''Process traces, yielding ``(final, traces)`` tuples.
+
+        If envelopes of dense data are to be shown, these are cheap to get
+        and are yielded first as a coarse preview (``final=False``), then the
+        complete set of processed traces is yielded (``final=True``).
+        Raises :py:exc:`CutoutCancelled` when :py:meth:`cancel` has been
+        called in the meantime.
+        '''
+
+        pile = self.pile
+        min_deltat_allow = self.min_deltat_allow
+
+        envelope_traces = []
+        if self.envelopes and pile.deltatmin < min_deltat_allow:
+            group_selector = lambda gr: gr.deltatmin < min_deltat_allow
+            if self.trace_selector is not None:
+                trace_selectorx = lambda tr: tr.deltat < min_deltat_allow \
+                    and self.trace_selector(tr)
+            else:
+                trace_selectorx = lambda tr: tr.deltat < min_deltat_allow
+
+            envelope_traces = pile.envelopes(
+                self.tmin, self.tmax, self.resolution,
+                group_selector=group_selector,
+                trace_selector=trace_selectorx)
+
+            self.check_cancelled()
+            if pile.deltatmax >= min_deltat_allow:
+                yield False, self.post_process_hooks(list(envelope_traces))
+
+        processed_traces = self.process_traces()
+        processed_traces.extend(envelope_traces)
+        processed_traces = self.post_process_hooks(processed_traces)
+        self.check_cancelled()
+        yield True, processed_traces
+
+    def process_traces(self):
+        processed_traces = []
+        min_deltat_allow = self.min_deltat_allow
+        lowpass, highpass = self.lowpass, self.highpass
+
+        if self.pile.deltatmax >= min_deltat_allow:
+
+            group_selector = lambda gr: gr.deltatmax >= min_deltat_allow
+            if self.trace_selector is not None:
+                trace_selectorx = lambda tr: tr.deltat >= min_deltat_allow \
+                    and self.trace_selector(tr)
+            else:
+                trace_selectorx = lambda tr: tr.deltat >= min_deltat_allow
+
+            freqs = [f for f in (highpass, lowpass) if f is not None]
+
+            tpad = 0
+            if freqs:
+                tpad = max(1./min(freqs), self.tsee)
+
+            for traces in self.pile.chopper(
+                    tmin=self.tmin, tmax=self.tmax, tpad=tpad,
+                    want_incomplete=True,
+                    degap=self.degap,
+                    maxgap=gap_lap_tolerance,
+                    maxlap=gap_lap_tolerance,
+                    keep_current_files_open=True,
+                    group_selector=group_selector,
+                    trace_selector=trace_selectorx,
+                    accessor_id=self.accessor_id,
+                    snap=(math.floor, math.ceil),
+                    include_last=True):
+
+                self.check_cancelled()
+                traces = self.pre_process_hooks(traces)
+
+                for trace in traces:
+                    self.check_cancelled()
+                    if not (trace.meta and 'tabu' in trace.meta and
+                            trace.meta['tabu']):
+                        self.filter_trace(trace)
+
+                    processed_traces.append(trace)
+
+        if self.rotate != 0.0:
+            phi = self.rotate/180.*math.pi
+            cphi = math.cos(phi)
+            sphi = math.sin(phi)
+
+            # index second components by station, to avoid comparing all
+            # pairs of traces
+            seconds = {}
+            for b in processed_traces:
+                if b.channel.lower().endswith('e'):
+                    kind = 'ne'
+                elif b.channel.endswith('2'):
+                    kind = '12'
+                else:
+                    continue
+
+                seconds.setdefault(b.nslc_id[:3] + (kind,), []).append(b)
+
+            for a in processed_traces:
+                if a.channel.lower().endswith('n'):
+                    kind = 'ne'
+                elif a.channel.endswith('1'):
+                    kind = '12'
+                else:
+                    continue
+
+                for b in seconds.get(a.nslc_id[:3] + (kind,), []):
+                    if (abs(a.deltat-b.deltat) < a.deltat*0.001 and abs(a.tmin-b.tmin) < a.deltat*0.01 and
+                        len(a.get_ydata()) == len(b.get_ydata())):
+
+                        aydata = a.get_ydata()*cphi+b.get_ydata()*sphi
+                        bydata =-a.get_ydata()*sphi+b.get_ydata()*cphi
+                        a.set_ydata(aydata)
+                        b.set_ydata(bydata)
+
+        return processed_traces
+
+    def filter_trace(self, trace):
+        lowpass, highpass = self.lowpass, self.highpass
+        if self.fft_filtering:
+            if lowpass is not None or highpass is not None:
+
+                it = num.arange(trace.data_len(), dtype=num.float)
+                detr_data, m, b = detrend(it, trace.get_ydata())
+
+                trace.set_ydata(detr_data)
+
+                freqs, fdata = trace.spectrum(pad_to_pow2=True, tfade=None)
+
+                nfreqs = fdata.size
+
+                key = (trace.deltat, nfreqs)
+
+                if key not in self.tf_cache:
+                    resps = []
+                    if lowpass is not None:
+                        resps.append(pyrocko.trace.ButterworthResponse(order=4, corner=lowpass, typ='low'))
+                    if highpass is not None:
+                        resps.append(pyrocko.trace.ButterworthResponse(order=4, corner=highpass, typ='high'))
+
+                    resp = pyrocko.trace.MultiplyResponse(resps)
+                    self.tf_cache[key] = resp.evaluate(freqs)
+
+                filtered_data = num.fft.irfft(fdata*self.tf_cache[key])[:trace.data_len()]
+
+                retrended_data = retrend(it, filtered_data, m, b)
+
+                trace.set_ydata(retrended_data)
+
+        else:
+
+            if self.ads and lowpass is not None:
+                while trace.deltat < self.min_deltat_wo_decimate:
+                    trace.downsample(2, demean=False)
+
+            if not self.lphp and (lowpass is not None and highpass is not None and
+                lowpass < 0.5/trace.deltat and
+                highpass < 0.5/trace.deltat and
+                highpass < lowpass):
+                trace.bandpass(2, highpass, lowpass)
+            else:
+                if lowpass is not None:
+                    if lowpass < 0.5/trace.deltat:
+                        trace.lowpass(4, lowpass, demean=False)
+
+                if highpass is not None:
+                    if lowpass is None or highpass < lowpass:
+                        if highpass < 0.5/trace.deltat:
+                            trace.highpass(4, highpass)
+
+
+class CutoutCache(object):
+    '''Keeps the processed traces of the last few viewer states.
+
+    Entries are looked up by the processing state key (filter settings,
+    rotation, ...) and may be used for any time window within the time range
+    they have been computed for. The least recently used entries are dropped
+    when more than *nmax* are stored.
+    '''
+
+    def __init__(self, nmax=8):
+        self.nmax = nmax
+        self._entries = {}
+        self._order = []
+
+    def put(self, key, tmin, tmax, traces):
+        self._entries[key] = (tmin, tmax, traces)
+        self._touch(key)
+        while len(self._order) > self.nmax:
+            del self._entries[self._order.pop(0)]
+
+    def get(self, key, tmin, tmax):
+        '''Get traces for *key* if they cover the time window, else None.'''
+
+        if key not in self._entries:
+            return None
+
+        etmin, etmax, traces = self._entries[key]
+        if etmin <= tmin and tmax <= etmax:
+            self._touch(key)
+            return traces
+
+        return None
+
+    def get_stale(self, key):
+        '''Get traces for *key*, regardless of the time range covered.'''
+
+        if key not in self._entries:
+            return None
+
+        return self._entries[key][2]
+
+    def get_latest(self):
+        '''Get most recently used traces, for any key.'''
+
+        if not self._order:
+            return None
+
+        return self._entries[self._order[-1]][2]
+
+    def clear(self):
+        self._entries = {}
+        self._order = []
+
+    def _touch(self, key):
+        if key in self._order:
+            self._order.remove(key)
+
+        self._order.append(key)
+
+
+class CutoutWorker(QThread):
+    '''Processes :py:class:`CutoutRequest` jobs in a background thread.
+
+    Only the most recently submitted request is of interest: submitting a
+    new request cancels the one currently being processed. Results are sent
+    with the ``cutout_ready(PyQt_PyObject)`` signal as ``(request, final,
+    traces)`` tuples.
+    '''
+
+    def __init__(self, parent=None):
+        QThread.__init__(self, parent)
+        self._condition = threading.Condition()
+        self._pending = None
+        self._current = None
+        self._stopped = False
+
+    def submit(self, request):
+        with self._condition:
+            if self._current is not None:
+                self._current.cancel()
+
+            self._pending = request
+            self._condition.notify()
+
+        if not self.isRunning():
+            self.start()
+
+    def busy_with(self, key, tmin, tmax):
+        '''Check if a request matching the given state is in progress.'''
+
+        with self._condition:
+            for request in (self._pending, self._current):
+                if request is not None and not request.cancelled and \
+                        request.key == key and request.covers(tmin, tmax):
+                    return True
+
+        return False
+
+    def cancel(self):
+        with self._condition:
+            for request in (self._pending, self._current):
+                if request is not None:
+                    request.cancel()
+
+            self._pending = None
+
+    def stop(self):
+        self.cancel()
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+                request, self._pending = self._pending, None
+                self._current = request
+
+            try:
+                for final, traces in request.iter_process():
+                    self.emit(SIGNAL('cutout_ready(PyQt_PyObject)'),
+                              (request, final, traces))
+
+            except CutoutCancelled:
+                logger.debug('Processing of traces cancelled')
+
+            except Exception:
+                logger.exception('Processing of traces failed')
+
+            with self._condition:
+                self._current = None
+
+
 def MakePileViewerMainClass(base):
     
     class PileViewerMain(base):
@@ -599,13 +964,14 @@ def MakePileViewerMainClass(base):
             self.picking_down = None
             self.picking = None
             self.floating_marker = None
-            self.markers = []
+            self.markers = MarkerStore()
+            self.alerted_markers = []
             self.all_marker_kinds = (0,1,2,3,4,5)
             self.visible_marker_kinds = self.all_marker_kinds 
             self.active_event_marker = None
             self.ignore_releases = 0
             self.message = None
-            self.reloaded = False
+            self.nreloads = 0
             self.pile_has_changed = False
             self.phase_names = { 1: 'P', 2: 'S', 3: 'R', 4: 'Q', 5: '?' } 
 
@@ -791,6 +1157,11 @@ def MakePileViewerMainClass(base):
             self.menuitem_degap.setCheckable(True)
             self.menuitem_degap.setChecked(True)
             self.menu.addAction(self.menuitem_degap)
+
+            self.menuitem_envelopes = QAction('Show Envelopes of Dense Data', self.menu)
+            self.menuitem_envelopes.setCheckable(True)
+            self.menuitem_envelopes.setChecked(True)
+            self.menu.addAction(self.menuitem_envelopes)
             
             self.menuitem_fft_filtering = QAction('FFT Filtering', self.menu)
             self.menuitem_fft_filtering.setCheckable(True)
@@ -880,8 +1251,11 @@ def MakePileViewerMainClass(base):
             self.track_to_screen = Projection()
             self.track_to_nslc_ids = {}
         
-            self.old_vec = None
-            self.old_processed_traces = None
+            self.cutout_cache = CutoutCache()
+            self.cutout_preview = None
+            self.background_processing = True
+            self.cutout_worker = CutoutWorker(self)
+            self.connect( self.cutout_worker, SIGNAL('cutout_ready(PyQt_PyObject)'), self.cutout_ready )
             
             self.timer = QTimer( self )
             self.connect( self.timer, SIGNAL("timeout()"), self.periodical ) 
@@ -1297,6 +1671,7 @@ def MakePileViewerMainClass(base):
         def periodical(self):
             if self.menuitem_watch.isChecked():
                 if self.pile.reload_modified():
+                    self.nreloads += 1
                     self.update()
     
         def get_pile(self):
@@ -1304,6 +1679,7 @@ def MakePileViewerMainClass(base):
         
         def pile_changed(self, what):
             self.pile_has_changed = True
+            self.cutout_worker.cancel()
             self.emit(SIGNAL('pile_has_changed_signal()'))
             if self.automatic_updates:
                 self.update()
@@ -1473,6 +1849,10 @@ def MakePileViewerMainClass(base):
                             marker.set_event_hash(None)
 
         def add_marker(self, marker):
+            # markers already shown are ignored
+            if marker in self.markers:
+                return
+
             self.markers.append(marker)
             self.emit(
                 SIGNAL('markers_added(int,int)'),
@@ -1481,18 +1861,19 @@ def MakePileViewerMainClass(base):
         def add_markers(self, markers):
             len_before = len(self.markers)
             self.markers.extend(markers)
-            self.emit(
-                SIGNAL('markers_added(int,int)'), 
-                len_before, len(self.markers)-1)
+            if len(self.markers) > len_before:
+                self.emit(
+                    SIGNAL('markers_added(int,int)'), 
+                    len_before, len(self.markers)-1)
 
         def remove_marker(self, marker):
             '''Remove a *marker* from the :py:class:`PileViewer`.
 
             :param marker: :py:class:`Marker` (or subclass) instance'''
             try:
-                indx = [self.markers.index(marker)]
+                indx = self.markers.index(marker)
                 self.remove_marker_from_menu(indx, indx)
-                self.markers.remove(marker)
+                self.markers.remove_range(indx, indx+1)
                 if marker is self.active_event_marker:
                     self.active_event_marker.set_active(False)
                     self.active_event_marker = None
@@ -1506,36 +1887,32 @@ def MakePileViewerMainClass(base):
             :param markers: list of :py:class:`Marker` (or subclass)
                             instances'''
             try:
-                indxs = [self.markers.index(m) for m in markers]
+                indxs = sorted(set(self.markers.index(m) for m in markers))
             except ValueError:
                 return
 
             chunks = make_chunks(indxs)
             for chunk in chunks[::-1]:
-                try:
-                    self.remove_marker_from_menu(min(chunk), max(chunk))
-                    about_to_remove = [self.markers[i_m] for i_m in chunk]
-
-                    for marker in about_to_remove:
-                        self.markers.remove(marker)
-                        if marker is self.active_event_marker:
-                            self.active_event_marker.set_active(False)
-                            self.active_event_marker = None
+                self.remove_marker_from_menu(min(chunk), max(chunk))
+                about_to_remove = [self.markers[i_m] for i_m in chunk]
+                self.markers.remove_range(min(chunk), max(chunk)+1)
 
-                except ValueError:
-                    pass
+                for marker in about_to_remove:
+                    if marker is self.active_event_marker:
+                        self.active_event_marker.set_active(False)
+                        self.active_event_marker = None
 
         def remove_marker_from_menu(self, istart, istop):
             self.emit(SIGNAL('markers_removed(int, int)'), istart, istop)
 
         def set_markers(self, markers):
-            self.markers = markers
+            self.markers = MarkerStore(markers)
     
         def selected_markers(self):
             return [ marker for marker in self.markers if marker.is_selected() ]
    
         def get_markers(self):
-            return self.markers
+            return list(self.markers)
 
         def mousePressEvent( self, mouse_ev ):
             self.show_all = False
@@ -1616,7 +1993,7 @@ def MakePileViewerMainClass(base):
             mouset = self.time_projection.rev(x)
             deltat = (self.tmax-self.tmin)*self.click_tolerance/self.width()
             relevant_nslc_ids = None
-            for marker in self.markers:
+            for marker in self.markers.in_range(mouset-deltat, mouset+deltat):
                 if marker.kind not in self.visible_marker_kinds:
                     continue
 
@@ -1640,7 +2017,13 @@ def MakePileViewerMainClass(base):
             needupdate = False
             haveone = False
             relevant_nslc_ids = self.nslc_ids_under_cursor(x,y)
-            for marker in self.markers:
+            candidates = self.markers.in_range(mouset-deltat, mouset+deltat)
+            candidate_ids = set(id(marker) for marker in candidates)
+            candidates.extend(marker for marker in self.alerted_markers
+                              if id(marker) not in candidate_ids)
+
+            self.alerted_markers = []
+            for marker in candidates:
                 if marker.kind not in self.visible_marker_kinds:
                     continue
 
@@ -1662,6 +2045,7 @@ def MakePileViewerMainClass(base):
                     
                 if state:
                     haveone = True
+                    self.alerted_markers.append(marker)
                 oldstate = marker.is_alerted()
                 if oldstate != state:
                     needupdate = True
@@ -1708,7 +2092,7 @@ def MakePileViewerMainClass(base):
                     tgo = tmid
 
                 if dir.lower() == 'n':
-                    for marker in sorted(self.markers, key=operator.attrgetter('tmin')):
+                    for marker in self.markers.iter_after(tmid):
                         t = marker.tmin
                         if t > tmid and marker.kind in self.visible_marker_kinds \
                                     and (dir == 'n' or isinstance(marker, EventMarker)):
@@ -1717,7 +2101,7 @@ def MakePileViewerMainClass(base):
                             tgo = t
                             break
                 else: 
-                    for marker in sorted(self.markers, key=operator.attrgetter('tmin'), reverse=True):
+                    for marker in self.markers.iter_before(tmid):
                         t = marker.tmin
                         if t < tmid and marker.kind in self.visible_marker_kinds \
                                     and (dir == 'p' or isinstance(marker, EventMarker)):
@@ -1735,7 +2119,7 @@ def MakePileViewerMainClass(base):
     
             elif keytext == 'r':
                 if self.pile.reload_modified():
-                    self.reloaded = True
+                    self.nreloads += 1
    
             elif keytext == 'R':
                 self.setup_snufflings()
@@ -1744,13 +2128,12 @@ def MakePileViewerMainClass(base):
                 self.remove_markers(self.selected_markers())
 
             elif keytext == 'a':
-                for marker in self.markers:
+                self.deselect_all()
+                for marker in self.markers.in_range(self.tmin, self.tmax):
                     if ((self.tmin <= marker.get_tmin() <= self.tmax or
                         self.tmin <= marker.get_tmax() <= self.tmax) and
                         marker.kind in self.visible_marker_kinds):
                         marker.set_selected(True)
-                    else:
-                        marker.set_selected(False)
 
             elif keytext == 'A':
                 for marker in self.markers:
@@ -1777,7 +2160,8 @@ def MakePileViewerMainClass(base):
                             lat,lon = old.lat, old.lon
 
                         event_marker.convert_to_event_marker(lat,lon)
-                        
+                        self.markers.update(event_marker)
+
                     self.set_active_event_marker(event_marker)
                     event = event_marker.get_event()
                     for marker in phase_markers:
@@ -1786,6 +2170,7 @@ def MakePileViewerMainClass(base):
                 else:
                     for marker in event_markers_in_spe:
                         marker.convert_to_event_marker()
+                        self.markers.update(marker)
             
             elif keytext in ('0', '1', '2', '3', '4', '5'):
                 for marker in self.selected_markers():
@@ -1853,10 +2238,9 @@ def MakePileViewerMainClass(base):
         def emit_selected_markers(self):
             _indexes = []
             selected_markers = self.selected_markers()
-            markers = self.get_markers()
             for sm in selected_markers:
-                if sm in markers:
-                    _indexes.append(markers.index(sm))
+                if sm in self.markers:
+                    _indexes.append(self.markers.index(sm))
             self.emit(SIGNAL('changed_marker_selection'), _indexes)
 
         def toggle_marker_editor(self):
@@ -2135,7 +2519,7 @@ def MakePileViewerMainClass(base):
             painter = QPainter()
             painter.begin(printer)
             page = printer.pageRect()
-            self.drawit(painter, printmode=False, w=page.width(), h=page.height())
+            self.drawit(painter, printmode=False, w=page.width(), h=page.height(), synchronous=True)
             painter.end()
             
             
@@ -2158,7 +2542,7 @@ def MakePileViewerMainClass(base):
 
             painter = QPainter()
             painter.begin(generator)
-            self.drawit(painter, printmode=False, w=w, h=h)
+            self.drawit(painter, printmode=False, w=w, h=h, synchronous=True)
             painter.end()
             
         def paintEvent(self, paint_ev ):
@@ -2245,8 +2629,8 @@ def MakePileViewerMainClass(base):
             """Returns two lists of indices:
             first indicates which markers should be labeled.
             second indicates which markers should be drawn."""
-            times = [m.tmin for m in markers]
-            m_projections = num.array(map(self.time_projection, times))
+            times = num.array([m.tmin for m in markers], dtype=num.float)
+            m_projections = self.time_projection(times)
             m_projections = num.floor(m_projections)
             u, indx = num.unique(m_projections, return_index=True)
             a = num.zeros(len(m_projections)+2)
@@ -2271,11 +2655,12 @@ def MakePileViewerMainClass(base):
 
         def draw_visible_markers(self, markers, p, vcenter_projection):
             """Draw non-overlapping *markers*."""
-            markers = filter(lambda x: x.get_tmin()<self.tmax and self.tmin<x.get_tmax(), self.markers)
+            markers = filter(lambda x: x.get_tmin()<self.tmax and self.tmin<x.get_tmax(), markers)
             markers = filter(lambda x: x.kind in self.visible_marker_kinds, markers)
             if len(markers)>500:
                 i_labels, i_markers = self.tobedrawn(markers, self.time_projection.get_out_range())
                 if len(i_markers)!=0:
+                    i_labels = set(i_labels)
                     for i_m in i_markers:
                         if i_m in i_labels:
                             with_label = True
@@ -2290,8 +2675,12 @@ def MakePileViewerMainClass(base):
                     m.draw(p, self.time_projection, vcenter_projection,
                            with_label=True)
 
-        def drawit(self, p, printmode=False, w=None, h=None):
-            """This performs the actual drawing."""
+        def drawit(self, p, printmode=False, w=None, h=None, synchronous=False):
+            """This performs the actual drawing.
+
+            Unless *synchronous* is set, trace processing is done in a
+            background thread and the view is updated when it has finished.
+            """
             
             self.timer_draw.start()
     
@@ -2353,11 +2742,13 @@ def MakePileViewerMainClass(base):
                 if self.floating_marker:
                     self.floating_marker.draw(p, self.time_projection, vcenter_projection)
  
-                self.draw_visible_markers(self.markers, p, vcenter_projection)
+                visible_markers = self.markers.in_range(self.tmin, self.tmax)
+                self.draw_visible_markers(visible_markers, p, vcenter_projection)
                 active_event_marker = self.get_active_event_marker()
                 if active_event_marker!=None:
                     active_event_marker.draw(p, self.time_projection, vcenter_projection, with_label=True)
-                self.draw_visible_markers(self.selected_markers(), p, vcenter_projection)
+                self.draw_visible_markers(
+                    [m for m in visible_markers if m.is_selected()], p, vcenter_projection)
                 primary_pen = QPen(QColor(*primary_color))
                 secondary_pen = QPen(QColor(*secondary_color))
                 p.setPen(primary_pen)
@@ -2374,7 +2765,8 @@ def MakePileViewerMainClass(base):
                 
                 processed_traces = self.prepare_cutout2(self.tmin, self.tmax, 
                                                     trace_selector=self.trace_selector, 
-                                                    degap=self.menuitem_degap.isChecked())
+                                                    degap=self.menuitem_degap.isChecked(),
+                                                    synchronous=synchronous or printmode)
                 
                 color_lookup = dict([ (k,i) for (i,k) in enumerate(self.color_keys) ])
                 
@@ -2544,7 +2936,8 @@ def MakePileViewerMainClass(base):
                         if self.floating_marker:
                             self.floating_marker.draw_trace(self, p, trace, self.time_projection, trace_projection, 1.0)
                             
-                        for marker in self.markers:
+                        for marker in self.markers.in_range(
+                                self.tmin, self.tmax, nslc_id=trace.nslc_id):
                             if marker.get_tmin() < self.tmax and self.tmin < marker.get_tmax():
                                 if marker.kind in self.visible_marker_kinds:
                                     marker.draw_trace(self, p, trace, self.time_projection, trace_projection, 1.0)
@@ -2600,11 +2993,10 @@ def MakePileViewerMainClass(base):
             return ndecimate, tpad, tsee
 
         def clean_update(self):
-            self.old_processed_traces = None
+            self.cutout_cache.clear()
             self.update()
 
-
-        def prepare_cutout2(self, tmin, tmax, trace_selector=None, degap=True, nmax=6000):
+        def prepare_cutout2(self, tmin, tmax, trace_selector=None, degap=True, nmax=6000, synchronous=False):
 
             nmax = self.visible_length
 
@@ -2634,133 +3026,57 @@ def MakePileViewerMainClass(base):
             fft_filtering = self.menuitem_fft_filtering.isChecked()
             lphp = self.menuitem_lphp.isChecked()
             ads = self.menuitem_allowdownsampling.isChecked()
-            
+            envelopes = self.menuitem_envelopes.isChecked() and \
+                self.lowpass is None and self.highpass is None
+
+            # resolution of envelopes, rounded down to a power of two so that
+            # small zoom steps can reuse cached envelopes
+            resolution = None
+            if envelopes:
+                resolution = 2.0**math.floor(math.log(tsee/nmax, 2.0))
+
             # state vector to decide if cached traces can be used
-            vec = (tmin, tmax, trace_selector, degap, self.lowpass, self.highpass, fft_filtering, lphp,
+            key = (trace_selector, degap, self.lowpass, self.highpass, fft_filtering, lphp,
                 min_deltat_allow, self.rotate, self.shown_tracks_range,
-                ads, self.pile.get_update_count())
-                
-            if (self.old_vec and 
-                self.old_vec[0] <= vec[0] and vec[1] <= self.old_vec[1] and
-                vec[2:] == self.old_vec[2:] and not (self.reloaded or self.menuitem_watch.isChecked()) and
-                self.old_processed_traces is not None):
+                ads, envelopes, resolution, self.pile.get_update_count(),
+                self.nreloads)
 
+            processed_traces = self.cutout_cache.get(key, tmin_, tmax_)
+            if processed_traces is not None:
                 logger.debug('Using cached traces')
-                processed_traces = self.old_processed_traces
-                
-            else:
-                self.old_vec = vec
-                
-                processed_traces = []
-                
-                if self.pile.deltatmax >= min_deltat_allow:
-                    
-
-                    group_selector = lambda gr: gr.deltatmax >= min_deltat_allow 
-                    if trace_selector is not None:
-                        trace_selectorx = lambda tr: tr.deltat >= min_deltat_allow and trace_selector(tr)
-                    else:
-                        trace_selectorx = lambda tr: tr.deltat >= min_deltat_allow
-
-                    freqs = [ f for f in (self.highpass, self.lowpass) if f is not None ]
-                    
-                    tpad = 0
-                    if freqs:
-                        tpad = max(1./min(freqs), tsee) 
-                    
-                    for traces in self.pile.chopper( tmin=tmin, tmax=tmax, tpad=tpad,
-                                                    want_incomplete=True,
-                                                    degap=degap,
-                                                    maxgap=gap_lap_tolerance,
-                                                    maxlap=gap_lap_tolerance,
-                                                    keep_current_files_open=True, 
-                                                    group_selector=group_selector,
-                                                    trace_selector=trace_selectorx,
-                                                    accessor_id=id(self),
-                                                    snap=(math.floor, math.ceil),
-                                                    include_last=True):
-
-                        traces = self.pre_process_hooks(traces)
-
-                        for trace in traces:
-                            
-                            if not (trace.meta and 'tabu' in trace.meta and trace.meta['tabu']):
-                            
-                                if fft_filtering:
-                                    if self.lowpass is not None or self.highpass is not None:
-                                        
-                                        it = num.arange(trace.data_len(), dtype=num.float)
-                                        detr_data, m, b = detrend(it, trace.get_ydata()) 
-
-                                        trace.set_ydata(detr_data)
-
-                                        freqs, fdata = trace.spectrum(pad_to_pow2=True, tfade=None)
-
-                                        nfreqs = fdata.size
 
-                                        key = (trace.deltat, nfreqs)
-
-                                        if key not in self.tf_cache:
-                                            resps = []
-                                            if self.lowpass is not None:
-                                                resps.append(pyrocko.trace.ButterworthResponse(order=4, corner=self.lowpass, typ='low'))
-                                            if self.highpass is not None:
-                                                resps.append(pyrocko.trace.ButterworthResponse(order=4, corner=self.highpass, typ='high'))
-
-                                            resp = pyrocko.trace.MultiplyResponse(resps)
-                                            self.tf_cache[key] = resp.evaluate(freqs)
-
-                                        filtered_data = num.fft.irfft(fdata*self.tf_cache[key])[:trace.data_len()]
-                                        
-                                        retrended_data = retrend(it, filtered_data, m, b)
-                                        
-                                        trace.set_ydata(retrended_data)
-                                    
-                                else:
-                                    
-                                    if self.menuitem_allowdownsampling.isChecked() and self.lowpass is not None:
-                                        while trace.deltat < min_deltat_wo_decimate:
-                                            trace.downsample(2, demean=False)
+            else:
+                request = CutoutRequest(
+                    self.pile, tmin, tmax, tsee, key, trace_selector, degap,
+                    self.lowpass, self.highpass, fft_filtering, lphp, ads,
+                    self.rotate, envelopes, min_deltat_allow,
+                    min_deltat_wo_decimate, resolution, id(self),
+                    self.tf_cache, self.pre_process_hooks,
+                    self.post_process_hooks)
+
+                # snuffling hooks may touch GUI objects, so they must run in
+                # the GUI thread
+                if synchronous or not self.background_processing or \
+                        self.have_process_hooks():
+                    self.cutout_worker.cancel()
+                    processed_traces = []
+                    for final, traces in request.iter_process():
+                        processed_traces = traces
+
+                    self.cutout_cache.put(key, tmin, tmax, processed_traces)
 
-                                    
-                                    if not lphp and (self.lowpass is not None and self.highpass is not None and
-                                        self.lowpass < 0.5/trace.deltat and
-                                        self.highpass < 0.5/trace.deltat and
-                                        self.highpass < self.lowpass):
-                                        trace.bandpass(2,self.highpass, self.lowpass)
-                                    else:
-                                        if self.lowpass is not None:
-                                            if self.lowpass < 0.5/trace.deltat:
-                                                trace.lowpass(4,self.lowpass, demean=False)
-                                        
-                                        if self.highpass is not None:
-                                            if self.lowpass is None or self.highpass < self.lowpass:
-                                                if self.highpass < 0.5/trace.deltat:
-                                                    trace.highpass(4,self.highpass)
-                            
-                            processed_traces.append(trace)
-                    
-                if self.rotate != 0.0:
-                    phi = self.rotate/180.*math.pi
-                    cphi = math.cos(phi)
-                    sphi = math.sin(phi)
-                    for a in processed_traces:
-                        for b in processed_traces: 
-                            if (a.network == b.network and a.station == b.station and a.location == b.location and
-                                ((a.channel.lower().endswith('n') and b.channel.lower().endswith('e')) or
-                                (a.channel.endswith('1') and b.channel.endswith('2'))) and
-                                abs(a.deltat-b.deltat) < a.deltat*0.001 and abs(a.tmin-b.tmin) < a.deltat*0.01 and
-                                len(a.get_ydata()) == len(b.get_ydata())):
-                                
-                                aydata = a.get_ydata()*cphi+b.get_ydata()*sphi
-                                bydata =-a.get_ydata()*sphi+b.get_ydata()*cphi
-                                a.set_ydata(aydata)
-                                b.set_ydata(bydata)
+                else:
+                    if not self.cutout_worker.busy_with(key, tmin_, tmax_):
+                        self.cutout_worker.submit(request)
+
+                    # show what we have until the worker delivers
+                    processed_traces = self.cutout_cache.get_stale(key)
+                    if processed_traces is None:
+                        if self.cutout_preview and self.cutout_preview[0] == key:
+                            processed_traces = self.cutout_preview[1]
+                        else:
+                            processed_traces = self.cutout_cache.get_latest() or []
 
-                processed_traces = self.post_process_hooks(processed_traces)
-                                
-                self.old_processed_traces = processed_traces
-            
             chopped_traces = []
             for trace in processed_traces:
                 try:
@@ -2774,7 +3090,29 @@ def MakePileViewerMainClass(base):
             
             self.timer_cutout.stop()
             return chopped_traces
+
+        def cutout_ready(self, result):
+            request, final, traces = result
+            if request.cancelled:
+                return
+
+            if final:
+                self.cutout_cache.put(
+                    request.key, request.tmin, request.tmax, traces)
+                self.cutout_preview = None
+            else:
+                self.cutout_preview = request.key, traces
+
+            self.update()
        
+        def have_process_hooks(self):
+            for snuffling in self.snufflings:
+                if snuffling._pre_process_hook_enabled or \
+                        snuffling._post_process_hook_enabled:
+                    return True
+
+            return False
+
         def pre_process_hooks(self, traces):
             for snuffling in self.snufflings:
                 if snuffling._pre_process_hook_enabled:
@@ -3053,6 +3391,7 @@ def MakePileViewerMainClass(base):
      
         def myclose(self, return_tag=''):
             self.timer.stop()
+            self.cutout_worker.stop()
             if self.follow_timer is not None:
                 self.follow_timer.stop()
             self.window().close()
@@ -227,10 +227,244 @@ static PyObject* w_antidrift(PyObject *dummy, PyObject *args) {
     return Py_None;
 }
 
+static int64_t argmax(int64_t n, const double *y) {
+    /* like numpy.argmax, NaNs win */
+    int64_t i, imax;
+    imax = 0;
+    for (i=0; i<n; i++) {
+        if (y[i] != y[i]) {
+            return i;
+        }
+        if (y[i] > y[imax]) {
+            imax = i;
+        }
+    }
+    return imax;
+}
+
+static int64_t deadtime_end(int64_t n, const double *y, int64_t ibeg,
+                            int64_t nblock) {
+
+    /* find first downward crossing of zero of the cumulative sum of log(y),
+     * starting at ibeg; returns n if there is none */
+
+    int64_t r;
+    double s;
+    int below, prev_below;
+
+    s = 0.0;
+    prev_below = 0;
+    for (r=0; ibeg+r<n; r++) {
+        s += log(y[ibeg+r]);
+        below = s <= 0.0;
+        if (r % nblock != 0 && below && !prev_below) {
+            return ibeg+r;
+        }
+        prev_below = below;
+    }
+    return n;
+}
+
+static int peaks(
+        int64_t n,
+        const double *y,
+        int64_t ntrig,
+        const int64_t *itrigs,
+        int64_t nsearch,
+        int deadtime,
+        int64_t nblock,
+        double tmin,
+        double deltat,
+        double tsearch,
+        int64_t *npeaks,
+        int64_t *ipeaks,
+        double *tzeros) {
+
+    int64_t itrig, ibeg, iend, ipeak, izero;
+    double tpeak, tzero;
+
+    if (nsearch < 1 || nblock < 1) {
+        return INVALID_INPUT;
+    }
+
+    *npeaks = 0;
+    tzero = tmin;
+    for (itrig=0; itrig<ntrig; itrig++) {
+        ibeg = itrigs[itrig];
+        if (ibeg < 0 || ibeg >= n) {
+            return INVALID_INPUT;
+        }
+
+        iend = imin(n, ibeg + nsearch);
+        ipeak = ibeg + argmax(iend-ibeg, y+ibeg);
+        tpeak = tmin + ipeak*deltat;
+
+        if (tpeak < tzero) {
+            continue;
+        }
+
+        if (deadtime) {
+            izero = deadtime_end(n, y, ibeg, nblock);
+            if (izero == n) {
+                tzero = tmin + (n-1)*deltat;
+            } else {
+                tzero = tmin + izero*deltat;
+            }
+        } else {
+            tzero = ibeg*deltat + tmin + tsearch;
+        }
+
+        ipeaks[*npeaks] = ipeak;
+        tzeros[*npeaks] = tzero;
+        *npeaks += 1;
+    }
+
+    return SUCCESS;
+}
+
+static PyObject* w_peaks(PyObject *dummy, PyObject *args) {
+    PyObject *arr_y, *arr_itrigs, *arr_ipeaks, *arr_tzeros;
+    int64_t nsearch, nblock, ntrig, npeaks;
+    int deadtime;
+    double tmin, deltat, tsearch;
+
+    (void)dummy; /* silence warning */
+
+    if (!PyArg_ParseTuple(args, "OOLiLdddOO", &arr_y, &arr_itrigs, &nsearch,
+                          &deadtime, &nblock, &tmin, &deltat, &tsearch,
+                          &arr_ipeaks, &arr_tzeros)) {
+
+        PyErr_SetString(Error,
+            "usage peaks(y, itrigs, nsearch, deadtime, nblock, tmin, "
+            "deltat, tsearch, ipeaks_out, tzeros_out)");
+        return NULL;
+    }
+
+    if (!good_array(arr_y, NPY_DOUBLE) ||
+        !good_array(arr_itrigs, NPY_INT64) ||
+        !good_array(arr_ipeaks, NPY_INT64) ||
+        !good_array(arr_tzeros, NPY_DOUBLE)) {
+        return NULL;
+    }
+
+    ntrig = PyArray_SIZE((PyArrayObject*)arr_itrigs);
+    if (PyArray_SIZE((PyArrayObject*)arr_ipeaks) < ntrig ||
+        PyArray_SIZE((PyArrayObject*)arr_tzeros) < ntrig) {
+
+        PyErr_SetString(Error, "output arrays too short");
+        return NULL;
+    }
+
+    if (SUCCESS != peaks(
+            PyArray_SIZE((PyArrayObject*)arr_y),
+            (double*)PyArray_DATA((PyArrayObject*)arr_y),
+            ntrig,
+            (int64_t*)PyArray_DATA((PyArrayObject*)arr_itrigs),
+            nsearch, deadtime, nblock, tmin, deltat, tsearch,
+            &npeaks,
+            (int64_t*)PyArray_DATA((PyArrayObject*)arr_ipeaks),
+            (double*)PyArray_DATA((PyArrayObject*)arr_tzeros))) {
+
+        PyErr_SetString(Error, "peaks: invalid input");
+        return NULL;
+    }
+
+    return Py_BuildValue("L", npeaks);
+}
+
+static int fir_decimate(
+        int64_t nx, const double *x,
+        int64_t nb, const double *b,
+        int64_t q,
+        int64_t istart,
+        const double *history,
+        int64_t ny, double *y) {
+
+    /* Polyphase FIR decimation: only the kept output samples
+     *
+     *   y[k] = sum_j b[j] * xx[istart + k*q - j]
+     *
+     * are computed, where xx is the input signal preceded by nb-1 samples
+     * of history (xx[-1] == history[nb-2]). */
+
+    int64_t k, i, j, jmax;
+    double s;
+
+    if (q < 1 || nb < 1 || istart < 0 || (istart + (ny-1)*q >= nx && ny > 0)) {
+        return INVALID_INPUT;
+    }
+
+    for (k=0; k<ny; k++) {
+        i = istart + k*q;
+        s = 0.0;
+        jmax = imin(nb-1, i);
+        for (j=0; j<=jmax; j++) {
+            s += b[j] * x[i-j];
+        }
+        for (j=jmax+1; j<nb; j++) {
+            s += b[j] * history[nb-1 + i-j];
+        }
+        y[k] = s;
+    }
+
+    return SUCCESS;
+}
+
+static PyObject* w_fir_decimate(PyObject *dummy, PyObject *args) {
+    PyObject *arr_x, *arr_b, *arr_history, *arr_y;
+    int64_t q, istart, nb;
+
+    (void)dummy; /* silence warning */
+
+    if (!PyArg_ParseTuple(args, "OOLLOO", &arr_x, &arr_b, &q, &istart,
+                          &arr_history, &arr_y)) {
+
+        PyErr_SetString(Error,
+            "usage fir_decimate(x, b, q, istart, history, y_out)");
+        return NULL;
+    }
+
+    if (!good_array(arr_x, NPY_DOUBLE) ||
+        !good_array(arr_b, NPY_DOUBLE) ||
+        !good_array(arr_history, NPY_DOUBLE) ||
+        !good_array(arr_y, NPY_DOUBLE)) {
+        return NULL;
+    }
+
+    nb = PyArray_SIZE((PyArrayObject*)arr_b);
+    if (PyArray_SIZE((PyArrayObject*)arr_history) != nb-1) {
+        PyErr_SetString(Error, "history must have len(b)-1 samples");
+        return NULL;
+    }
+
+    if (SUCCESS != fir_decimate(
+            PyArray_SIZE((PyArrayObject*)arr_x),
+            (double*)PyArray_DATA((PyArrayObject*)arr_x),
+            nb,
+            (double*)PyArray_DATA((PyArrayObject*)arr_b),
+            q, istart,
+            (double*)PyArray_DATA((PyArrayObject*)arr_history),
+            PyArray_SIZE((PyArrayObject*)arr_y),
+            (double*)PyArray_DATA((PyArrayObject*)arr_y))) {
+
+        PyErr_SetString(Error, "fir_decimate: invalid input");
+        return NULL;
+    }
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
 static PyMethodDef Methods[] = {
     {"antidrift",  w_antidrift, METH_VARARGS,
         "correct time drift using sinc interpolation" },
 
+    {"peaks",  w_peaks, METH_VARARGS,
+        "find peaks following threshold crossings" },
+
+    {"fir_decimate",  w_fir_decimate, METH_VARARGS,
+        "polyphase FIR decimation" },
+
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
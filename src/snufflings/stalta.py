@@ -1,4 +1,4 @@
-from pyrocko import pile, trace, util, io
+from pyrocko import pile, trace, util, io, autopick
 import sys, os, math, time
 import numpy as num
 from pyrocko.snuffling import Param, Snuffling, Switch, Choice
@@ -10,6 +10,40 @@ m = 60.
 scalingmethods = ('[0-1]', '[-1/ratio,1]', '[-1/ratio,1] clipped to [0,1]')
 scalingmethod_map = dict([ (m,i+1) for (i,m) in enumerate(scalingmethods) ] )
 
+
+def sta_lta_centered_multi(traces, tshort, tlong, scalingmethod=1):
+    '''Like :py:meth:`pyrocko.trace.Trace.sta_lta_centered` but processing
+    all traces with same sampling rate and length in one go.'''
+
+    groups = {}
+    for tr in traces:
+        groups.setdefault((tr.deltat, tr.data_len()), []).append(tr)
+
+    for (deltat, nsamples), group in groups.iteritems():
+        nshort = tshort/deltat
+        nlong = tlong/deltat
+        # the centered kernel needs more than nlong samples; with exactly
+        # nlong samples, Trace.sta_lta_centered gave infinite ratios only
+        if nlong >= nsamples:
+            raise trace.TraceTooShort(
+                'Samples in trace: %s, samples needed: more than %s' % (
+                    nsamples, nlong))
+
+        ratios = autopick.sta_lta(
+            num.vstack([tr.get_ydata() for tr in group]), nshort, nlong,
+            method='centered')
+
+        if scalingmethod == 1:
+            ratios *= nshort/nlong
+        elif scalingmethod in (2, 3):
+            ratios = (ratios - 1.) / (nlong/nshort - 1.)
+
+        if scalingmethod == 3:
+            ratios = num.maximum(ratios, 0.)
+
+        for tr, ratio in zip(group, ratios):
+            tr.set_ydata(ratio)
+
 class DetectorSTALTA(Snuffling):
 
     '''
@@ -96,8 +130,12 @@ class DetectorSTALTA(Snuffling):
 
                 if self.highpass is not None:
                     trace.highpass(4, self.highpass, nyquist_exception=True)
-                
-                trace.sta_lta_centered(swin, lwin, scalingmethod=scalingmethod_map[self.scalingmethod])
+
+            sta_lta_centered_multi(
+                traces, swin, lwin,
+                scalingmethod=scalingmethod_map[self.scalingmethod])
+
+            for trace in traces:
                 trace.chop(trace.wmin, min(trace.wmax,tmax))
                 trace.set_codes(location='cg')
                 trace.meta = { 'tabu': True }
@@ -0,0 +1,292 @@
+'''Detection of repeating events by network cross-correlation.
+
+Templates, cut from the recordings of a known event at several stations and
+channels, are correlated with continuous data. The normalized cross
+correlation functions of all channels are shifted according to the moveout
+of the template channels and stacked with :py:func:`pyrocko.parstack.parstack`.
+Peaks of the stack above a threshold are reported as detections.
+
+Data is processed in windows from :py:meth:`pyrocko.pile.Pile.chopper`, so
+that the memory needed is bounded by the window length.
+'''
+
+import logging
+import numpy as num
+
+from pyrocko import trace, util
+from pyrocko.parstack import parstack
+
+logger = logging.getLogger('pyrocko.template_matching')
+
+
+class TemplateMatchingError(Exception):
+    pass
+
+
+def correlate_overlap_save(data, template, nfft=None):
+    '''Cross-correlate long data array with short template.
+
+    Uses the overlap-save method with FFT blocks of length *nfft* (by
+    default, four times the next power of two of the template length).
+
+    :returns: array ``c`` with ``c[i] = sum(data[i:i+m] * template)``,
+        ``m = len(template)``, for all ``i`` where the template fits into
+        the data (like ``numpy.correlate(data, template, mode='valid')``)
+    '''
+
+    m = template.size
+    n = data.size
+    nout = n - m + 1
+    if nout <= 0:
+        return num.zeros(0, dtype=num.float)
+
+    if nfft is None:
+        nfft = 4 * trace.nextpow2(m)
+
+    if nfft < m:
+        raise TemplateMatchingError('nfft must be at least template length')
+
+    nstep = nfft - m + 1
+    ftemplate = num.conj(num.fft.rfft(template, nfft))
+    out = num.empty(nout, dtype=num.float)
+    for istart in xrange(0, nout, nstep):
+        nvalid = min(nstep, nout - istart)
+        fdata = num.fft.rfft(data[istart:istart+nfft], nfft)
+        out[istart:istart+nvalid] = num.fft.irfft(
+            fdata * ftemplate, nfft)[:nvalid]
+
+    return out
+
+
+def correlate_normalized(data, template, nfft=None):
+    '''Normalized cross-correlation of data with a template.
+
+    The template and each data window are demeaned and normalized, so that
+    the result is in [-1, 1]. Windows with zero variance give zero.
+
+    :returns: array of length ``len(data) - len(template) + 1``, see
+        :py:func:`correlate_overlap_save`
+    '''
+
+    data = num.asarray(data, dtype=num.float)
+    data = data - num.mean(data)
+    template = num.asarray(template, dtype=num.float)
+    template = template - num.mean(template)
+    m = template.size
+
+    c = correlate_overlap_save(data, template, nfft)
+    if c.size == 0:
+        return c
+
+    s1 = trace.moving_sum(data, m, mode='valid')
+    s2 = trace.moving_sum(data**2, m, mode='valid')
+    norm = num.sqrt(num.maximum(s2 - s1**2 / m, 0.0)) * \
+        num.sqrt(num.sum(template**2))
+
+    eps = num.max(norm) * 1e-9
+    with num.errstate(divide='ignore', invalid='ignore'):
+        return num.where(norm > eps, c / norm, 0.0)
+
+
+class Template(object):
+    '''Multi-station, multi-channel template of an event.
+
+    :param traces: list of :py:class:`pyrocko.trace.Trace` objects, the
+        template waveforms, all with the same sampling interval and one
+        trace per channel
+    :param tref: reference time of the template, e.g. the event origin time;
+        detection times refer to it
+    :param name: name of the template, used in detections
+    '''
+
+    def __init__(self, traces, tref, name=None):
+        if not traces:
+            raise TemplateMatchingError('no traces given for template')
+
+        deltat = traces[0].deltat
+        channels = []
+        nslc_ids = set()
+        for tr in traces:
+            if abs(tr.deltat - deltat) > deltat * 1e-6:
+                raise TemplateMatchingError(
+                    'template traces must have same sampling interval')
+
+            if tr.nslc_id in nslc_ids:
+                raise TemplateMatchingError(
+                    'multiple template traces for channel %s' %
+                    '.'.join(tr.nslc_id))
+
+            nslc_ids.add(tr.nslc_id)
+            channels.append(
+                (tr.nslc_id, tr.tmin - tref, tr.get_ydata().astype(num.float)))
+
+        self.name = name
+        self.tref = tref
+        self.deltat = deltat
+        self.channels = channels
+
+    def get_nslc_ids(self):
+        return [nslc_id for (nslc_id, _, _) in self.channels]
+
+    def time_span(self):
+        '''Get extent of the template data relative to the reference time.'''
+
+        tmin = min(moveout for (_, moveout, _) in self.channels)
+        tmax = max(moveout + ydata.size * self.deltat
+                   for (_, moveout, ydata) in self.channels)
+
+        return tmin, tmax
+
+    def duration(self):
+        return max(ydata.size * self.deltat
+                   for (_, _, ydata) in self.channels)
+
+
+class Detection(object):
+    '''Detection of a template in continuous data.
+
+    :param template: the :py:class:`Template` which has been detected
+    :param time: time of the detection, corresponding to the template's
+        reference time
+    :param value: mean normalized cross-correlation of the channels
+    :param nchannels: number of channels which contributed
+    '''
+
+    def __init__(self, template, time, value, nchannels):
+        self.template = template
+        self.time = time
+        self.value = value
+        self.nchannels = nchannels
+
+    def __str__(self):
+        return '%s %s %.3f %i' % (
+            self.template.name, util.time_to_str(self.time), self.value,
+            self.nchannels)
+
+
+def stack_correlations(template, traces, tmin, nfft=None, nparallel=None):
+    '''Correlate template with data and stack over channels.
+
+    :param template: :py:class:`Template` object
+    :param traces: dict with :py:class:`pyrocko.trace.Trace` objects, keyed
+        by nslc code
+    :param tmin: time used as reference for sample offsets (should be close
+        to the data, to avoid large offsets)
+    :returns: :py:class:`pyrocko.trace.Trace` with the stack, where the time
+        axis refers to the template's reference time, and the number of
+        channels used; ``(None, 0)`` if no channel could be used
+    '''
+
+    deltat = template.deltat
+    arrays = []
+    offsets = []
+    for nslc_id, moveout, ydata in template.channels:
+        tr = traces.get(nslc_id, None)
+        if tr is None or abs(tr.deltat - deltat) > deltat * 1e-6 or \
+                tr.data_len() < ydata.size:
+            continue
+
+        arrays.append(correlate_normalized(tr.get_ydata(), ydata, nfft))
+        offsets.append(int(round((tr.tmin - moveout - tmin) / deltat)))
+
+    nchannels = len(arrays)
+    if nchannels == 0:
+        return None, 0
+
+    offsets = num.array(offsets, dtype=num.int32)
+    shifts = num.zeros((1, nchannels), dtype=num.int32)
+    weights = num.ones((1, nchannels), dtype=num.float) / nchannels
+    stack, offset = parstack(arrays, offsets, shifts, weights, 0,
+                             nparallel=nparallel)
+
+    stack_tr = trace.Trace(
+        '', template.name or '', '', 'CC',
+        tmin=tmin + offset*deltat, deltat=deltat, ydata=stack[0])
+
+    return stack_tr, nchannels
+
+
+def detect(pile, templates, threshold, tmin=None, tmax=None, tinc=None,
+           tsearch=None, min_channels=1, nfft=None, nparallel=None,
+           trace_selector=None, stack_traces=None):
+
+    '''Scan continuous data for occurrences of templates.
+
+    :param pile: :py:class:`pyrocko.pile.Pile` with the continuous data
+    :param templates: list of :py:class:`Template` objects
+    :param threshold: detection threshold for the mean normalized
+        cross-correlation
+    :param tmin,tmax: time span to scan, by default the time span of the pile
+    :param tinc: length of the processing windows, by default 100 times the
+        longest template duration; determines the memory needed
+    :param tsearch: peak search window (see
+        :py:meth:`pyrocko.trace.Trace.peaks`), by default the duration of
+        the template
+    :param min_channels: minimum number of channels needed for a detection
+    :param nfft: FFT length for the correlation, see
+        :py:func:`correlate_overlap_save`
+    :param nparallel: number of threads used for stacking
+    :param trace_selector: additional trace selector passed to the chopper
+    :param stack_traces: if a list is given, the stacked correlation traces
+        are appended to it (for inspection)
+    :returns: generator yielding :py:class:`Detection` objects in order of
+        the processing windows
+    '''
+
+    if not templates:
+        return
+
+    tmin_rel = min(t.time_span()[0] for t in templates)
+    tmax_rel = max(t.time_span()[1] for t in templates)
+    tpad = max(abs(tmin_rel), abs(tmax_rel)) + \
+        max(t.deltat for t in templates)
+
+    if tinc is None:
+        tinc = 100. * max(t.duration() for t in templates)
+
+    nslc_ids = set()
+    for template in templates:
+        nslc_ids.update(template.get_nslc_ids())
+
+    def selector(tr):
+        return tr.nslc_id in nslc_ids and (
+            trace_selector is None or trace_selector(tr))
+
+    for traces in pile.chopper(tmin=tmin, tmax=tmax, tinc=tinc, tpad=tpad,
+                               want_incomplete=True, trace_selector=selector):
+
+        if not traces:
+            continue
+
+        wmin, wmax = traces[0].wmin, traces[0].wmax
+
+        by_nslc = {}
+        for tr in traces:
+            if tr.nslc_id not in by_nslc or \
+                    tr.data_len() > by_nslc[tr.nslc_id].data_len():
+                by_nslc[tr.nslc_id] = tr
+
+        detections = []
+        for template in templates:
+            stack_tr, nchannels = stack_correlations(
+                template, by_nslc, wmin, nfft, nparallel)
+
+            if stack_tr is None or nchannels < min_channels:
+                continue
+
+            if stack_traces is not None:
+                stack_traces.append(stack_tr)
+
+            tsearch_ = tsearch
+            if tsearch_ is None:
+                tsearch_ = template.duration()
+
+            tpeaks, apeaks = stack_tr.peaks(threshold, tsearch_)
+            for tpeak, apeak in zip(tpeaks, apeaks):
+                if wmin <= tpeak < wmax:
+                    detections.append(
+                        Detection(template, tpeak, apeak, nchannels))
+
+        detections.sort(key=lambda d: d.time)
+        for detection in detections:
+            yield detection
@@ -79,10 +79,19 @@ etopo1_all = [
 dems = srtmgl3_all + etopo1_all
 
 
-def make_all_missing_decimated():
+def make_all_missing_decimated(nworkers=1):
+    '''
+    Make missing tiles of all decimated DEMs.
+
+    :param nworkers: number of parallel processes to use, ``None`` to use all
+        cores
+
+    The DEMs are processed level by level, each level with parallel workers.
+    '''
+
     for dem in dems:
         if isinstance(dem, dataset.DecimatedTiledGlobalDataset):
-            dem.make_all_missing()
+            dem.make_all_missing(nworkers=nworkers)
 
 
 def cpt(name):
@@ -138,6 +147,20 @@ def get(dem_name, region):
     return dem(dem_name).get(region)
 
 
+def elevation(dem_name, lats, lons, interpolation='bilinear'):
+    '''
+    Get elevations for arrays of points from a DEM.
+
+    :param dem_name: name of the DEM, see :py:func:`dem_names`
+    :param lats, lons: coordinate arrays of the points [deg]
+    :param interpolation: ``'nearest'`` or ``'bilinear'``
+    :returns: float array of elevations [m], ``nan`` where the DEM has no
+        data
+    '''
+
+    return dem(dem_name).elevations(lats, lons, interpolation=interpolation)
+
+
 def select_dem_names(kind, dmin, dmax, region):
     assert kind in ('land', 'ocean')
     ok = []
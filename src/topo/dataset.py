@@ -1,3 +1,4 @@
+import os
 import math
 import logging
 import os.path as op
@@ -5,11 +6,93 @@ import os.path as op
 import numpy as num
 
 from pyrocko import util
+from pyrocko.parimap import parimap
 from pyrocko.topo import tile
 
 logger = logging.getLogger('pyrocko.topo.dataset')
 
 
+class TileCache(object):
+    '''
+    In-process LRU cache for tile data arrays with a limit on total size.
+
+    :param max_bytes: limit on the summed size of the cached arrays
+
+    Cached arrays are shared between all users and must not be modified.
+    '''
+
+    def __init__(self, max_bytes=512*1024**2):
+        self.max_bytes = max_bytes
+        self._entries = {}
+        self._nbytes = 0
+        self._tick = 0
+
+    def get(self, key, load):
+        '''
+        Get data for ``key`` from the cache or add it using ``load()``.
+        '''
+
+        self._tick += 1
+        if key in self._entries:
+            data, nbytes, _ = self._entries[key]
+            self._entries[key] = data, nbytes, self._tick
+            return data
+
+        data = load()
+        nbytes = 0
+        if data is not None:
+            nbytes = data.nbytes
+
+        self._entries[key] = data, nbytes, self._tick
+        self._nbytes += nbytes
+        self._evict()
+        return data
+
+    def _evict(self):
+        while self._nbytes > self.max_bytes and len(self._entries) > 1:
+            key = min(self._entries, key=lambda k: self._entries[k][2])
+            _, nbytes, _ = self._entries.pop(key)
+            self._nbytes -= nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+
+g_tile_cache = TileCache()
+
+
+def mmap_tile_data(fpath, dtype, shape):
+    '''
+    Memory-map uncompressed tile data file read-only.
+
+    Returns ``None`` for empty files, which mark tiles without data.
+    '''
+
+    if op.getsize(fpath) == 0:
+        return None
+
+    return num.memmap(fpath, dtype=dtype, mode='r', shape=shape)
+
+
+def write_tile_data(data, fpath):
+    '''
+    Write tile data file, atomically replacing any existing file.
+    '''
+
+    util.ensuredirs(fpath)
+    fpath_tmp = fpath + '.%i.tmp' % os.getpid()
+    with open(fpath_tmp, 'w') as f:
+        if data is not None:
+            data.tofile(f)
+
+    os.rename(fpath_tmp, fpath)
+
+
 class TiledGlobalDataset(object):
 
     def __init__(self, name, nx, ny, ntx, nty, dtype, data_dir=None,
@@ -110,6 +193,48 @@ class TiledGlobalDataset(object):
 
         return tile.combine(tiles, region)
 
+    def elevations(self, lats, lons, interpolation='bilinear'):
+        '''
+        Get elevations at many points.
+
+        Points are grouped by tile, so that each tile is loaded only once.
+
+        :param lats, lons: coordinate arrays of the points [deg]
+        :param interpolation: ``'nearest'`` or ``'bilinear'``
+        :returns: float array with elevations, with the shape of ``lats``;
+            ``nan`` where the dataset has no data
+        '''
+
+        lats = num.asarray(lats, dtype=num.float)
+        lons = num.asarray(lons, dtype=num.float)
+        assert lats.shape == lons.shape
+
+        y = lats.ravel()
+        x = (lons.ravel() - self.xmin) % 360. + self.xmin
+
+        itx = num.clip(num.floor((x - self.xmin) / self.stx).astype(num.int),
+                       0, self.ntilesx - 1)
+        ity = num.clip(num.floor((y - self.ymin) / self.sty).astype(num.int),
+                       0, self.ntilesy - 1)
+
+        elevations = num.empty(x.size, dtype=num.float)
+        elevations.fill(num.nan)
+
+        itile = ity * self.ntilesx + itx
+        order = num.argsort(itile, kind='mergesort')
+        itile_sorted = itile[order]
+        ibounds = num.nonzero(num.diff(itile_sorted))[0] + 1
+        for ipoints in num.split(order, ibounds):
+            if ipoints.size == 0:
+                continue
+
+            t = self.get_tile(int(itx[ipoints[0]]), int(ity[ipoints[0]]))
+            if t is not None:
+                elevations[ipoints] = t.get_values(
+                    x[ipoints], y[ipoints], interpolation=interpolation)
+
+        return elevations.reshape(lats.shape)
+
     def get_with_repeat(self, region):
         xmin, xmax, ymin, ymax = region
         ymin2 = max(-90., ymin)
@@ -162,45 +287,66 @@ class DecimatedTiledGlobalDataset(TiledGlobalDataset):
         t = self.base.get_with_repeat((xmin, xmax, ymin, ymax))
         if t is not None:
             t.decimate(self.ndeci)
+            write_tile_data(t.data, fpath)
+        else:
+            write_tile_data(None, fpath)
 
-        util.ensuredirs(fpath)
-        with open(fpath, 'w') as f:
-            if t is not None:
-                t.data.tofile(f)
+    def tilepath(self, itx, ity):
+        fn = '%02i.%02i.bin' % (ity, itx)
+        return op.join(self.data_dir, fn)
 
     def make_if_needed(self, itx, ity):
         assert 0 <= itx < self.ntilesx
         assert 0 <= ity < self.ntilesy
 
-        fn = '%02i.%02i.bin' % (ity, itx)
-        fpath = op.join(self.data_dir, fn)
+        fpath = self.tilepath(itx, ity)
         if not op.exists(fpath):
-            logger.info('making decimated tile: %s (%s)' % (fn, self.name))
+            logger.info('making decimated tile: %s (%s)' % (
+                op.basename(fpath), self.name))
             self.make_tile(itx, ity, fpath)
 
     def get_tile(self, itx, ity):
         assert 0 <= itx < self.ntilesx
         assert 0 <= ity < self.ntilesy
 
-        self.make_if_needed(itx, ity)
+        fpath = self.tilepath(itx, ity)
 
-        fn = '%02i.%02i.bin' % (ity, itx)
-        fpath = op.join(self.data_dir, fn)
-        with open(fpath, 'r') as f:
-            data = num.fromfile(f, dtype=self.dtype)
+        def load():
+            self.make_if_needed(itx, ity)
+            return mmap_tile_data(fpath, self.dtype, (self.nty, self.ntx))
 
-        if data.size == 0:
+        data = g_tile_cache.get(fpath, load)
+        if data is None:
             return None
 
-        assert data.size == self.ntx*self.nty
-        data = data.reshape((self.ntx, self.nty))
-
         return tile.Tile(
             self.xmin + itx*self.stx,
             self.ymin + ity*self.sty,
             self.dx, self.dx, data)
 
-    def make_all_missing(self):
+    def make_all_missing(self, nworkers=1):
+        '''
+        Make all decimated tiles which do not exist yet.
+
+        :param nworkers: number of parallel processes to use, ``None`` to
+            use all cores
+        '''
+
+        missing = []
         for ity in xrange(self.ntilesy):
             for itx in xrange(self.ntilesx):
-                self.make_if_needed(itx, ity)
+                if not op.exists(self.tilepath(itx, ity)):
+                    missing.append((itx, ity))
+
+        for _ in parimap(
+                _make_if_needed,
+                [self] * len(missing),
+                [itx for (itx, _) in missing],
+                [ity for (_, ity) in missing],
+                nprocs=nworkers):
+
+            pass
+
+
+def _make_if_needed(dataset, itx, ity):
+    dataset.make_if_needed(itx, ity)
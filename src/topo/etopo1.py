@@ -58,8 +58,7 @@ class ETOPO1(dataset.TiledGlobalDataset):
 
                 fn = '%s.%02i.%02i.bin' % (self.base_fn, ity, itx)
                 fpath = op.join(self.data_dir, fn)
-                with open(fpath, 'w') as f:
-                    tiledata.tofile(f)
+                dataset.write_tile_data(tiledata, fpath)
 
     def get_tile(self, itx, ity):
         assert 0 <= itx < self.ntilesx
@@ -67,14 +66,15 @@ class ETOPO1(dataset.TiledGlobalDataset):
 
         fn = '%s.%02i.%02i.bin' % (self.base_fn, ity, itx)
         fpath = op.join(self.data_dir, fn)
-        if not op.exists(fpath):
-            self.download()
 
-        with open(fpath, 'r') as f:
-            data = num.fromfile(f, dtype=self.dtype)
+        def load():
+            if not op.exists(fpath):
+                self.download()
+
+            return dataset.mmap_tile_data(
+                fpath, self.dtype, (self.nty, self.ntx))
 
-        assert data.size == self.ntx*self.nty
-        data = data.reshape((self.ntx, self.nty))
+        data = dataset.g_tile_cache.get(fpath, load)
 
         return tile.Tile(
             self.xmin + itx*self.stx,
@@ -92,6 +92,9 @@ class SRTMGL3(dataset.TiledGlobalDataset):
         fn = self.tilefilename(tilename)
         return op.join(self.data_dir, fn)
 
+    def tilepath_bin(self, tilename):
+        return op.join(self.data_dir, tilename + '.SRTMGL3.bin')
+
     def download_tile(self, tilename):
         fpath = self.tilepath(tilename)
         fn = self.tilefilename(tilename)
@@ -104,21 +107,38 @@ class SRTMGL3(dataset.TiledGlobalDataset):
             if not op.exists(fpath):
                 self.download_tile(tn)
 
+    def convert_tile(self, tilename):
+        '''
+        Unpack zipped tile into a file which can be memory-mapped.
+        '''
+
+        fpath = self.tilepath(tilename)
+        if not op.exists(fpath):
+            self.download_tile(tilename)
+
+        zipf = zipfile.ZipFile(fpath, 'r')
+        rawdata = zipf.read(tilename + '.hgt')
+        zipf.close()
+        data = num.fromstring(rawdata, dtype=self.dtype)
+        assert data.size == self.ntx * self.nty
+        data = data.reshape(self.nty, self.ntx)[::-1, ::]
+        dataset.write_tile_data(data, self.tilepath_bin(tilename))
+
     def get_tile(self, itx, ity):
         tn = self.tilename(itx, ity)
         if tn not in self.available_tilenames():
             return None
         else:
-            fpath = self.tilepath(tn)
-            if not op.exists(fpath):
-                self.download_tile(tn)
+            fpath = self.tilepath_bin(tn)
+
+            def load():
+                if not op.exists(fpath):
+                    self.convert_tile(tn)
+
+                return dataset.mmap_tile_data(
+                    fpath, self.dtype, (self.nty, self.ntx))
 
-            zipf = zipfile.ZipFile(fpath, 'r')
-            rawdata = zipf.read(tn + '.hgt')
-            zipf.close()
-            data = num.fromstring(rawdata, dtype=self.dtype)
-            assert data.size == self.ntx * self.nty
-            data = data.reshape(self.nty, self.ntx)[::-1, ::]
+            data = dataset.g_tile_cache.get(fpath, load)
             return tile.Tile(
                 self.xmin + itx*self.stx,
                 self.ymin + ity*self.sty,
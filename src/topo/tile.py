@@ -1,6 +1,5 @@
 import math
 import numpy as num
-import scipy.signal
 
 from pyrocko.orthodrome import positive_region
 
@@ -32,12 +31,15 @@ class Tile(object):
 
     def decimate(self, ndeci):
         assert ndeci % 2 == 0
-        kernel = num.ones((ndeci+1, ndeci+1))
-        kernel /= num.sum(kernel)
-        data = scipy.signal.convolve2d(
-            self.data.astype(num.float), kernel, mode='valid')
 
-        self.data = data[::ndeci, ::ndeci].astype(self.data.dtype)
+        # Box filter of width ndeci+1, evaluated only at the kept samples,
+        # as two 1D passes over running sums.
+        data = self.data.astype(num.float)
+        for axis in (0, 1):
+            data = box_sums_decimated(data, ndeci+1, ndeci, axis)
+
+        data /= (ndeci+1)**2
+        self.data = data.astype(self.data.dtype)
         self.xmin += ndeci/2
         self.ymin += ndeci/2
         self.dx *= ndeci
@@ -69,6 +71,65 @@ class Tile(object):
         else:
             raise OutOfBounds()
 
+    def get_values(self, x, y, interpolation='nearest'):
+        '''
+        Get values at many points at once.
+
+        :param x, y: coordinate arrays of the points
+        :param interpolation: ``'nearest'`` or ``'bilinear'``
+        :returns: array of values, with the shape of ``x``; float, if
+            interpolation is bilinear
+
+        Raises :py:exc:`OutOfBounds` if any of the points is outside of the
+        tile.
+        '''
+
+        assert interpolation in ('nearest', 'bilinear')
+
+        fx = (num.asarray(x, dtype=num.float) - self.xmin) / self.dx
+        fy = (num.asarray(y, dtype=num.float) - self.ymin) / self.dy
+
+        if interpolation == 'nearest':
+            ix = num.floor(fx + 0.5).astype(num.int)
+            iy = num.floor(fy + 0.5).astype(num.int)
+            if num.any(ix < 0) or num.any(ix >= self.nx) or \
+                    num.any(iy < 0) or num.any(iy >= self.ny):
+                raise OutOfBounds()
+
+            return self.data[iy, ix]
+
+        eps = 1e-6
+        if num.any(fx < -eps) or num.any(fx > self.nx - 1 + eps) or \
+                num.any(fy < -eps) or num.any(fy > self.ny - 1 + eps):
+            raise OutOfBounds()
+
+        ix = num.clip(num.floor(fx).astype(num.int), 0, max(0, self.nx - 2))
+        iy = num.clip(num.floor(fy).astype(num.int), 0, max(0, self.ny - 2))
+        ix1 = num.minimum(ix + 1, self.nx - 1)
+        iy1 = num.minimum(iy + 1, self.ny - 1)
+        wx = num.clip(fx - ix, 0., 1.)
+        wy = num.clip(fy - iy, 0., 1.)
+
+        d = self.data
+        return (d[iy, ix] * (1.0 - wx) + d[iy, ix1] * wx) * (1.0 - wy) + \
+            (d[iy1, ix] * (1.0 - wx) + d[iy1, ix1] * wx) * wy
+
+
+def box_sums_decimated(data, n, ndeci, axis):
+    '''
+    Sums over windows of ``n`` samples along ``axis``, every ``ndeci``-th.
+
+    Equivalent to convolution with a box of length ``n`` in mode ``valid``,
+    followed by taking every ``ndeci``-th sample.
+    '''
+
+    data = num.swapaxes(data, 0, axis)
+    csum = num.zeros((data.shape[0]+1,) + data.shape[1:], dtype=num.float)
+    num.cumsum(data, axis=0, out=csum[1:])
+    ibegins = num.arange(0, data.shape[0]-n+1, ndeci)
+    sums = csum[ibegins+n] - csum[ibegins]
+    return num.swapaxes(sums, 0, axis)
+
 
 def multiple_of(x, dx, eps=1e-5):
     return abs(int(round(x / dx))*dx - x) < dx * eps
@@ -1,9 +1,10 @@
 '''This module provides basic signal processing for seismic traces.'''
 
-import time, math, copy, logging
+import os, time, math, copy, logging, threading
+from collections import OrderedDict
 import numpy as num
 from scipy import signal
-from pyrocko import util, evalresp, model, orthodrome
+from pyrocko import util, evalresp, model, orthodrome, autopick
 from pyrocko.util import reuse, hpfloat, UnavailableDecimation
 from pyrocko.pchain import *
 from pyrocko.guts import Object, Float, Int, String, Complex, Tuple, List, StringChoice
@@ -395,7 +396,8 @@ class Trace(object):
         
         return obj
     
-    def downsample(self, ndecimate, snap=False, initials=None, demean=False):
+    def downsample(self, ndecimate, snap=False, initials=None, demean=False,
+                   ftype='fir'):
         '''Downsample trace by a given integer factor.
         
         :param ndecimate: decimation factor, avoid values larger than 8
@@ -403,6 +405,10 @@ class Trace(object):
         :param initials: ``None``, ``True``, or initial conditions for the anti-aliasing filter, obtained from a
             previous run. In the latter two cases the final state of the filter is returned instead of ``None``.
         :param demean: whether to demean the signal before filtering.
+        :param ftype: type of the anti-aliasing filter, ``'fir'`` or
+            ``'fir-polyphase'``, see :py:func:`pyrocko.util.decimate`. Both
+            give the same result, they differ in the form of the filter
+            state in *initials*.
         '''
 
 
@@ -421,7 +427,7 @@ class Trace(object):
         if demean:
             data -= num.mean(data)
         
-        result = util.decimate(data, ndecimate, ftype='fir', zi=initials, ioff=ilag)
+        result = util.decimate(data, ndecimate, ftype=ftype, zi=initials, ioff=ilag)
         if initials is None:
             self.ydata, finals = result, None
         else:
@@ -433,7 +439,8 @@ class Trace(object):
         
         return finals
         
-    def downsample_to(self, deltat, snap=False, allow_upsample_max=1, initials=None, demean=False):
+    def downsample_to(self, deltat, snap=False, allow_upsample_max=1, initials=None, demean=False,
+                      ftype='fir'):
         '''Downsample to given sampling rate.
 
         Tries to downsample the trace to a target sampling interval of
@@ -476,7 +483,8 @@ class Trace(object):
                  finals.append(self.downsample(ndecimate, 
                                                snap=snap, 
                                                initials=xinitials, 
-                                               demean=demean))
+                                               demean=demean,
+                                               ftype=ftype))
 
         if initials is not None:
             return finals
@@ -926,62 +934,38 @@ class Trace(object):
         in combination with recursive STA/LTA filters.
         
         '''
-        y = self.ydata
-        above =  num.where(y > threshold, 1, 0)
-        deriv = num.zeros(y.size, dtype=num.int8)
-        deriv[1:] = above[1:]-above[:-1]
-        itrig_positions = num.nonzero(deriv>0)[0]
-        tpeaks = []
-        apeaks = []
-        tzeros = []
-        tzero = self.tmin
-        
-        for itrig_pos in itrig_positions:
-            ibeg = itrig_pos
-            iend = min(
-                len(self.ydata),
-                itrig_pos + int(math.ceil(tsearch/self.deltat)))
-            ipeak = num.argmax(y[ibeg:iend])
-            tpeak = self.tmin + (ipeak+ibeg)*self.deltat
-            apeak = y[ibeg+ipeak]
-
-            if tpeak < tzero:
-                continue
+        ipeaks, tzeros = self._peaks(
+            threshold, tsearch, deadtime, nblock_duration_detection)
 
-            if deadtime:
-                ibeg = itrig_pos
-                iblock = 0
-                nblock = nblock_duration_detection
-                totalsum = 0. 
-                while True:
-                    if ibeg+iblock*nblock >= len(y):
-                        tzero = self.tmin + (len(y)-1)* self.deltat
-                        break
-
-                    logy = num.log(y[ibeg+iblock*nblock:ibeg+(iblock+1)*nblock])
-                    logy[0] += totalsum
-                    ysum = num.cumsum(logy)
-                    totalsum = ysum[-1]
-                    below = num.where(ysum <= 0., 1, 0)
-                    deriv = num.zeros(ysum.size, dtype=num.int8)
-                    deriv[1:] = below[1:]-below[:-1]
-                    izero_positions = num.nonzero(deriv>0)[0] + iblock*nblock
-                    if len(izero_positions) > 0:
-                        tzero = self.tmin + (ibeg + izero_positions[0])*self.deltat
-                        break
-                    iblock += 1
-            else:
-                tzero = ibeg*self.deltat + self.tmin + tsearch
+        tpeaks = list(self.tmin + ipeaks*self.deltat)
+        apeaks = list(self.ydata[ipeaks])
 
-            tpeaks.append(tpeak)
-            apeaks.append(apeak)
-            tzeros.append(tzero)
-        
         if deadtime:
-            return tpeaks, apeaks, tzeros
+            return tpeaks, apeaks, list(tzeros)
         else:
             return tpeaks, apeaks
 
+    def _peaks(self, threshold, tsearch, deadtime, nblock_duration_detection):
+        from pyrocko import signal_ext
+
+        y = self.ydata
+        above = y > threshold
+        itrigs = (num.nonzero(above[1:] & ~above[:-1])[0] + 1).astype(
+            num.int64)
+
+        ipeaks = num.zeros(itrigs.size, dtype=num.int64)
+        tzeros = num.zeros(itrigs.size, dtype=num.float)
+        if itrigs.size == 0:
+            return ipeaks, tzeros
+
+        npeaks = signal_ext.peaks(
+            num.ascontiguousarray(y, dtype=num.float), itrigs,
+            int(math.ceil(tsearch/self.deltat)), int(bool(deadtime)),
+            nblock_duration_detection, float(self.tmin), self.deltat,
+            float(tsearch), ipeaks, tzeros)
+
+        return ipeaks[:npeaks], tzeros[:npeaks]
+
     def extend(self, tmin=None, tmax=None, fillmethod='zeros'):
         '''Extend trace to given span.
 
@@ -1063,14 +1047,15 @@ class Trace(object):
         if self._pchain:
             self._pchain.clear()
     
-    def init_chain(self):
+    def init_chain(self, nmax=16):
         self._pchain = Chain(
             do_downsample, 
             do_extend,
             do_pre_taper,
             do_fft,
             do_filter,
-            do_ifft)
+            do_ifft,
+            nmax=nmax)
 
     def run_chain(self, tmin, tmax, deltat, setup, nocache):
         if setup.domain=='frequency_domain':
@@ -1101,7 +1086,10 @@ class Trace(object):
                 processed = processed.envelope(inplace=False)
 
             elif setup.domain=='absolute':
-                processed.set_ydata(num.abs(processed.get_ydata()))
+                # do not modify the cached trace
+                ydata = num.abs(processed.get_ydata())
+                processed = processed.copy(data=False)
+                processed.set_ydata(ydata)
 
             return processed.get_ydata(), processed
 
@@ -1214,6 +1202,25 @@ class Trace(object):
 
     def _get_tapered_coefs(self, ntrans, freqlimits, transfer_function, invert=False):
 
+        resp_key = transfer_function._cache_key()
+        if resp_key is not None:
+            key = (resp_key, self.deltat, ntrans,
+                   freqlimits and tuple(freqlimits), invert)
+
+            coefs = g_tapered_coefs_cache.get(key)
+            if coefs is None:
+                coefs = self._compute_tapered_coefs(
+                    ntrans, freqlimits, transfer_function, invert)
+                coefs.flags.writeable = False
+                g_tapered_coefs_cache.put(key, coefs)
+
+            return coefs
+
+        return self._compute_tapered_coefs(
+            ntrans, freqlimits, transfer_function, invert)
+
+    def _compute_tapered_coefs(self, ntrans, freqlimits, transfer_function, invert=False):
+
         deltaf = 1./(self.deltat*ntrans)
         nfreqs = ntrans/2 + 1
         transfer = num.ones(nfreqs, dtype=num.complex)
@@ -1375,6 +1382,252 @@ def minmax(traces, key=None, mode='minmax'):
     
     return ranges
         
+def find_peaks(traces, threshold, tsearch, deadtime=False,
+               nblock_duration_detection=100):
+
+    '''Detect peaks above given threshold in many traces.
+
+    Peaks are detected in each trace as in :py:meth:`Trace.peaks`.
+
+    :returns: tuple ``(nslc_ids, peaks)``, where *nslc_ids* is the sorted
+        list of the nslc codes of the traces and *peaks* a NumPy record array
+        with fields ``inslc`` (index into *nslc_ids*), ``tpeak``, ``apeak``
+        and ``tzero``, sorted by peak time. The field ``tzero`` contains the
+        end of the dead time (see :py:meth:`Trace.peaks`); if *deadtime* is
+        ``False``, it is the end of the search window.
+    '''
+
+    nslc_ids = sorted(set(tr.nslc_id for tr in traces))
+    inslcs = dict((nslc_id, i) for (i, nslc_id) in enumerate(nslc_ids))
+
+    dtype = [('inslc', num.int), ('tpeak', num.float), ('apeak', num.float),
+             ('tzero', num.float)]
+
+    results = []
+    for tr in traces:
+        ipeaks, tzeros = tr._peaks(
+            threshold, tsearch, deadtime, nblock_duration_detection)
+
+        result = num.zeros(ipeaks.size, dtype=dtype)
+        result['inslc'] = inslcs[tr.nslc_id]
+        result['tpeak'] = tr.tmin + ipeaks*tr.deltat
+        result['apeak'] = tr.ydata[ipeaks]
+        result['tzero'] = tzeros
+        results.append(result)
+
+    if results:
+        peaks = num.concatenate(results)
+    else:
+        peaks = num.zeros(0, dtype=dtype)
+
+    peaks = peaks[num.argsort(peaks['tpeak'], kind='mergesort')]
+    return nslc_ids, peaks
+
+def _traces_to_array(traces):
+    '''Stack data of equally sampled traces of equal length into 2D array.'''
+
+    if not traces:
+        raise NoData()
+
+    deltat = traces[0].deltat
+    nsamples = traces[0].data_len()
+    for tr in traces:
+        if not same_sampling_rate(tr, traces[0]) or \
+                tr.data_len() != nsamples:
+
+            raise MisalignedTraces(
+                'batch processing needs equally sampled traces of equal '
+                'length (trace %s.%s.%s.%s)' % tr.nslc_id)
+
+    data = num.empty((len(traces), nsamples), dtype=num.float64)
+    for i, tr in enumerate(traces):
+        data[i, :] = tr.get_ydata()
+
+    return data, deltat
+
+
+def _array_to_traces(traces, data, ioffset=0):
+    outputs = []
+    for tr, ydata in zip(traces, data):
+        output = tr.copy(data=False)
+        if ioffset != 0:
+            output.shift(ioffset * tr.deltat)
+
+        output.set_ydata(ydata)
+        outputs.append(output)
+
+    return outputs
+
+
+def _filter_traces(traces, order, corners, btype, demean):
+    data, deltat = _traces_to_array(traces)
+    (b, a) = _get_cached_filter_coefs(
+        order, [corner*2.0*deltat for corner in corners], btype=btype)
+
+    if btype != 'band' and (len(a) != order+1 or len(b) != order+1):
+        logger.warn(
+            'Erroneous filter coefficients returned by '
+            'scipy.signal.butter(). You may need to downsample the signal '
+            'before filtering.')
+
+    if demean:
+        data -= num.mean(data, axis=1)[:, num.newaxis]
+
+    return _array_to_traces(traces, signal.lfilter(b, a, data, axis=1))
+
+
+def lowpass_traces(traces, order, corner, nyquist_warn=True,
+                   nyquist_exception=False, demean=True):
+
+    '''Apply Butterworth lowpass to many traces at once.
+
+    Batched version of :py:meth:`Trace.lowpass`. The traces must be equally
+    sampled and of equal length; they are filtered in a single vectorized
+    call on a 2D array.
+
+    :returns: list of new :py:class:`Trace` objects
+    '''
+
+    if traces:
+        traces[0].nyquist_check(
+            corner, 'Corner frequency of lowpass', nyquist_warn,
+            nyquist_exception)
+
+    return _filter_traces(traces, order, [corner], 'low', demean)
+
+
+def highpass_traces(traces, order, corner, nyquist_warn=True,
+                    nyquist_exception=False, demean=True):
+
+    '''Apply Butterworth highpass to many traces at once.
+
+    Batched version of :py:meth:`Trace.highpass`, see
+    :py:func:`lowpass_traces`.
+    '''
+
+    if traces:
+        traces[0].nyquist_check(
+            corner, 'Corner frequency of highpass', nyquist_warn,
+            nyquist_exception)
+
+    return _filter_traces(traces, order, [corner], 'high', demean)
+
+
+def bandpass_traces(traces, order, corner_hp, corner_lp, demean=True):
+    '''Apply Butterworth bandpass to many traces at once.
+
+    Batched version of :py:meth:`Trace.bandpass`, see
+    :py:func:`lowpass_traces`.
+    '''
+
+    if traces:
+        traces[0].nyquist_check(
+            corner_hp, 'Lower corner frequency of bandpass')
+        traces[0].nyquist_check(
+            corner_lp, 'Higher corner frequency of bandpass')
+
+    return _filter_traces(traces, order, [corner_hp, corner_lp], 'band',
+                          demean)
+
+
+def taper_traces(traces, taperer, chop=False):
+    '''Apply a :py:class:`Taper` to many traces at once.
+
+    Batched version of :py:meth:`Trace.taper`. The taper window is evaluated
+    once for each distinct start time of the traces.
+
+    :returns: list of new :py:class:`Trace` objects
+    '''
+
+    data, deltat = _traces_to_array(traces)
+
+    windows = {}
+    outputs = []
+    for tr, ydata in zip(traces, data):
+        if tr.tmin not in windows:
+            window = num.ones(ydata.size)
+            taperer(window, tr.tmin, deltat)
+            if chop:
+                i, n = taperer.span(window, tr.tmin, deltat)
+            else:
+                i, n = 0, ydata.size
+
+            windows[tr.tmin] = window, i, n
+
+        window, i, n = windows[tr.tmin]
+        ydata *= window
+        output, = _array_to_traces([tr], [ydata[i:i+n]], i)
+        outputs.append(output)
+
+    return outputs
+
+
+def transfer_traces(traces, tfade=0., freqlimits=None, transfer_function=None,
+                    cut_off_fading=True, invert=False):
+
+    '''Apply transfer function to many traces at once.
+
+    Batched version of :py:meth:`Trace.transfer`. The traces must be equally
+    sampled and of equal length. The transfer function is evaluated only
+    once and all traces are transformed in single vectorized FFT calls.
+
+    :param transfer_function: a :py:class:`FrequencyResponse` object to be
+        applied to all traces, or a list of such objects, one per trace
+    :returns: list of new :py:class:`Trace` objects
+    '''
+
+    if transfer_function is None:
+        transfer_function = FrequencyResponse()
+
+    data, deltat = _traces_to_array(traces)
+    ntraces, ndata = data.shape
+    tr0 = traces[0]
+
+    if tr0.tmax - tr0.tmin <= tfade*2.:
+        raise TraceTooShort(
+            'Trace %s.%s.%s.%s too short for fading length setting. trace '
+            'length = %g, fading length = %g' % (
+                tr0.nslc_id + (tr0.tmax-tr0.tmin, tfade)))
+
+    ntrans = nextpow2(ndata*1.2)
+    if isinstance(transfer_function, (list, tuple)):
+        assert len(transfer_function) == ntraces
+        coefs = num.array([
+            tr0._get_tapered_coefs(ntrans, freqlimits, tf, invert=invert)
+            for tf in transfer_function])
+    else:
+        coefs = tr0._get_tapered_coefs(
+            ntrans, freqlimits, transfer_function, invert=invert)
+
+    data_pad = num.zeros((ntraces, ntrans), dtype=num.float)
+    data_pad[:, :ndata] = data - num.mean(data, axis=1)[:, num.newaxis]
+    if tfade != 0.0:
+        data_pad[:, :ndata] *= costaper(
+            0., tfade, deltat*(ndata-1)-tfade, deltat*ndata, ndata, deltat)
+
+    fdata = num.fft.rfft(data_pad, axis=1)
+    fdata *= coefs
+    ddata = num.fft.irfft(fdata, ntrans, axis=1)[:, :ndata]
+
+    if cut_off_fading and tfade != 0.0:
+        outputs = []
+        for output in _array_to_traces(traces, ddata):
+            try:
+                output.chop(output.tmin+tfade, output.tmax-tfade,
+                            inplace=True)
+            except NoData:
+                raise TraceTooShort(
+                    'Trace %s.%s.%s.%s too short for fading length setting. '
+                    'trace length = %g, fading length = %g' % (
+                        output.nslc_id + (tr0.tmax-tr0.tmin, tfade)))
+
+            outputs.append(output)
+
+        return outputs
+    else:
+        return _array_to_traces(traces, ddata.copy())
+
+
 def minmaxtime(traces, key=None):
     
     '''Get time range given traces grouped by selected pattern.
@@ -1499,6 +1752,101 @@ def degapper(traces, maxgap=5, fillmethod='interpolate', deoverlap='use_second',
     
     return out_traces
 
+def _matching_combinations(traces, in_channels):
+    '''Find combinations of traces with given channels for projections.
+
+    Yields tuples of traces, one per channel in *in_channels*, with equal
+    network, station and location codes and compatible sampling rates. The
+    traces are looked up by hashing, and combinations are produced in the
+    same order as by nested loops over all traces.
+    '''
+
+    by_nsl_channel = {}
+    for tr in traces:
+        by_nsl_channel.setdefault(
+            (tr.nslc_id[:3], tr.channel), []).append(tr)
+
+    for a in traces:
+        if a.channel != in_channels[0]:
+            continue
+
+        combis = [(a,)]
+        for channel in in_channels[1:]:
+            candidates = by_nsl_channel.get((a.nslc_id[:3], channel), [])
+            combis = [
+                combi + (b,) for combi in combis for b in candidates
+                if abs(combi[-1].deltat-b.deltat) < combi[-1].deltat*0.001]
+
+        for combi in combis:
+            yield combi
+
+def _chop_combination(combi, tmin, tmax):
+    chopped = [tr.chop(tmin, tmax, inplace=False, include_last=True)
+               for tr in combi]
+
+    for ac, bc in zip(chopped[:-1], chopped[1:]):
+        if abs(ac.tmin - bc.tmin) > ac.deltat*0.01:
+            return None
+
+    return chopped
+
+def _stacked_ydata(combis):
+    '''Group combinations of traces with equal data shapes and stack them.
+
+    Yields ``(indices, arrays)``, where ``arrays`` contains one 2D array per
+    component, with one row per combination in ``indices``.
+    '''
+
+    groups = {}
+    for i, combi in enumerate(combis):
+        key = tuple((tr.ydata.size, tr.ydata.dtype) for tr in combi)
+        groups.setdefault(key, []).append(i)
+
+    for ii in groups.itervalues():
+        ncomps = len(combis[ii[0]])
+        yield ii, [num.array([combis[i][icomp].ydata for i in ii])
+                   for icomp in xrange(ncomps)]
+
+def _rotate_pairs(pairs, phis, out_channels):
+    phis = num.asarray(phis, dtype=num.float)
+    for ii, (adata, bdata) in _stacked_ydata(pairs):
+        # keep single precision data in single precision
+        ftype = num.float32 if adata.dtype == bdata.dtype == num.float32 \
+            else num.float
+        cphi = num.cos(phis[ii])[:, num.newaxis].astype(ftype)
+        sphi = num.sin(phis[ii])[:, num.newaxis].astype(ftype)
+        acydata = adata*cphi + bdata*sphi
+        bcydata = -adata*sphi + bdata*cphi
+        for k, i in enumerate(ii):
+            ac, bc = pairs[i]
+            ac.set_ydata(acydata[k])
+            bc.set_ydata(bcydata[k])
+
+    rotated = []
+    for ac, bc in pairs:
+        ac.set_codes(channel=out_channels[0])
+        bc.set_codes(channel=out_channels[1])
+        rotated.append(ac)
+        rotated.append(bc)
+
+    return rotated
+
+def _rotation_pairs(traces, in_channels):
+    pairs = []
+    for a, b in _matching_combinations(traces, in_channels):
+        tmin = max(a.tmin, b.tmin)
+        tmax = min(a.tmax, b.tmax)
+
+        if tmin < tmax:
+            chopped = _chop_combination((a, b), tmin, tmax)
+            if chopped is None:
+                logger.warn('Cannot rotate traces with displaced sampling (%s,%s,%s,%s)' % a.nslc_id)
+                continue
+
+            pairs.append(tuple(chopped))
+
+    return pairs
+
 def rotate(traces, azimuth, in_channels, out_channels):
     '''2D rotation of traces.
     
@@ -1511,37 +1859,10 @@ def rotate(traces, azimuth, in_channels, out_channels):
     '''
     
     phi = azimuth/180.*math.pi
-    cphi = math.cos(phi)
-    sphi = math.sin(phi)
-    rotated = []
     in_channels = tuple(_channels_to_names(in_channels))
     out_channels = tuple(_channels_to_names(out_channels))
-    for a in traces:
-        for b in traces:
-            if ( (a.channel, b.channel) == in_channels and
-                 a.nslc_id[:3] == b.nslc_id[:3] and
-                 abs(a.deltat-b.deltat) < a.deltat*0.001 ):
-                tmin = max(a.tmin, b.tmin)
-                tmax = min(a.tmax, b.tmax)
-                
-                if tmin < tmax:
-                    ac = a.chop(tmin, tmax, inplace=False, include_last=True)
-                    bc = b.chop(tmin, tmax, inplace=False, include_last=True)
-                    if abs(ac.tmin - bc.tmin) > ac.deltat*0.01:
-                        logger.warn('Cannot rotate traces with displaced sampling (%s,%s,%s,%s)' % a.nslc_id)
-                        continue
-                    
-                    acydata =  ac.get_ydata()*cphi+bc.get_ydata()*sphi
-                    bcydata = -ac.get_ydata()*sphi+bc.get_ydata()*cphi
-                    ac.set_ydata(acydata)
-                    bc.set_ydata(bcydata)
-
-                    ac.set_codes(channel=out_channels[0])
-                    bc.set_codes(channel=out_channels[1])
-                    rotated.append(ac)
-                    rotated.append(bc)
-                    
-    return rotated
+    pairs = _rotation_pairs(traces, in_channels)
+    return _rotate_pairs(pairs, num.repeat(phi, len(pairs)), out_channels)
 
 def rotate_to_rt(n, e, source, receiver, out_channels=('R', 'T')):
     azimuth = orthodrome.azimuth(receiver, source) + 180.
@@ -1556,6 +1877,41 @@ def rotate_to_rt(n, e, source, receiver, out_channels=('R', 'T')):
 
     return r,t
 
+def rotate_to_rt_many(traces, source, receivers, in_channels=('N', 'E'),
+                      out_channels=('R', 'T')):
+    '''Rotate horizontal components of many stations to radial/transversal.
+
+    :param traces: list of input traces
+    :param source: object with ``lat`` and ``lon`` attributes
+    :param receivers: list of :py:class:`pyrocko.model.Station` objects,
+        matched to the traces by network, station and location codes
+    :param in_channels: names of the north and east channels
+    :param out_channels: names of the output channels
+    :returns: list of rotated traces
+
+    All pairs are matched in one pass and rotated in vectorized batches, with
+    the backazimuths computed for all receivers at once.
+    '''
+
+    in_channels = tuple(_channels_to_names(in_channels))
+    out_channels = tuple(_channels_to_names(out_channels))
+
+    receivers = dict((r.nsl(), r) for r in receivers)
+    pairs = [(a, b) for (a, b) in _rotation_pairs(traces, in_channels)
+             if a.nslc_id[:3] in receivers]
+
+    lats = num.array([receivers[a.nslc_id[:3]].lat for (a, _) in pairs],
+                     dtype=num.float)
+    lons = num.array([receivers[a.nslc_id[:3]].lon for (a, _) in pairs],
+                     dtype=num.float)
+
+    azimuths = orthodrome.azimuth_numpy(
+        lats, lons,
+        num.repeat(float(source.lat), len(pairs)),
+        num.repeat(float(source.lon), len(pairs))) + 180.
+
+    return _rotate_pairs(pairs, azimuths/180.*math.pi, out_channels)
+
 def _decompose(a):
     '''Decompose matrix into independent submatrices.'''
     
@@ -1696,93 +2052,63 @@ def _project1(traces, matrix, in_channels, out_channels):
         
     return projected
 
+def _project_combinations(combis, matrix, out_channels):
+    for ii, datas in _stacked_ydata(combis):
+        datas = num.array(datas)
+        outdatas = [num.tensordot(row, datas, axes=(0, 0)) for row in matrix]
+        for k, i in enumerate(ii):
+            for tr, outdata in zip(combis[i], outdatas):
+                tr.set_ydata(outdata[k])
+
+    projected = []
+    for combi in combis:
+        for tr, channel in zip(combi, out_channels):
+            tr.set_codes(channel=channel)
+            projected.append(tr)
+
+    return projected
+
 def _project2(traces, matrix, in_channels, out_channels):
     assert len(in_channels) == 2
     assert len(out_channels) == 2
     assert matrix.shape == (2,2)
-    projected = []
-    for a in traces:
-        for b in traces:
-            if not ( (a.channel, b.channel ) == in_channels and
-                    a.nslc_id[:3] == b.nslc_id[:3] and
-                    abs(a.deltat-b.deltat) < a.deltat*0.001 ):
-                continue
-                    
-            tmin = max(a.tmin, b.tmin)
-            tmax = min(a.tmax, b.tmax)
-            
-            if tmin > tmax:
-                continue
-        
-            ac = a.chop(tmin, tmax, inplace=False, include_last=True)
-            bc = b.chop(tmin, tmax, inplace=False, include_last=True)
-            if abs(ac.tmin - bc.tmin) > ac.deltat*0.01:
-                logger.warn('Cannot project traces with displaced sampling (%s,%s,%s,%s)' % a.nslc_id)
-                continue
-                
-            acydata = num.dot( matrix[0], (ac.get_ydata(),bc.get_ydata()))
-            bcydata = num.dot( matrix[1], (ac.get_ydata(),bc.get_ydata()))
-            
-            ac.set_ydata(acydata)
-            bc.set_ydata(bcydata)
+    combis = []
+    for a, b in _matching_combinations(traces, in_channels):
+        tmin = max(a.tmin, b.tmin)
+        tmax = min(a.tmax, b.tmax)
+
+        if tmin > tmax:
+            continue
+
+        chopped = _chop_combination((a, b), tmin, tmax)
+        if chopped is None:
+            logger.warn('Cannot project traces with displaced sampling (%s,%s,%s,%s)' % a.nslc_id)
+            continue
+
+        combis.append(chopped)
+
+    return _project_combinations(combis, matrix, out_channels)
 
-            ac.set_codes(channel=out_channels[0])
-            bc.set_codes(channel=out_channels[1])
-            
-            projected.append(ac)
-            projected.append(bc)
-    
-    return projected
-            
 def _project3(traces, matrix, in_channels, out_channels):
     assert len(in_channels) == 3
     assert len(out_channels) == 3
     assert matrix.shape == (3,3)
-    projected = []
-    for a in traces:
-        for b in traces:
-            for c in traces:
-                if not ( (a.channel, b.channel, c.channel) == in_channels and
-                     a.nslc_id[:3] == b.nslc_id[:3] and
-                     b.nslc_id[:3] == c.nslc_id[:3] and
-                     abs(a.deltat-b.deltat) < a.deltat*0.001 and
-                     abs(b.deltat-c.deltat) < b.deltat*0.001 ):
-                    continue
-                     
-                tmin = max(a.tmin, b.tmin, c.tmin)
-                tmax = min(a.tmax, b.tmax, c.tmax)
-                    
-                if tmin >= tmax:
-                    continue
-                
-                ac = a.chop(tmin, tmax, inplace=False, include_last=True)
-                bc = b.chop(tmin, tmax, inplace=False, include_last=True)
-                cc = c.chop(tmin, tmax, inplace=False, include_last=True)
-                if (abs(ac.tmin - bc.tmin) > ac.deltat*0.01 or
-                    abs(bc.tmin - cc.tmin) > bc.deltat*0.01):
-                    logger.warn('Cannot project traces with displaced sampling (%s,%s,%s,%s)' % a.nslc_id)
-                    continue
-                    
-                acydata = num.dot( matrix[0],
-                    (ac.get_ydata(),bc.get_ydata(),cc.get_ydata()))
-                bcydata = num.dot( matrix[1],
-                    (ac.get_ydata(),bc.get_ydata(),cc.get_ydata()))
-                ccydata = num.dot( matrix[2],
-                    (ac.get_ydata(),bc.get_ydata(),cc.get_ydata()))
-                
-                ac.set_ydata(acydata)
-                bc.set_ydata(bcydata)
-                cc.set_ydata(ccydata)
+    combis = []
+    for a, b, c in _matching_combinations(traces, in_channels):
+        tmin = max(a.tmin, b.tmin, c.tmin)
+        tmax = min(a.tmax, b.tmax, c.tmax)
 
-                ac.set_codes(channel=out_channels[0])
-                bc.set_codes(channel=out_channels[1])
-                cc.set_codes(channel=out_channels[2])
-                
-                projected.append(ac)
-                projected.append(bc)
-                projected.append(cc)
+        if tmin >= tmax:
+            continue
 
-    return projected
+        chopped = _chop_combination((a, b, c), tmin, tmax)
+        if chopped is None:
+            logger.warn('Cannot project traces with displaced sampling (%s,%s,%s,%s)' % a.nslc_id)
+            continue
+
+        combis.append(chopped)
+
+    return _project_combinations(combis, matrix, out_channels)
 
 
 def correlate(a, b, mode='valid', normalization=None, use_fft=False):
@@ -2055,7 +2381,93 @@ class FrequencyResponse(Object):
     def evaluate(self, freqs):
         coefs = num.ones(freqs.size, dtype=num.complex)
         return coefs
+
+    # Names of the attributes which determine the response. Must be set in
+    # the class itself (it is not inherited), to enable caching of evaluated
+    # responses for the class.
+    _cache_key_attributes = ()
+
+    def _cache_key(self):
+        '''
+        Get hashable key identifying the response or ``None``.
+
+        Used to cache evaluated responses in :py:meth:`Trace.transfer`.
+        Responses returning ``None`` are not cached.
+        '''
+
+        cls = type(self)
+        if '_cache_key_attributes' not in cls.__dict__:
+            return None
+
+        key = [cls.__name__]
+        for attribute in cls._cache_key_attributes:
+            v = getattr(self, attribute)
+            if isinstance(v, list):
+                v = tuple(v)
+            elif isinstance(v, num.ndarray):
+                v = (v.dtype.str, v.shape, v.tostring())
+
+            key.append(v)
+
+        return tuple(key)
    
+g_resp_epochs = {}
+
+
+def _resp_epoch(respfile, mtime, nslc_id, instant):
+    '''
+    Get time span of the RESP epoch of a channel, valid at a given instant.
+
+    Epochs are read once per file and modification time. Returns ``None``
+    if the file cannot be read or no matching epoch is found.
+    '''
+
+    k = (respfile, mtime)
+    if k not in g_resp_epochs:
+        from pyrocko.fdsn import resp
+        try:
+            g_resp_epochs[k] = resp.load_epochs_filename(respfile)
+        except (IOError, resp.RespError):
+            g_resp_epochs[k] = []
+
+    for codes, tmin, tmax in g_resp_epochs[k]:
+        if codes == tuple(nslc_id) and \
+                (tmin is None or tmin <= instant) and \
+                (tmax is None or instant < tmax):
+
+            return tmin, tmax
+
+    return None
+
+
+def _evalresp_cache_key(response):
+    '''
+    Get cache key for :py:class:`Evalresp` and :py:class:`InverseEvalresp`.
+
+    Instead of the instant, the RESP epoch valid at the instant goes into the
+    key, because traces are usually processed with a different instant each
+    but share the same epoch. If no matching epoch can be found, the instant
+    itself is used.
+    '''
+
+    key = FrequencyResponse._cache_key(response)
+    if key is None:
+        return None
+
+    try:
+        mtime = os.stat(response.respfile).st_mtime
+    except OSError:
+        return None
+
+    epoch = _resp_epoch(
+        response.respfile, mtime, response.nslc_id, response.instant)
+
+    if epoch is None:
+        return key + (mtime, 'instant', response.instant)
+    else:
+        return key + (mtime, 'epoch') + epoch
+
+
 class Evalresp(FrequencyResponse):
     '''
     Calls evalresp and generates values of the instrument response transfer function.
@@ -2095,6 +2507,11 @@ class Evalresp(FrequencyResponse):
         transfer = x[0][4]
         return transfer
 
+    _cache_key_attributes = ('respfile', 'nslc_id', 'target')
+
+    def _cache_key(self):
+        return _evalresp_cache_key(self)
+
 class InverseEvalresp(FrequencyResponse):
     '''
     Calls evalresp and generates values of the inverse instrument response for 
@@ -2131,6 +2548,11 @@ class InverseEvalresp(FrequencyResponse):
         transfer = x[0][4]
         return 1./transfer
 
+    _cache_key_attributes = ('respfile', 'nslc_id', 'target')
+
+    def _cache_key(self):
+        return _evalresp_cache_key(self)
+
 class PoleZeroResponse(FrequencyResponse):
     '''Evaluates frequency response from pole-zero representation.
 
@@ -2160,15 +2582,10 @@ class PoleZeroResponse(FrequencyResponse):
         FrequencyResponse.__init__(self, zeros=zeros, poles=poles, constant=constant)
         
     def evaluate(self, freqs):
-        jomeg = 1.0j* 2.*num.pi*freqs
-        
-        a = num.ones(freqs.size, dtype=num.complex)*self.constant
-        for z in self.zeros:
-            a *= jomeg-z
-        for p in self.poles:
-            a /= jomeg-p
-        
-        return a
+        return evaluate_pole_zero(
+            freqs, self.zeros, self.poles, self.constant)
+
+    _cache_key_attributes = ('zeros', 'poles', 'constant')
 
 class ButterworthResponse(FrequencyResponse):
     '''Butterworth frequency response.
@@ -2187,6 +2604,8 @@ class ButterworthResponse(FrequencyResponse):
         w, h = signal.freqs(b, a, freqs)
         return h
 
+    _cache_key_attributes = ('corner', 'order', 'type')
+
 class SampledResponse(FrequencyResponse):
     '''Interpolates frequency response given at a set of sampled frequencies.
     
@@ -2210,6 +2629,8 @@ class SampledResponse(FrequencyResponse):
         eimag = num.interp(freqs, self.frequencies, num.imag(self.values), left=self.left, right=self.right)
         transfer = ereal + 1.0j*eimag
         return transfer
+
+    _cache_key_attributes = ('frequencies', 'values', 'left', 'right')
     
     def inverse(self):
         '''Get inverse as a new :py:class:`SampledResponse` object.'''
@@ -2245,6 +2666,8 @@ class IntegrationResponse(FrequencyResponse):
         resp[num.logical_not(nonzero)] = 0.0
         return resp
 
+    _cache_key_attributes = ('n', 'gain')
+
 class DifferentiationResponse(FrequencyResponse):
     '''The differentiation response, optionally multiplied by a constant gain.
 
@@ -2265,6 +2688,8 @@ class DifferentiationResponse(FrequencyResponse):
     def evaluate(self, freqs):
         return self.gain * (1.0j * 2. * num.pi * freqs)**self.n
 
+    _cache_key_attributes = ('n', 'gain')
+
 class AnalogFilterResponse(FrequencyResponse):
     '''Frequency response of an analog filter.
     
@@ -2279,6 +2704,8 @@ class AnalogFilterResponse(FrequencyResponse):
     def evaluate(self, freqs):
         return signal.freqs(self.b, self.a, freqs/(2.*num.pi))[1]
 
+    _cache_key_attributes = ('b', 'a')
+
 class MultiplyResponse(FrequencyResponse):
     '''Multiplication of several :py:class:`FrequencyResponse` objects.'''
 
@@ -2290,12 +2717,100 @@ class MultiplyResponse(FrequencyResponse):
         FrequencyResponse.__init__(self, responses=responses)
 
     def evaluate(self, freqs):
-        a = num.ones(freqs.size, dtype=num.complex)
+        # pole-zero responses are merged and evaluated in one go
+        zeros = []
+        poles = []
+        constant = 1.0
+        others = []
         for resp in self.responses:
+            if type(resp) is PoleZeroResponse:
+                zeros.extend(resp.zeros)
+                poles.extend(resp.poles)
+                constant *= resp.constant
+            else:
+                others.append(resp)
+
+        a = evaluate_pole_zero(freqs, zeros, poles, constant)
+        for resp in others:
             a *= resp.evaluate(freqs)
 
         return a
 
+    def _cache_key(self):
+        if type(self) is not MultiplyResponse:
+            return None
+
+        keys = tuple(resp._cache_key() for resp in self.responses)
+        if None in keys:
+            return None
+
+        return ('MultiplyResponse',) + keys
+
+
+def evaluate_pole_zero(freqs, zeros, poles, constant):
+    '''Evaluate pole-zero response at given frequencies.
+
+    See :py:class:`PoleZeroResponse`. The products over zeros and poles are
+    computed on 2D arrays (frequencies x roots).
+    '''
+
+    jomeg = 1.0j * 2.*num.pi*num.asarray(freqs, dtype=num.float)
+
+    a = num.empty(jomeg.size, dtype=num.complex)
+    a.fill(constant)
+    if len(zeros):
+        a *= num.prod(
+            jomeg[:, num.newaxis] - num.asarray(zeros, dtype=num.complex),
+            axis=1)
+    if len(poles):
+        a /= num.prod(
+            jomeg[:, num.newaxis] - num.asarray(poles, dtype=num.complex),
+            axis=1)
+
+    return a
+
+
+class TaperedCoefsCache(object):
+    '''
+    Bounded LRU cache for evaluated, tapered transfer functions.
+
+    :param nbytes_max: maximum total size of the cached arrays
+    '''
+
+    def __init__(self, nbytes_max=100*1024*1024):
+        self._nbytes_max = nbytes_max
+        self._nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, k):
+        with self._lock:
+            if k not in self._entries:
+                return None
+
+            coefs = self._entries.pop(k)
+            self._entries[k] = coefs
+            return coefs
+
+    def put(self, k, coefs):
+        with self._lock:
+            if k in self._entries:
+                return
+
+            self._entries[k] = coefs
+            self._nbytes += coefs.nbytes
+            while self._nbytes > self._nbytes_max and len(self._entries) > 1:
+                _, cold = self._entries.popitem(last=False)
+                self._nbytes -= cold.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+g_tapered_coefs_cache = TaperedCoefsCache()
+
 def asarray_1d(x, dtype):
     if isinstance(x, (list, tuple)) and x and isinstance(x[0], basestring):
         return num.asarray(map(dtype, x), dtype=dtype)
@@ -2682,6 +3197,48 @@ def co_dropsamples(target, q, nfir):
     except GeneratorExit:
         target.close()
 
+@coroutine
+def co_fir_decimate(target, q, b):
+    '''Successively FIR filter and downsample broken continuous trace data
+    (coroutine).
+
+    Polyphase implementation of ``co_antialias(co_dropsamples(...))`` for
+    FIR filters, see :py:func:`co_downsample`. Only the output samples which
+    are kept are computed. The filter history and the decimation phase are
+    kept *per channel* and are reset when gaps occur.
+    '''
+
+    nfir = b.size - 1
+    try:
+        states = States()
+        while True:
+            tr = (yield)
+            newdeltat = q * tr.deltat
+            state = states.get(tr)
+            if state is None:
+                # same choice of sampling instances as in co_dropsamples
+                history = None
+                newtmin_want = math.ceil((tr.tmin+(nfir+1)*tr.deltat)/newdeltat) * newdeltat - (nfir/2*tr.deltat)
+                ioffset = int(round((newtmin_want - tr.tmin)/tr.deltat))
+                if ioffset < 0:
+                    ioffset = ioffset % q
+            else:
+                history, ioffset = state
+
+            ydata, history = util.fir_decimate(
+                tr.get_ydata(), b, q, ioffset, history)
+
+            newtmin_have = tr.tmin + ioffset * tr.deltat
+            newtr = tr.copy(data=False)
+            newtr.deltat = newdeltat
+            newtr.tmin = newtmin_have - (nfir/2*tr.deltat) # because the fir kernel shifts data by nfir/2 samples
+            newtr.set_ydata(ydata)
+            states.set(tr, (history, (ioffset % q - tr.data_len() % q ) % q))
+            target.send(newtr)
+
+    except GeneratorExit:
+        target.close()
+
 def co_downsample(target, q, n=None, ftype='fir'):
     '''Successively downsample broken continuous trace data (coroutine).
 
@@ -2699,8 +3256,14 @@ def co_downsample(target, q, n=None, ftype='fir'):
     
     Filter state is reset, when gaps occur. The sampling instances are choosen
     so that they occur at (or as close as possible) to even multiples of the
-    sampling interval of the downsampled trace (based on system time).'''
+    sampling interval of the downsampled trace (based on system time).
+
+    FIR filters (ftype ``'fir'`` or ``'fir-polyphase'``) are evaluated with
+    the polyphase method, see :py:func:`co_fir_decimate`.'''
     b,a,n = util.decimate_coeffs(q,n,ftype)
+    if ftype in ('fir', 'fir-polyphase'):
+        return co_fir_decimate(target, q, b)
+
     return co_antialias(co_dropsamples(target,q,n), q,n,ftype)
         
 @coroutine
@@ -2730,6 +3293,193 @@ def co_downsample_to(target, deltat):
             g.close()
 
 
+@coroutine
+def co_sta_lta(target, tshort, tlong, method='classic', quad=True):
+    '''Successively apply STA/LTA to broken continuous trace data (coroutine).
+
+    Create coroutine which takes :py:class:`Trace` objects and sends new
+    :py:class:`Trace` objects containing the STA/LTA ratio to target. See
+    :py:func:`pyrocko.autopick.sta_lta` for the meaning of the arguments.
+    Only the causal methods ``'classic'`` and ``'recursive'`` are available.
+
+    Filter states are kept *per channel*, and are reset when gaps occur (see
+    :py:func:`co_lfilter`). After a reset, the ratio is zero until the long
+    time window is filled.
+    '''
+
+    if method not in ('classic', 'recursive'):
+        raise Exception('STA/LTA method not available in co_sta_lta: %s' %
+                        method)
+
+    try:
+        states = States()
+        while True:
+            tr = (yield)
+
+            stalta = states.get(tr)
+            if stalta is None:
+                stalta = autopick.STALTA(
+                    int(round(tshort/tr.deltat)), int(round(tlong/tr.deltat)),
+                    method=method, quad=quad, nparallel=1)
+
+            output = tr.copy(data=False)
+            output.set_ydata(stalta.process(tr.get_ydata()))
+            states.set(tr, stalta)
+            target.send(output)
+
+    except GeneratorExit:
+        target.close()
+
+
+def hilbert_fir(n):
+    '''Get coefficients of Hamming windowed FIR Hilbert transformer.
+
+    :param n: half length, the filter has ``2*n+1`` coefficients and delays
+        the signal by *n* samples
+    '''
+
+    k = num.arange(-n, n+1)
+    h = num.zeros(2*n+1)
+    odd = k % 2 != 0
+    h[odd] = 2.0 / (num.pi * k[odd])
+    return h * num.hamming(2*n+1)
+
+
+@coroutine
+def co_envelope(target, n=50):
+    '''Successively compute envelope of broken continuous trace data
+    (coroutine).
+
+    Create coroutine which takes :py:class:`Trace` objects and sends new
+    :py:class:`Trace` objects containing the envelope of the data to target.
+    The Hilbert transform is approximated with a FIR filter (see
+    :py:func:`hilbert_fir`), so that the envelope can be computed
+    incrementally. Periods longer than about *n* samples are not represented
+    well. The output is delayed by *n* samples with respect to the input,
+    which is compensated by setting the start time of the output traces *n*
+    samples earlier.
+
+    Filter states are kept *per channel*, and are reset when gaps occur (see
+    :py:func:`co_lfilter`).
+    '''
+
+    h = hilbert_fir(n)
+    try:
+        states = States()
+        while True:
+            tr = (yield)
+
+            state = states.get(tr)
+            if state is None:
+                zi = num.zeros(2*n, dtype=num.float)
+                delayed = num.zeros(n, dtype=num.float)
+            else:
+                zi, delayed = state
+
+            ydata = tr.get_ydata().astype(num.float)
+            yh, zf = signal.lfilter(h, [1.0], ydata, zi=zi)
+            ydelayed = num.concatenate((delayed, ydata))
+            states.set(tr, (zf, ydelayed[ydelayed.size-n:]))
+
+            output = tr.copy(data=False)
+            output.shift(-n*tr.deltat)
+            output.set_ydata(num.sqrt(ydelayed[:ydata.size]**2 + yh**2))
+            target.send(output)
+
+    except GeneratorExit:
+        target.close()
+
+
+@coroutine
+def co_trigger(target, threshold, tsearch):
+    '''Successively detect peaks in broken continuous trace data (coroutine).
+
+    Create coroutine which takes :py:class:`Trace` objects and detects peaks
+    like :py:meth:`Trace.peaks`: from every instant, where the signal rises
+    above *threshold*, a time length of *tsearch* seconds is searched for a
+    maximum. For each peak, a tuple ``(nslc_id, tpeak, apeak)`` is sent to
+    target. Peaks are reported as soon as their search window is complete,
+    also when it spans several input traces. Crossings of the threshold
+    inside of an active search window are ignored.
+
+    Trigger states are kept *per channel*, and are reset when gaps occur (see
+    :py:func:`co_lfilter`). A search window which is still open at a gap or
+    when the coroutine is closed is truncated there and its peak is reported,
+    as :py:meth:`Trace.peaks` does at the end of a trace.
+    '''
+
+    def flush(state):
+        nslc_id, _, _, tpeak, apeak = state
+        if apeak is not None:
+            target.send((nslc_id, tpeak, apeak))
+
+    class TriggerStates(States):
+        def free(self, state):
+            flush(state)
+
+    try:
+        states = TriggerStates()
+        while True:
+            tr = (yield)
+            y = tr.get_ydata()
+            n = y.size
+            nsearch = int(math.ceil(tsearch/tr.deltat))
+
+            # state: nslc_id, last sample above threshold, number of samples
+            # left to search, time and value of maximum found so far; it is
+            # registered before processing so that a pending peak of a
+            # reset state is reported first
+            state = states.get(tr)
+            if state is None:
+                state = [tr.nslc_id, True, 0, None, None]
+
+            states.set(tr, state)
+
+            _, was_above, nleft, tpeak, apeak = state
+
+            above = y > threshold
+            itrigs = num.nonzero(above[1:] & ~above[:-1])[0] + 1
+            if n > 0 and above[0] and not was_above:
+                itrigs = num.concatenate(([0], itrigs))
+
+            icur = 0
+            if nleft:
+                itrigs = num.concatenate(([-1], itrigs))
+
+            for itrig in itrigs:
+                if itrig == -1:
+                    ibeg, iend = 0, min(nleft, n)
+                    nleft -= iend
+                elif itrig < icur:
+                    continue
+                else:
+                    ibeg, iend = itrig, min(itrig + nsearch, n)
+                    nleft = itrig + nsearch - iend
+                    tpeak, apeak = None, None
+
+                if iend > ibeg:
+                    ipeak = ibeg + num.argmax(y[ibeg:iend])
+                    if apeak is None or y[ipeak] > apeak:
+                        tpeak = tr.tmin + ipeak*tr.deltat
+                        apeak = y[ipeak]
+
+                icur = iend
+                if nleft == 0:
+                    target.send((tr.nslc_id, tpeak, apeak))
+                    tpeak, apeak = None, None
+
+            if n > 0:
+                was_above = above[-1]
+
+            state[1:] = [was_above, nleft, tpeak, apeak]
+
+    except GeneratorExit:
+        for (_, _, _, state) in states._states.values():
+            flush(state)
+
+        target.close()
+
+
 class DomainChoice(StringChoice):
     choices = [
         'time_domain',
@@ -2849,7 +3599,8 @@ def do_filter(inp, filter):
         return inp
     else:
         tr, frequencies, spectrum = inp
-        spectrum *= filter.evaluate(frequencies)
+        # not in place, the input may still be cached in the previous stage
+        spectrum = spectrum * filter.evaluate(frequencies)
         return [tr, frequencies, spectrum]
 
 def do_ifft(inp):
@@ -2862,6 +3613,120 @@ def do_ifft(inp):
         tr.set_ydata(num.fft.irfft(spectrum)[:ndata])
         return tr
 
+def _process_many(traces, tmins, tmaxs, deltats, setup):
+    # Same processing as in Trace.run_chain, but with the FFTs, filtering
+    # and IFFTs of traces with equal sampling and length done in single 2D
+    # array operations.
+
+    tapered = [
+        do_pre_taper(do_extend(do_downsample(tr, deltat), tmin, tmax),
+                     setup.taper)
+        for (tr, tmin, tmax, deltat) in zip(traces, tmins, tmaxs, deltats)]
+
+    if setup.filter is None:
+        processed = tapered
+    else:
+        groups = {}
+        for i, tr in enumerate(tapered):
+            ndata = tr.ydata.size
+            groups.setdefault((tr.deltat, nextpow2(ndata)), []).append(i)
+
+        spectra = [None] * len(tapered)
+        for (deltat, nfft), ii in groups.iteritems():
+            padded = num.zeros((len(ii), nfft), dtype=num.float)
+            for j, i in enumerate(ii):
+                padded[j, :tapered[i].ydata.size] = tapered[i].ydata
+
+            spectrum = num.fft.rfft(padded, axis=1)
+            df = 1.0 / (deltat * nfft)
+            frequencies = num.arange(spectrum.shape[1])*df
+            spectrum *= setup.filter.evaluate(frequencies)[num.newaxis, :]
+            for j, i in enumerate(ii):
+                spectra[i] = spectrum[j]
+
+            if setup.domain != 'frequency_domain':
+                ydatas = num.fft.irfft(spectrum, nfft, axis=1)
+                for j, i in enumerate(ii):
+                    spectra[i] = ydatas[j]
+
+        if setup.domain == 'frequency_domain':
+            return [num.abs(spectrum) for spectrum in spectra], None
+
+        processed = []
+        for tr, ydata in zip(tapered, spectra):
+            ndata = tr.ydata.size
+            tr = tr.copy(data=False)
+            tr.set_ydata(ydata[:ndata])
+            processed.append(tr)
+
+    if setup.domain == 'envelope':
+        processed = [tr.envelope(inplace=False) for tr in processed]
+
+    elif setup.domain == 'absolute':
+        for tr in processed:
+            tr.set_ydata(num.abs(tr.get_ydata()))
+
+    return [tr.get_ydata() for tr in processed], processed
+
+
+def misfit_many(observeds, candidates, setup, nocache=False):
+    '''
+    Calculate misfits and normalization factors for many pairs of traces.
+
+    Batched version of :py:meth:`Trace.misfit`. The processed observed
+    traces are cached in their processing chains (with bounded size), the
+    candidates are processed without caching, with all FFTs done as 2D
+    array operations.
+
+    :param observeds: list of :py:class:`Trace` objects
+    :param candidates: list of :py:class:`Trace` objects of same length
+    :param setup: :py:class:`MisfitSetup` object
+    :returns: tuple ``(ms, ns)`` of arrays, with misfit values and
+        normalization divisors of the pairs
+    '''
+
+    if len(observeds) != len(candidates):
+        raise ValueError(
+            'misfit_many: observeds and candidates differ in length')
+
+    if not observeds:
+        return num.zeros(0), num.zeros(0)
+
+    if setup.domain == 'cc_max_norm' or (
+            setup.domain == 'frequency_domain' and setup.filter is None):
+
+        ms, ns = num.array([
+            a.misfit(b, setup, nocache=nocache)
+            for (a, b) in zip(observeds, candidates)]).T
+
+        return ms, ns
+
+    deltats = [max(a.deltat, b.deltat)
+               for (a, b) in zip(observeds, candidates)]
+    tmins = [min(a.tmin, b.tmin) - deltat
+             for (a, b, deltat) in zip(observeds, candidates, deltats)]
+    tmaxs = [max(a.tmax, b.tmax) + deltat
+             for (a, b, deltat) in zip(observeds, candidates, deltats)]
+
+    if nocache:
+        adatas, _ = _process_many(observeds, tmins, tmaxs, deltats, setup)
+    else:
+        adatas = []
+        for a, tmin, tmax, deltat in zip(observeds, tmins, tmaxs, deltats):
+            if not a._pchain:
+                a.init_chain()
+
+            adatas.append(a.run_chain(tmin, tmax, deltat, setup, False)[0])
+
+    bdatas, _ = _process_many(candidates, tmins, tmaxs, deltats, setup)
+
+    ms, ns = num.array([
+        Lx_norm(bdata, adata, norm=setup.norm)
+        for (adata, bdata) in zip(adatas, bdatas)]).T
+
+    return ms, ns
+
+
 def check_alignment(t1, t2):
     if abs(t1.tmin-t2.tmin) > t1.deltat * 1e-4 or \
             abs(t1.tmax - t2.tmax) > t1.deltat * 1e-4 or \
@@ -320,12 +320,12 @@ def decimate_coeffs(q, n=None, ftype='iir'):
         raise Error, "q should be an integer"
 
     if n is None:
-        if ftype == 'fir':
+        if ftype in ('fir', 'fir-polyphase'):
             n = 30
         else:
             n = 8
             
-    if ftype == 'fir':
+    if ftype in ('fir', 'fir-polyphase'):
         coeffs = GlobalVars.decimate_fir_coeffs
         if (n, 1./q) not in coeffs:
             coeffs[n,1./q] = signal.firwin(n+1, 1./q, window='hamming')
@@ -342,6 +342,45 @@ def decimate_coeffs(q, n=None, ftype='iir'):
         return b, a, n
 
 
+def fir_decimate(x, b, q, istart, history=None):
+    '''Apply FIR filter and keep every q-th output sample.
+
+    Polyphase implementation: only the kept output samples are computed.
+    Equivalent to ``signal.lfilter(b, [1.], x)[istart::q]`` with the input
+    preceded by the samples in *history*.
+
+    :param x: input signal (1D NumPy array)
+    :param b: FIR filter coefficients
+    :param q: decimation factor
+    :param istart: index of the first output sample
+    :param history: the ``len(b)-1`` input samples preceding *x* (zeros by
+        default)
+    :returns: ``(y, history)``, the decimated signal and the history to be
+        used for the continuation of *x*
+    '''
+
+    from pyrocko import signal_ext
+
+    x = num.ascontiguousarray(x, dtype=num.float64)
+    b = num.ascontiguousarray(b, dtype=num.float64)
+    nb = b.size
+    if history is None:
+        history = num.zeros(nb-1, dtype=num.float64)
+    else:
+        history = num.ascontiguousarray(history, dtype=num.float64)
+
+    ny = max(0, (x.size - istart + q - 1) // q)
+    y = num.empty(ny, dtype=num.float64)
+    signal_ext.fir_decimate(x, b, q, istart, history, y)
+
+    if x.size >= nb-1:
+        history_out = x[x.size-(nb-1):].copy()
+    else:
+        history_out = num.concatenate((history, x))[-(nb-1):]
+
+    return y, history_out
+
+
 def decimate(x, q, n=None, ftype='iir', zi=None, ioff=0):
     """Downsample the signal x by an integer factor q, using an order n filter
     
@@ -352,14 +391,32 @@ def decimate(x, q, n=None, ftype='iir', zi=None, ioff=0):
     :param q: the downsampling factor
     :param n: order of the filter (1 less than the length of the filter for a
          'fir' filter)
-    :param ftype: type of the filter; can be 'iir' or 'fir'
+    :param ftype: type of the filter; can be 'iir', 'fir' or
+         'fir-polyphase'
     
     :returns: the downsampled signal (1D NumPy array)
 
+    The FIR filter is evaluated with the polyphase method (see
+    :py:func:`fir_decimate`), except if filter states in the form of
+    :py:func:`scipy.signal.lfilter` are passed in with *zi* for ftype
+    'fir'. For ftype 'fir-polyphase', the state passed in and returned is
+    the history of the last n input samples instead.
     """
 
     b, a, n = decimate_coeffs(q,n,ftype)
-            
+
+    if ftype == 'fir-polyphase' or (ftype == 'fir' and zi is None):
+        if zi is None or zi is True:
+            history = None
+        else:
+            history = zi
+
+        y, history = fir_decimate(x, b, q, n/2+ioff, history)
+        if zi is not None:
+            return y, history
+        else:
+            return y
+
     if zi is None or zi is True:
         zi_ = num.zeros(max(len(a),len(b))-1, dtype=num.float)
     else:
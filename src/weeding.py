@@ -1,5 +1,6 @@
 import math, time
 import numpy as num
+from scipy.spatial import cKDTree
 from pyrocko import orthodrome
 
 def neighborhood_density(dists, neighborhood=1):
@@ -7,65 +8,125 @@ def neighborhood_density(dists, neighborhood=1):
     sdists.sort(axis=1)
     meandists = num.mean(sdists[:,1:1+neighborhood],axis=1)
     return meandists
-    
 
-def _weed(dists, badnesses, neighborhood=1, interaction_radius=3., del_frac=4, max_del=100, max_depth=100, depth=0):
-    if depth > max_depth:
-        assert False, 'max recursion depth reached'
-    
-    meandists = neighborhood_density(dists, neighborhood)
-    
-    order = meandists.argsort()
-    candidates = order[:order.size/del_frac+1]
-    badness_candidates = badnesses[candidates]
-    order_badness = (-badness_candidates).argsort()
-    
-    order[:order.size/del_frac+1] = order[:order.size/del_frac+1][order_badness]
-    
-    deleted = num.zeros(order.size, dtype=num.bool)
-    ndeleted = 0
-    for i,ind in enumerate(order):
-        if (i<order.size/del_frac/2+1 and 
-            ndeleted < max_del and 
-                num.all(dists[ind,deleted] > interaction_radius*meandists[ind])):
-            deleted[ind] = True
-            ndeleted += 1
-           
-    if ndeleted == 0:
-        return deleted
-    
-    kept = num.logical_not(deleted).nonzero()[0]
-    
-    xdists = dists[num.meshgrid(kept,kept)]
-    xbadnesses = badnesses[kept]
-    xdeleted = _weed(xdists, xbadnesses, neighborhood, interaction_radius, del_frac, 
-                                max_del-ndeleted, max_depth, depth+1)
-    
-    deleted[kept] = xdeleted
-    return deleted
+
+class WeedingIndex(object):
+    '''Spatial index for station weeding.
+
+    Distances are measured as in a plane with the *x* coordinate (e.g.
+    azimuth in [deg]) being periodic with a period of 360. Backed by a
+    KD-tree, so that memory needs grow linearly with the number of points.
+    '''
+
+    def __init__(self, x, y):
+        x = num.asarray(x, dtype=num.float) % 360.
+        # tiny negative values wrap to exactly 360., outside of the box
+        x[x >= 360.] = 0.
+        y = num.asarray(y, dtype=num.float)
+        ymin = num.min(y) if y.size else 0.
+        yrange = num.max(y) - ymin if y.size else 0.
+
+        self._points = num.vstack((x, y - ymin)).T
+
+        # a box larger than twice the extent makes the y axis effectively
+        # non-periodic; cKDTree cannot handle an empty set with a box
+        if self.size != 0:
+            self._tree = cKDTree(
+                self._points, boxsize=(360., 2.*yrange + 1.))
+        else:
+            self._tree = None
+
+    @property
+    def size(self):
+        return self._points.shape[0]
+
+    def neighborhood_density(self, neighborhood=1):
+        '''Mean distance of each point to its *neighborhood* nearest
+        neighbors.
+
+        Points without any neighbors get a density of NaN.'''
+
+        if self.size <= 1:
+            return num.repeat(num.nan, self.size)
+
+        k = min(neighborhood+1, self.size)
+        dists, _ = self._tree.query(self._points, k=k, n_jobs=-1)
+        dists = dists.reshape((self.size, k))
+        return num.mean(dists[:, 1:], axis=1)
+
+    def neighbors(self, i, radius):
+        '''Indices of points within distance *radius* of point *i*.'''
+
+        return self._tree.query_ball_point(self._points[i], radius)
+
+
+def _weed(x, y, badnesses, neighborhood=1, interaction_radius=3., del_frac=4, max_del=100, max_depth=100):
+    deleted_all = num.zeros(x.size, dtype=num.bool)
+    kept = num.arange(x.size)
+    for depth in xrange(max_depth+1):
+        if kept.size <= 1:
+            return deleted_all
+
+        index = WeedingIndex(x[kept], y[kept])
+        meandists = index.neighborhood_density(neighborhood)
+
+        order = meandists.argsort()
+        candidates = order[:order.size/del_frac+1]
+        badness_candidates = badnesses[kept][candidates]
+        order_badness = (-badness_candidates).argsort()
+
+        order[:order.size/del_frac+1] = order[:order.size/del_frac+1][order_badness]
+
+        deleted = num.zeros(order.size, dtype=num.bool)
+        ndeleted = 0
+        for i,ind in enumerate(order):
+            if not (i<order.size/del_frac/2+1 and ndeleted < max_del):
+                break
+
+            near = index.neighbors(ind, interaction_radius*meandists[ind])
+            if not num.any(deleted[near]):
+                deleted[ind] = True
+                ndeleted += 1
+
+        if ndeleted == 0:
+            return deleted_all
+
+        deleted_all[kept[deleted]] = True
+        kept = kept[num.logical_not(deleted)]
+        max_del -= ndeleted
+
+    assert False, 'max recursion depth reached'
 
 def weed(x, y, badnesses, neighborhood=1, nwanted=None, interaction_radius=3.):
+    '''Thin out a set of points, preferably removing bad ones in dense
+    regions.
+
+    Memory and time needs scale with ``N log N``, so that sets of 10^5 points
+    can be handled.
+
+    :returns: ``(deleted, meandists_kept)``, mask of deleted points and
+        neighborhood densities of the kept points
+    '''
+
+    x = num.asarray(x, dtype=num.float)
+    y = num.asarray(y, dtype=num.float)
+    badnesses = num.asarray(badnesses, dtype=num.float)
     assert x.size == y.size
     n = x.size
-    NEW = num.newaxis
-    ax = x[NEW,:]
-    ay = y[NEW,:]
-    bx = x[:,NEW]
-    by = y[:,NEW]
-    
+
     if nwanted is None:
         nwanted = n/2
-    
-    dx = num.abs(ax-bx)
-    dx = num.where(dx > 180., 360.-dx, dx)
-    
-    dists = num.sqrt(dx**2 + (ay-by)**2)
-    deleted = _weed(dists, badnesses, neighborhood, interaction_radius, del_frac=4,
-                              max_del=n-nwanted, max_depth=500, depth=0)    
+
+    if n == 0:
+        return num.zeros(0, dtype=num.bool), num.zeros(0, dtype=num.float)
+
+    deleted = _weed(x, y, badnesses, neighborhood, interaction_radius, del_frac=4,
+                    max_del=n-nwanted, max_depth=500)
 
     kept = num.logical_not(deleted).nonzero()[0]
-    dists_kept = dists[num.meshgrid(kept,kept)]
-    meandists_kept = neighborhood_density(dists_kept, neighborhood)
+    meandists_kept = WeedingIndex(x[kept], y[kept]).neighborhood_density(
+        neighborhood)
+
     return deleted, meandists_kept
 
 def badnesses_c_mean(badnesses_nslc):
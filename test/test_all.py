@@ -20,6 +20,12 @@ from test_guts import GutsTestCase
 from test_parstack import ParstackTestCase
 from test_geonames import GeonamesTestCase
 from test_cake import CakeTestCase
+from test_topo import TopoTestCase
+from test_automap import AutomapTestCase
+from test_template_matching import TemplateMatchingTestCase
+from test_migration import MigrationTestCase
+from test_eventdata import EventDataTestCase
+from test_weeding import WeedingTestCase
 
 import unittest
 import optparse
@@ -0,0 +1,39 @@
+import unittest
+import numpy as num
+
+from pyrocko import util, automap
+
+
+class AutomapTestCase(unittest.TestCase):
+
+    def test_illumination(self):
+        # ridge running north-south, rows from south to north
+        x = num.linspace(-1., 1., 41)
+        data = num.tile(-num.abs(x), (30, 1)) * 1000.
+
+        # light from the west: western flank bright, eastern flank dark,
+        # as with GMT's grdgradient -A270 -Ne
+        ilum = automap.illumination(data, 0.8, azimuth=270.)
+        assert num.all(ilum[:, :19] > 0.)
+        assert num.all(ilum[:, 22:] < 0.)
+        assert num.all(num.abs(ilum) <= 0.8)
+
+        # light from the east
+        ilum = automap.illumination(data, 0.8, azimuth=90.)
+        assert num.all(ilum[:, :19] < 0.)
+        assert num.all(ilum[:, 22:] > 0.)
+
+        # slope rising to the north, light from the north
+        data = num.tile(-num.abs(x)[:, num.newaxis], (1, 30)) * 1000.
+        ilum = automap.illumination(data, 0.8, azimuth=0.)
+        assert num.all(ilum[22:, :] > 0.)
+        assert num.all(ilum[:19, :] < 0.)
+
+        # flat terrain gives no shading
+        assert num.all(
+            automap.illumination(num.zeros((10, 10)), 0.8) == 0.)
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_automap', 'warning')
+    unittest.main()
@@ -155,6 +155,42 @@ class BeachballTestCase(unittest.TestCase):
 
             self.compare_beachball(mt)
 
+    def test_pixmaps(self):
+        from matplotlib import pyplot as plt
+
+        num.random.seed(3)
+        npix = 40
+        mts = mtm.MomentTensors.random_mt(20)
+        pixmaps = beachball.beachball_pixmaps(mts, npix=npix)
+        self.assertEqual(pixmaps.shape, (20, npix, npix))
+
+        ii_ok, vecs3 = beachball.pixmap_grid('lambert', npix)
+        for pixmap, mt in zip(pixmaps, mts.moment_tensors()):
+            mt = beachball.deco_part(mt, 'deviatoric')
+            ep, en, et, vp, vn, vt = mt.eigensystem()
+            rtp = beachball.numpy_xyz2rtp(
+                num.dot(num.vstack((vn, vt, vp)), vecs3.T).T)
+
+            atheta, aphi = rtp[:, 1], rtp[:, 2]
+            amps_ok = ep * num.cos(atheta)**2 + (
+                en * num.cos(aphi)**2 + et * num.sin(aphi)**2) \
+                * num.sin(atheta)**2
+
+            signs = num.zeros(npix*npix, dtype=num.int8)
+            signs[ii_ok] = num.where(amps_ok > 0., 1, -1)
+            assert num.all(signs.reshape((npix, npix)).T == pixmap)
+
+        fig = plt.figure(figsize=(3, 3), dpi=100)
+        axes = fig.add_subplot(1, 1, 1, aspect=1.)
+        positions = num.random.uniform(0., 10., size=(20, 2))
+        im = beachball.plot_beachballs_mpl_pixmap(
+            mts, axes, positions, size=1.0, npix=npix)
+
+        self.assertEqual(im.get_array().shape[2], 4)
+        f = StringIO()
+        fig.savefig(f, format='png')
+        plt.close(fig)
+
     def off_test_plotstyle(self):
 
         # contour and contourf do not support transform
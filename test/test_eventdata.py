@@ -0,0 +1,73 @@
+import unittest
+import numpy as num
+
+from pyrocko import trace, pile, util, model, eventdata
+
+
+class MemEventDataAccess(eventdata.EventDataAccess):
+
+    def get_restitution(self, tr, allowed_methods):
+        if tr.channel == 'X':
+            raise eventdata.NoRestitution('no response for X')
+
+        return trace.PoleZeroResponse(
+            zeros=[0., 0.],
+            poles=[-0.1+0.1j, -0.1-0.1j, -1.0*(1.+ord(tr.channel[-1]))],
+            constant=2.0)
+
+
+class EventDataTestCase(unittest.TestCase):
+
+    def test_iter_displacement_traces(self):
+        num.random.seed(10)
+        tmin = util.str_to_time('2015-01-01 00:00:00')
+
+        stations = []
+        traces = []
+        for ista in xrange(5):
+            sta = 'S%i' % ista
+            stations.append(model.Station('', sta, '', lat=ista, lon=0.))
+            for cha in 'ENZX':
+                traces.append(trace.Trace(
+                    '', sta, '', cha, tmin=tmin, deltat=0.01,
+                    ydata=num.random.normal(size=2000)))
+
+        p = pile.Pile()
+        p.add_file(pile.MemTracesFile(None, traces))
+
+        results = []
+        for nparallel, batch in ((1, False), (1, True), (3, True)):
+            access = MemEventDataAccess(stations=stations, datapile=p)
+            out_stations = {}
+            results.append((
+                list(access.iter_displacement_traces(
+                    2., (0.1, 0.2, 10., 20.), deltat=0.02,
+                    out_stations=out_stations, progress=None,
+                    nparallel=nparallel, batch=batch)),
+                out_stations,
+                access.problems().mapped()))
+
+        ref_groups, ref_out_stations, ref_problems = results[0]
+        self.assertEqual(len(ref_groups), 5)
+        self.assertEqual(sorted(ref_out_stations.keys()),
+                         [s.nsl() for s in stations])
+        self.assertEqual(
+            ref_problems['no_response'], set(s.nsl() for s in stations))
+
+        for groups, out_stations, problems in results[1:]:
+            self.assertEqual(sorted(out_stations.keys()),
+                             sorted(ref_out_stations.keys()))
+            self.assertEqual(problems, ref_problems)
+            self.assertEqual(len(groups), len(ref_groups))
+            for group, ref_group in zip(groups, ref_groups):
+                self.assertEqual([tr.nslc_id for tr in group],
+                                 [tr.nslc_id for tr in ref_group])
+                for tr, ref_tr in zip(group, ref_group):
+                    assert tr.deltat == 0.02
+                    assert tr.tmin == ref_tr.tmin
+                    assert num.allclose(tr.ydata, ref_tr.ydata)
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_eventdata', 'warning')
+    unittest.main()
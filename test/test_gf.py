@@ -678,6 +678,103 @@ class GFTestCase(unittest.TestCase):
             if 'select' in d:
                 self.assertEqual(d['select'], t.select)
 
+    def test_lookup_ireceiver(self):
+        receivers = []
+        for north in num.linspace(-50*km, 50*km, 41):
+            for east in num.linspace(-50*km, 50*km, 41):
+                receivers.append(gf.Receiver(
+                    lat=44., lon=10., north_shift=north, east_shift=east))
+
+        receivers.append(gf.Receiver(lat=44., lon=10., depth=2*km))
+
+        conf = gf.ConfigTypeC(
+            id='receivers',
+            receivers=receivers,
+            source_origin=gf.Location(lat=44., lon=10.),
+            source_depth_min=0.,
+            source_depth_max=10*km,
+            source_depth_delta=1*km,
+            source_east_shift_min=-10*km,
+            source_east_shift_max=10*km,
+            source_east_shift_delta=1*km,
+            source_north_shift_min=-10*km,
+            source_north_shift_max=10*km,
+            source_north_shift_delta=1*km,
+            sample_rate=1.,
+            ncomponents=1)
+
+        def lookup_brute(receiver):
+            for irec, rec in enumerate(conf.receivers):
+                if math.sqrt((receiver.distance_to(rec)/km)**2 +
+                             ((rec.depth - receiver.depth)/km)**2) < 0.1:
+                    return irec
+
+            raise gf.OutOfBounds()
+
+        lat, lon = receivers[777].effective_latlon
+        queries = [
+            receivers[0],
+            receivers[777],
+            gf.Receiver(lat=float(lat), lon=float(lon)),
+            gf.Receiver(lat=44., lon=10., east_shift=25*km+50.),
+            gf.Receiver(lat=44., lon=10., depth=2*km+20.)]
+
+        for receiver in queries:
+            self.assertEqual(conf.lookup_ireceiver(receiver),
+                             lookup_brute(receiver))
+
+        self.assertEqual(
+            list(conf.lookup_ireceivers(queries)),
+            [lookup_brute(receiver) for receiver in queries])
+
+        self.assertEqual(conf.lookup_ireceiver(queries[-1]), 1681)
+
+        for receiver in [
+                gf.Receiver(lat=44., lon=10., east_shift=25*km+500.),
+                gf.Receiver(lat=45., lon=10.),
+                gf.Receiver(lat=44., lon=10., depth=1*km)]:
+
+            with self.assertRaises(gf.OutOfBounds):
+                conf.lookup_ireceiver(receiver)
+
+    def test_builder_schedule(self):
+        conf = gf.ConfigTypeA(
+            id='schedule',
+            source_depth_min=0.,
+            source_depth_max=20.,
+            source_depth_delta=10.,
+            distance_min=10.,
+            distance_max=1000.,
+            distance_delta=10.,
+            sample_rate=1.,
+            ncomponents=2)
+
+        class SplittableBuilder(gf.builder.Builder):
+            splittable = True
+
+        for builder_class in (gf.builder.Builder, SplittableBuilder):
+            builder = builder_class(conf, 0, block_size=(1, 50))
+            iblocks = list(builder.all_block_indices())
+            jobs = builder.schedule(iblocks, nworkers=4)
+            if not builder.splittable:
+                self.assertEqual(sorted(jobs), iblocks)
+
+            costs = [builder.estimate_block_cost(job) for job in jobs]
+            self.assertEqual(costs, sorted(costs, reverse=True))
+
+            covered = num.zeros(tuple(conf.ns), dtype=num.int)
+            for job in jobs:
+                ibegins, iends = builder.get_block(job)
+                covered[ibegins[0]:iends[0], ibegins[1]:iends[1]] += 1
+
+            self.assertTrue(num.all(covered == 1))
+
+        parts = [job for job in jobs if isinstance(job, tuple)]
+        self.assertTrue(len(parts) > 0)
+        jobs2 = builder.schedule(iblocks, nworkers=4, parts_done=parts[:1])
+        self.assertEqual(len(jobs2), len(jobs) - 1)
+        self.assertTrue(parts[0] not in jobs2)
+
 
 if __name__ == '__main__':
     util.setup_logging('test_gf', 'warning')
@@ -0,0 +1,223 @@
+import math
+import shutil
+import tempfile
+import unittest
+import numpy as num
+
+from pyrocko import trace, pile, util, model, cake, orthodrome, migration, gf
+
+km = 1000.
+
+
+class StraightRayTraveltimes(migration.TraveltimeProvider):
+
+    def __init__(self, velocity):
+        self.velocity = velocity
+
+    def ident(self):
+        return 'straight %g' % self.velocity
+
+    def traveltimes(self, grid, receiver):
+        dists = grid.distances_to(receiver)
+        depths = grid.coords()[2]
+        return num.sqrt(dists**2 + (depths - receiver.depth)**2) \
+            / self.velocity
+
+
+def crust_model():
+    return cake.LayeredModel.from_scanlines(cake.read_nd_model_str('''
+ 0. 5.8 3.46 2.6 1264. 600.
+ 20. 5.8 3.46 2.6 1264. 600.
+ 20. 6.5 3.85 2.9 1283. 600.
+ 35. 6.5 3.85 2.9 1283. 600.
+mantle
+ 35. 8.04 4.48 3.58 1449. 600.
+'''.lstrip()))
+
+
+class MigrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix='migration')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_traveltimes_store(self):
+        mod = crust_model()
+        conf = gf.ConfigTypeA(
+            id='migration_test',
+            source_depth_min=0.,
+            source_depth_max=10*km,
+            source_depth_delta=1*km,
+            distance_min=0.,
+            distance_max=60*km,
+            distance_delta=1*km,
+            sample_rate=20.0,
+            ncomponents=10,
+            earthmodel_1d=mod,
+            tabulated_phases=[
+                gf.TPDef(id='P', definition='p,P'),
+                gf.TPDef(id='S', definition='s,S')])
+
+        store_dir = tempfile.mkdtemp(prefix='gfstore', dir=self.cache_dir)
+        gf.Store.create(store_dir, config=conf, force=True)
+        store = gf.Store(store_dir)
+        store.make_ttt()
+
+        # deepest nodes lie below the store's depth range
+        grid = migration.MigrationGrid(
+            lat=10., lon=20.,
+            north_min=-5*km, north_max=5*km, north_delta=5*km,
+            east_min=-5*km, east_max=5*km, east_delta=5*km,
+            depth_min=2*km, depth_max=14*km, depth_delta=4*km)
+
+        receiver = model.Station('', 'STA', '', lat=10.3, lon=20.1)
+
+        dists = grid.distances_to(receiver)
+        depths = grid.coords()[2]
+        inside = depths <= conf.source_depth_max
+
+        provider = migration.StoreTraveltimes(store, 'stored:P')
+        times = migration.get_traveltimes(
+            provider, grid, [receiver], cache_dir=self.cache_dir)
+
+        self.assertEqual(times.shape, (1, grid.nnodes))
+        assert num.all(num.isnan(times[0, ~inside]))
+        for inode in num.nonzero(inside)[0]:
+            rays = mod.arrivals(
+                phases=[cake.PhaseDef('p'), cake.PhaseDef('P')],
+                distances=[dists[inode]*cake.m2d],
+                zstart=depths[inode])
+
+            tref = min(ray.t for ray in rays)
+            assert abs(times[0, inode] - tref) < 0.05
+
+        times2 = migration.get_traveltimes(
+            provider, grid, [receiver], cache_dir=self.cache_dir)
+
+        assert num.all(num.isnan(times) == num.isnan(times2))
+        assert num.all(times[:, inside] == times2[:, inside])
+
+        times_s = migration.StoreTraveltimes(
+            store, 'stored:S').traveltimes(grid, receiver)
+
+        for timing, expect in [
+                ('first{stored:P|stored:S}', times[0]),
+                ('last{stored:P|stored:S}', times_s),
+                ('{stored:P}+2.5', times[0] + 2.5)]:
+
+            times3 = migration.StoreTraveltimes(
+                store, timing).traveltimes(grid, receiver)
+
+            assert num.all(num.isnan(times3) == num.isnan(expect))
+            assert num.all(times3[inside] == expect[inside])
+
+        # other phase providers are evaluated node by node
+        times4 = migration.StoreTraveltimes(
+            store, 'vel_surface:5').traveltimes(grid, receiver)
+
+        assert num.allclose(times4, dists / (5*km))
+
+        store.close()
+
+    def test_traveltimes_cake(self):
+        mod = crust_model()
+
+        grid = migration.MigrationGrid(
+            lat=10., lon=20.,
+            north_min=-5*km, north_max=5*km, north_delta=5*km,
+            east_min=-5*km, east_max=5*km, east_delta=5*km,
+            depth_min=2*km, depth_max=10*km, depth_delta=4*km)
+
+        receiver = model.Station('', 'STA', '', lat=10.3, lon=20.1)
+        provider = migration.CakeTraveltimes(
+            mod, ['p', 'P'], distance_delta=0.5*km)
+
+        times = migration.get_traveltimes(
+            provider, grid, [receiver], cache_dir=self.cache_dir)
+
+        self.assertEqual(times.shape, (1, grid.nnodes))
+
+        dists = grid.distances_to(receiver)
+        depths = grid.coords()[2]
+        for inode in xrange(0, grid.nnodes, 5):
+            rays = mod.arrivals(
+                phases=provider.phases,
+                distances=[dists[inode]*cake.m2d],
+                zstart=depths[inode])
+
+            tref = min(ray.t for ray in rays)
+            assert abs(times[0, inode] - tref) < 0.01
+
+        times2 = migration.get_traveltimes(
+            provider, grid, [receiver], cache_dir=self.cache_dir)
+
+        assert num.all(times == times2)
+
+    def test_migrate(self):
+        num.random.seed(22)
+        deltat = 0.05
+        velocity = 6*km
+        tmin = util.str_to_time('2015-01-01 00:00:00')
+        n = 40000
+
+        grid = migration.MigrationGrid(
+            lat=45., lon=10.,
+            north_min=-20*km, north_max=20*km, north_delta=2*km,
+            east_min=-20*km, east_max=20*km, east_delta=2*km,
+            depth_min=0., depth_max=20*km, depth_delta=4*km)
+
+        receivers = []
+        for i in xrange(8):
+            azi = i * 2.*math.pi / 8.
+            lat, lon = orthodrome.ne_to_latlon(
+                45., 10., 30*km*math.cos(azi), 30*km*math.sin(azi))
+
+            receivers.append(
+                model.Station('', 'S%i' % i, '', lat=float(lat),
+                              lon=float(lon)))
+
+        provider = StraightRayTraveltimes(velocity)
+        times = provider.traveltimes(grid, receivers[0])
+
+        events = [(tmin + 300., 1234), (tmin + 1200.45, 2000)]
+
+        traces = []
+        t = num.arange(n) * deltat
+        for receiver in receivers:
+            ydata = num.random.uniform(0., 0.2, size=n)
+            for tevent, inode in events:
+                tt = provider.traveltimes(grid, receiver)[inode]
+                ydata += num.exp(-((t - (tevent - tmin + tt)) / 0.2)**2)
+
+            traces.append(trace.Trace(
+                '', receiver.station, '', 'CF', tmin=tmin, deltat=deltat,
+                ydata=ydata))
+
+        p = pile.Pile()
+        p.add_file(pile.MemTracesFile(None, traces))
+
+        assert num.all(times > 0.)
+
+        for chunk_size in (1000, 333):
+            results = list(migration.migrate(
+                p, grid, receivers, provider, tinc=400.,
+                chunk_size=chunk_size, cache_dir=self.cache_dir))
+
+            assert all(r.nchannels == len(receivers) for r in results)
+
+            best = sorted(results, key=lambda r: -r.value)[:2]
+            best.sort(key=lambda r: r.time)
+            for (tevent, inode), result in zip(events, best):
+                self.assertEqual(result.inode, inode)
+                assert abs(result.time - tevent) <= deltat
+                assert result.value > 0.9
+                self.assertEqual(result.image.shape, grid.shape)
+                assert abs(
+                    num.max(result.image) - result.value) < 1e-9
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_migration', 'warning')
+    unittest.main()
@@ -94,6 +94,92 @@ class MomentTensorTestCase( unittest.TestCase ):
         m1.magnitude = want_mag
         mom = magnitude_to_moment(want_mag)
         assert( m1.moment == mom)
+
+    def testMomentTensors(self):
+        num.random.seed(11)
+        mts = MomentTensors.random_mt(200, magnitude=4.)
+        self.assertEqual(len(mts), 200)
+        sdrs = mts.both_strike_dip_rake()
+        dec = mts.standard_decompositions()
+        for i, mt in enumerate(mts.moment_tensors()):
+            assert num.allclose(mt.m6(), mts.m6s()[i])
+            assert num.allclose(sdrs[i], mt.both_strike_dip_rake(), atol=1e-5)
+            assert abs(mts.moment_magnitudes()[i] - mt.moment_magnitude()) \
+                < 1e-10
+
+            for (moment, ratio, m), ref in zip(
+                    dec, mt.standard_decomposition()):
+
+                assert num.allclose(moment[i], ref[0])
+                assert num.allclose(ratio[i], ref[1])
+                assert num.allclose(m[i], ref[2], atol=1e-10*moment[i])
+
+        dcs = MomentTensors.random_dc(100, scalar_moment=2.)
+        sdrs = dcs.both_strike_dip_rake()
+        dcs2 = MomentTensors.from_strike_dip_rake(
+            sdrs[:, 1, 0], sdrs[:, 1, 1], sdrs[:, 1, 2], scalar_moments=2.)
+        assert num.allclose(dcs.m6s(), dcs2.m6s())
+
+    def testMomentTensorsPlaneOrder(self):
+        def same_angles(a, b):
+            d = (num.asarray(a) - num.asarray(b) + 180.) % 360. - 180.
+            return num.all(num.abs(d) < 1e-5)
+
+        strikes, dips, rakes = [x.ravel() for x in num.meshgrid(
+            num.arange(0., 360., 30.), num.arange(0., 91., 15.),
+            num.arange(-180., 180., 22.5), indexing='ij')]
+
+        sdrs = MomentTensors.from_strike_dip_rake(
+            strikes, dips, rakes).both_strike_dip_rake()
+
+        nties = 0
+        for i in xrange(strikes.size):
+            mt = MomentTensor(strike=strikes[i], dip=dips[i], rake=rakes[i])
+            ref = num.array(mt.both_strike_dip_rake())
+
+            # order of MomentTensor depends on rounding noise, if the first
+            # differing elements of the rotation matrices are nearly equal,
+            # or on the order of computation, if they are equal
+            d = (num.abs(num.asarray(mt._rotmats[0])) -
+                 num.abs(num.asarray(mt._rotmats[1]))).ravel()
+            idiffer = num.nonzero(d != 0.)[0]
+            if idiffer.size == 0 or abs(d[idiffer[0]]) <= 1e-10:
+                nties += 1
+                assert same_angles(sdrs[i], ref) or \
+                    same_angles(sdrs[i], ref[::-1])
+            else:
+                assert same_angles(sdrs[i], ref)
+
+        assert 0 < nties < strikes.size / 10
+
+        # order does not depend on rounding noise
+        for moment in (0.3, 7., 1e18):
+            sdrs2 = MomentTensors.from_strike_dip_rake(
+                strikes, dips, rakes,
+                scalar_moments=moment).both_strike_dip_rake()
+
+            assert same_angles(sdrs, sdrs2)
+
+    def testKaganAngle(self):
+        mt1 = MomentTensor(strike=10., dip=90., rake=0.)
+        for dstrike in (0., 30., 80.):
+            mt2 = MomentTensor(strike=10.+dstrike, dip=90., rake=0.)
+            assert abs(kagan_angle(mt1, mt2) - dstrike) < 1e-3
+
+        # other plane gives same mechanism
+        s, d, r = mt1.both_strike_dip_rake()[1]
+        assert kagan_angle(mt1, MomentTensor(strike=s, dip=d, rake=r)) < 1e-3
+
+        num.random.seed(12)
+        mts1 = MomentTensors.random_dc(50)
+        mts2 = MomentTensors.random_dc(20)
+        angles = mts1.kagan_angles(mts2, all_pairs=True)
+        self.assertEqual(angles.shape, (50, 20))
+        assert num.all(angles <= 120.)
+        assert num.allclose(angles.T, mts2.kagan_angles(mts1, all_pairs=True))
+        assert num.allclose(angles[:, 3], mts1.kagan_angles(mts2[3:4]))
+        assert num.allclose(angles[:20].diagonal(), mts1[:20].kagan_angles(mts2))
+
 if __name__ == "__main__":
     util.setup_logging('test_moment_tensor', 'warning')
     unittest.main()
@@ -48,6 +48,74 @@ class OrthodromeTestCase(unittest.TestCase):
                 d2 = math.sqrt(no**2+ea**2)
                 assert not (abs(d-d2) > 1.0e-3 and d2 > 1.)
 
+    def test_many(self):
+        num.random.seed(3)
+        n = 1000
+        a_lats = num.random.uniform(-90., 90., n)
+        a_lons = num.random.uniform(-180., 180., n)
+        b_lats = num.random.uniform(-90., 90., n)
+        b_lons = num.random.uniform(-180., 180., n)
+
+        dists = orthodrome.distance_many(a_lats, a_lons, b_lats, b_lons)
+        assert num.allclose(
+            dists, orthodrome.distance_accurate50m_numpy(
+                a_lats, a_lons, b_lats, b_lons), rtol=1e-12)
+
+        azis, bazis = orthodrome.azibazi_many(a_lats, a_lons, b_lats, b_lons)
+        assert num.allclose(azis, orthodrome.azimuth_numpy(
+            a_lats, a_lons, b_lats, b_lons), atol=1e-9)
+        assert num.allclose(bazis, orthodrome.azimuth_numpy(
+            b_lats, b_lons, a_lats, a_lons), atol=1e-9)
+
+        # broadcasting, all pairs
+        dists = orthodrome.distance_many(10., 20., b_lats, b_lons)
+        self.assertEqual(dists.shape, (n,))
+        azis, bazis, dists = orthodrome.azibazidist_all_pairs(
+            a_lats[:10], a_lons[:10], b_lats, b_lons)
+        self.assertEqual(dists.shape, (10, n))
+        assert num.allclose(dists[3], orthodrome.distance_many(
+            a_lats[3], a_lons[3], b_lats, b_lons))
+        assert num.allclose(bazis[:, 5], orthodrome.azibazi_many(
+            a_lats[:10], a_lons[:10], b_lats[5], b_lons[5])[1])
+
+        a = Loc()
+        a.lat, a.lon = a_lats[0], a_lons[0]
+        b = Loc()
+        b.lat, b.lon = b_lats[0], b_lons[0]
+        for i in xrange(2):
+            azi, bazi, dist = orthodrome.azibazidist(
+                a.lat, a.lon, b.lat, b.lon)
+
+            assert abs(dist - orthodrome.distance_accurate50m(a, b)) < 1e-6
+            assert abs(azi - orthodrome.azimuth(a, b)) < 1e-9
+            assert abs(bazi - orthodrome.azimuth(b, a)) < 1e-9
+
+    def test_vincenty(self):
+        # Flinders Peak to Buninyong, from Vincenty (1975)
+        dms = lambda d, m, s: math.copysign(abs(d) + m/60. + s/3600., d)
+        dist = orthodrome.distance_many(
+            dms(-37, 57, 3.72030), dms(144, 25, 29.52440),
+            dms(-37, 39, 10.15610), dms(143, 55, 35.38390),
+            method='vincenty')
+
+        assert abs(dist - 54972.271) < 0.001
+
+        num.random.seed(4)
+        n = 1000
+        args = (num.random.uniform(-90., 90., n),
+                num.random.uniform(-180., 180., n),
+                num.random.uniform(-90., 90., n),
+                num.random.uniform(-180., 180., n))
+
+        dists = orthodrome.distance_many(*args, method='vincenty')
+        dists50m = orthodrome.distance_many(*args)
+        assert num.all(num.abs(dists - dists50m) < 2e-4 * dists)
+        assert num.median(num.abs(dists - dists50m)) < 50.
+
+        self.assertEqual(
+            orthodrome.distance_many(10., 10., 10., 10., method='vincenty'),
+            0.0)
+
     def OFF_test_local_distances(self):
 
         for reflat, reflon in [
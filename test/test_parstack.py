@@ -7,7 +7,7 @@ from collections import defaultdict
 import numpy as num
 from pyrocko import util, trace, autopick
 
-from pyrocko.parstack import parstack
+from pyrocko.parstack import parstack, parstack_topk
 
 def numeq(a, b, eps):
     return (num.all(num.asarray(a).shape == num.asarray(b).shape and
@@ -140,16 +140,92 @@ class ParstackTestCase(unittest.TestCase):
                         assert numeq(result, result1*(k+2), 1e-9)
             
 
+    def test_parstack_methods(self):
+        for i in xrange(50):
+            narrays = random.randint(1, 5)
+            offsets = num.random.randint(-5, 6, size=narrays).astype(num.int32)
+            nshifts = random.randint(1, 30)
+            shifts = num.random.randint(
+                -5, 6, size=(nshifts, narrays)).astype(num.int32)
+            weights = num.random.random((nshifts, narrays))
+            lengths = [random.randint(5, 3000) for j in xrange(narrays)]
+
+            for dtype, eps in ((num.float64, 1e-9), (num.float32, 1e-3)):
+                arrays = [
+                    num.random.normal(size=n).astype(dtype)
+                    for n in lengths]
+
+                for method in ('stack', 'max', 'argmax', 'sumsq',
+                               'semblance'):
+
+                    for nparallel in xrange(1, 4):
+                        r1, o1 = parstack(
+                            arrays, offsets, shifts, weights, method,
+                            impl='openmp', nparallel=nparallel)
+
+                        r2, o2 = parstack(
+                            arrays, offsets, shifts, weights, method,
+                            impl='numpy')
+
+                        assert o1 == o2
+                        if method == 'argmax':
+                            self.assertEqual(r1.dtype, num.int32)
+                            assert num.all(r1 == r2)
+                        else:
+                            self.assertEqual(r1.dtype, dtype)
+                            scale = max(1.0, num.max(num.abs(r2)))
+                            assert numeq(r1, r2, eps*scale)
+
+                r0, o0 = parstack(arrays, offsets, shifts, weights, 0)
+                r1, _ = parstack(arrays, offsets, shifts, weights, 1)
+                r2, _ = parstack(arrays, offsets, shifts, weights, 2)
+                assert numeq(r1, num.amax(r0, axis=1), eps)
+                assert numeq(r0[num.arange(nshifts), r2], r1, eps)
+
+                r4, _ = parstack(arrays, offsets, shifts, weights, 4)
+                assert num.all(r4 >= 0.0) and num.all(r4 <= 1.0 + eps)
+
+        arrays = [num.random.random(10)]
+        offsets = num.zeros(1, dtype=num.int32)
+        shifts = num.zeros((1, 1), dtype=num.int32)
+        weights = num.ones((1, 1))
+        r, _ = parstack(arrays, offsets, shifts, weights, 'semblance')
+        assert numeq(r, [1.0], 1e-9)
+
+        arrays = [num.random.random(10), num.random.random(10)]
+        with self.assertRaises(Exception):
+            parstack(
+                [arrays[0], arrays[1].astype(num.float32)],
+                num.zeros(2, dtype=num.int32),
+                num.zeros((1, 2), dtype=num.int32), num.ones((1, 2)), 0)
+
+    def test_parstack_topk(self):
+        narrays = 5
+        arrays = [num.random.random(100) for j in xrange(narrays)]
+        offsets = num.random.randint(-5, 6, size=narrays).astype(num.int32)
+        nshifts = 1000
+        shifts = num.random.randint(
+            -20, 21, size=(nshifts, narrays)).astype(num.int32)
+        weights = num.ones((nshifts, narrays))
+
+        for method in ('max', 'sumsq', 'semblance'):
+            r, _ = parstack(arrays, offsets, shifts, weights, method)
+            order = num.argsort(-r, kind='mergesort')
+            for k in (1, 10, 100):
+                for nshifts_chunk in (7, 1000):
+                    ishifts, values = parstack_topk(
+                        arrays, offsets, shifts, weights, k, method,
+                        nshifts_chunk=nshifts_chunk)
+
+                    assert numeq(values, r[order[:k]], 1e-9)
+                    assert numeq(r[ishifts], values, 1e-9)
+
     def benchmark(self):
 
-        for nsamples in (10, 100, 1000, 10000):
+        for nsamples in (10, 100, 1000, 10000, 100000):
             nrepeats = max(10, 1000 / nsamples)
 
             narrays = 20
-            arrays = []
-            for iarray in xrange(narrays):
-                arrays.append(num.arange(nsamples, dtype=num.float))
-
             offsets = num.arange(narrays, dtype=num.int32)
 
             nshifts = 100
@@ -160,18 +236,27 @@ class ParstackTestCase(unittest.TestCase):
             for nparallel in xrange(1, multiprocessing.cpu_count() + 1):
                 confs.append(('openmp', nparallel))
 
-            for (impl, nparallel) in confs:
-                t0 = time.time()
-                for j in xrange(nrepeats):
-                    r, o = parstack(
-                        arrays, offsets, shifts, weights, 0,
-                        impl=impl, nparallel=nparallel)
-
-                t1 = time.time()
-
-                t = t1-t0
-                score = nsamples * narrays * nshifts * nrepeats / t / 1e9
-                print '%s, %i, %i, %g' % (impl, nparallel, nsamples, score)
+            for dtype in (num.float64, num.float32):
+                arrays = []
+                for iarray in xrange(narrays):
+                    arrays.append(num.arange(nsamples, dtype=dtype))
+
+                for method in ('stack', 'max', 'semblance'):
+                    for (impl, nparallel) in confs:
+                        t0 = time.time()
+                        for j in xrange(nrepeats):
+                            r, o = parstack(
+                                arrays, offsets, shifts, weights, method,
+                                impl=impl, nparallel=nparallel)
+
+                        t1 = time.time()
+
+                        t = t1-t0
+                        score = nsamples * narrays * nshifts * nrepeats \
+                            / t / 1e9
+                        print '%s, %s, %s, %i, %i, %g' % (
+                            num.dtype(dtype).name, method, impl, nparallel,
+                            nsamples, score)
 
     def off_test_synthetic(self):
         
@@ -95,7 +95,48 @@ class PileTestCase( unittest.TestCase ):
         p.add_file(f)
         for tr in p.iter_all(include_last=True):
             assert numeq(tr.ydata, num.arange(100, dtype=num.float), 0.001)
-        
+
+    def testEnvelopes(self):
+        import shutil
+        datadir = tempfile.mkdtemp()
+        nsamples = 100000
+        tmin = 1234567890.
+        deltat = 0.01
+        traces = []
+        for i in xrange(3):
+            data = num.random.randint(-1000, 1000, nsamples).astype(num.int32)
+            traces.append(trace.Trace(
+                'xx', 'sta', '', 'z', tmin+i*nsamples*deltat, deltat=deltat,
+                ydata=data))
+
+        io.save(traces, pjoin(datadir, '%(tmin)s.mseed'), format='mseed')
+        filenames = util.select_files([datadir], show_progress=False)
+        cachedir = pjoin(datadir, '_cache_')
+        p = pile.Pile()
+        p.load_files(filenames=filenames, cache=pile.get_cache(cachedir),
+                     show_progress=False)
+
+        ecache = pile.EnvelopeCache(pjoin(cachedir, 'envelopes'))
+        tmin_win = tmin + 500.
+        tmax_win = tmin + 2500.
+        for resolution in (1., 10., 1000.):
+            envs = p.envelopes(tmin_win, tmax_win, resolution, cache=ecache)
+            self.assertEqual(len(envs), 3)
+            for etr in envs:
+                assert etr.deltat <= 0.5*resolution or etr.deltat == 0.32
+                tr, = [x for x in traces if x.tmin <= etr.tmin < x.tmax]
+                ctr = tr.chop(etr.tmin, etr.tmax+2*etr.deltat, inplace=False)
+                y = etr.get_ydata()
+                assert y.min() == ctr.ydata.min()
+                assert y.max() == ctr.ydata.max()
+
+        # load from disk
+        ecache2 = pile.EnvelopeCache(pjoin(cachedir, 'envelopes'))
+        for file in p.iter_files():
+            assert ecache2._load(file) is not None
+
+        shutil.rmtree(datadir)
+
         
 if __name__ == "__main__":
     util.setup_logging('test_pile', 'warning')
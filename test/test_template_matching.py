@@ -0,0 +1,69 @@
+import unittest
+import numpy as num
+
+from pyrocko import trace, pile, util, template_matching
+
+
+class TemplateMatchingTestCase(unittest.TestCase):
+
+    def test_correlate_overlap_save(self):
+        num.random.seed(20)
+        data = num.random.normal(size=1000)
+        for m in (1, 7, 64, 300):
+            template = num.random.normal(size=m)
+            for nfft in (None, 512):
+                c = template_matching.correlate_overlap_save(
+                    data, template, nfft)
+                c_ref = num.correlate(data, template, mode='valid')
+                assert num.allclose(c, c_ref)
+
+        c = template_matching.correlate_normalized(data, data[100:200])
+        self.assertEqual(num.argmax(c), 100)
+        assert abs(c[100] - 1.0) < 1e-9
+        assert num.all(num.abs(c) <= 1.0 + 1e-9)
+
+    def test_detect(self):
+        num.random.seed(21)
+        deltat = 0.1
+        tmin = util.str_to_time('2015-01-01 00:00:00')
+        n = 50000
+        tevents = [tmin + 300., tmin + 2049.3, tmin + 4000.]
+        moveouts = {'A': 5., 'B': 12.5, 'C': 30.}
+
+        wavelet = num.random.normal(size=200) * num.hanning(200)
+
+        traces = []
+        template_traces = []
+        for sta, moveout in sorted(moveouts.items()):
+            ydata = num.random.normal(scale=0.3, size=n)
+            for tevent in tevents:
+                i = int(round((tevent + moveout - tmin) / deltat))
+                ydata[i:i+200] += wavelet
+
+            tr = trace.Trace('', sta, '', 'Z', tmin=tmin, deltat=deltat,
+                             ydata=ydata)
+            traces.append(tr)
+            template_traces.append(tr.chop(
+                tevents[0] + moveout, tevents[0] + moveout + 200*deltat,
+                inplace=False, include_last=False))
+
+        p = pile.Pile()
+        p.add_file(pile.MemTracesFile(None, traces))
+
+        template = template_matching.Template(
+            template_traces, tevents[0], name='ev1')
+
+        for tinc in (None, 700.):
+            detections = list(template_matching.detect(
+                p, [template], 0.5, tinc=tinc, min_channels=3))
+
+            self.assertEqual(len(detections), len(tevents))
+            for detection, tevent in zip(detections, tevents):
+                assert abs(detection.time - tevent) < 0.5*deltat
+                assert detection.value > 0.6
+                self.assertEqual(detection.nchannels, 3)
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_template_matching', 'warning')
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as num
+
+from pyrocko import util
+import pyrocko.topo
+
+tile = sys.modules['pyrocko.topo.tile']
+dataset = sys.modules['pyrocko.topo.dataset']
+etopo1 = sys.modules['pyrocko.topo.etopo1']
+
+
+class TopoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='topo')
+
+    def tearDown(self):
+        dataset.g_tile_cache.clear()
+        shutil.rmtree(self.tempdir)
+
+    def test_tile_get_values(self):
+        y, x = num.mgrid[0:11, 0:21]
+        t = tile.Tile(10., -5., 0.5, 1.0, (x + 100 * y).astype(num.int16))
+
+        xs = num.array([10., 12.25, 20., 13.3])
+        ys = num.array([-5., -3.5, 5., 0.])
+
+        vals = t.get_values(xs, ys, interpolation='bilinear')
+        ref = (xs - 10.) / 0.5 + 100. * (ys + 5.)
+        assert num.allclose(vals, ref)
+
+        vals = t.get_values(xs, ys, interpolation='nearest')
+        for x_, y_, v in zip(xs, ys, vals):
+            self.assertEqual(t.get(x_, y_), v)
+
+        with self.assertRaises(tile.OutOfBounds):
+            t.get_values([9.], [0.], interpolation='bilinear')
+
+    def test_decimate(self):
+        import scipy.signal
+
+        num.random.seed(1)
+        data = num.random.uniform(-1000., 1000., size=(41, 61))
+        for ndeci in (2, 4):
+            t = tile.Tile(0., 0., 1., 1., data.copy())
+            t.decimate(ndeci)
+
+            kernel = num.ones((ndeci+1, ndeci+1)) / (ndeci+1)**2
+            ref = scipy.signal.convolve2d(
+                data, kernel, mode='valid')[::ndeci, ::ndeci]
+
+            self.assertEqual(t.data.shape, ref.shape)
+            assert num.allclose(t.data, ref)
+
+    def test_elevations(self):
+        dem = etopo1.ETOPO1(data_dir=self.tempdir)
+        for ity in xrange(dem.ntilesy):
+            for itx in xrange(dem.ntilesx):
+                y, x = num.mgrid[0:dem.nty, 0:dem.ntx]
+                data = (y % 7 + x % 11 + ity * 100 + itx).astype(dem.dtype)
+                fn = '%s.%02i.%02i.bin' % (dem.base_fn, ity, itx)
+                dataset.write_tile_data(data, os.path.join(self.tempdir, fn))
+
+        num.random.seed(0)
+        n = 1000
+        lats = num.random.uniform(-89.9, 89.9, n)
+        lons = num.random.uniform(-180., 360., n)
+
+        elevations = dem.elevations(lats, lons, interpolation='nearest')
+        self.assertEqual(elevations.shape, (n,))
+
+        for lat, lon, ele in zip(lats[:50], lons[:50], elevations[:50]):
+            if lon >= 180.:
+                lon -= 360.
+
+            t = dem.get((lon-0.1, lon+0.1, lat-0.1, lat+0.1))
+            self.assertEqual(t.get(lon, lat), ele)
+
+        elevations = dem.elevations(
+            lats.reshape((10, 100)), lons.reshape((10, 100)))
+        self.assertEqual(elevations.shape, (10, 100))
+        assert num.all(num.isfinite(elevations))
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_topo', 'warning')
+    unittest.main()
@@ -12,6 +12,65 @@ def numeq(a,b, eps):
 def floats(l):
     return num.array(l, dtype=num.float)
 
+def peaks_ref(self, threshold, tsearch, deadtime=False, nblock_duration_detection=100):
+    # straightforward implementation, for comparison
+    y = self.ydata
+    above =  num.where(y > threshold, 1, 0)
+    deriv = num.zeros(y.size, dtype=num.int8)
+    deriv[1:] = above[1:]-above[:-1]
+    itrig_positions = num.nonzero(deriv>0)[0]
+    tpeaks = []
+    apeaks = []
+    tzeros = []
+    tzero = self.tmin
+
+    for itrig_pos in itrig_positions:
+        ibeg = itrig_pos
+        iend = min(
+            len(self.ydata),
+            itrig_pos + int(math.ceil(tsearch/self.deltat)))
+        ipeak = num.argmax(y[ibeg:iend])
+        tpeak = self.tmin + (ipeak+ibeg)*self.deltat
+        apeak = y[ibeg+ipeak]
+
+        if tpeak < tzero:
+            continue
+
+        if deadtime:
+            ibeg = itrig_pos
+            iblock = 0
+            nblock = nblock_duration_detection
+            totalsum = 0.
+            while True:
+                if ibeg+iblock*nblock >= len(y):
+                    tzero = self.tmin + (len(y)-1)* self.deltat
+                    break
+
+                logy = num.log(y[ibeg+iblock*nblock:ibeg+(iblock+1)*nblock])
+                logy[0] += totalsum
+                ysum = num.cumsum(logy)
+                totalsum = ysum[-1]
+                below = num.where(ysum <= 0., 1, 0)
+                deriv = num.zeros(ysum.size, dtype=num.int8)
+                deriv[1:] = below[1:]-below[:-1]
+                izero_positions = num.nonzero(deriv>0)[0] + iblock*nblock
+                if len(izero_positions) > 0:
+                    tzero = self.tmin + (ibeg + izero_positions[0])*self.deltat
+                    break
+                iblock += 1
+        else:
+            tzero = ibeg*self.deltat + self.tmin + tsearch
+
+        tpeaks.append(tpeak)
+        apeaks.append(apeak)
+        tzeros.append(tzero)
+
+    if deadtime:
+        return tpeaks, apeaks, tzeros
+    else:
+        return tpeaks, apeaks
+
+
 class TraceTestCase(unittest.TestCase):
     
     def testIntegrationDifferentiation(self):
@@ -106,6 +165,57 @@ class TraceTestCase(unittest.TestCase):
         assert numeq(r.get_ydata(), [2.,1.], 1.0e-6)
         assert numeq(t.get_ydata(), [ 0., -1 ], 1.0e-6)
             
+    def testRotationMany(self):
+        num.random.seed(3)
+        source = model.Event(lat=10., lon=20.)
+        stations = []
+        traces = []
+        for ista in xrange(50):
+            sta = model.Station(
+                'XX', 'S%i' % ista, '', lat=num.random.uniform(-10., 30.),
+                lon=num.random.uniform(0., 40.))
+            stations.append(sta)
+            nsamples = [100, 120][ista % 2]
+            for cha in 'NEZ':
+                traces.append(trace.Trace(
+                    'XX', sta.station, '', cha, deltat=0.5,
+                    tmin=sometime + (ista % 3)*0.5,
+                    ydata=num.random.normal(size=nsamples)))
+
+        num.random.shuffle(traces)
+
+        rotated = trace.rotate(traces, 30., ['N', 'E'], ['R', 'T'])
+        self.assertEqual(len(rotated), 100)
+        for r, t in zip(rotated[::2], rotated[1::2]):
+            n = [tr for tr in traces if tr.nslc_id == r.nslc_id[:3]+('N',)][0]
+            e = [tr for tr in traces if tr.nslc_id == r.nslc_id[:3]+('E',)][0]
+            phi = 30.*d2r
+            assert (r.channel, t.channel) == ('R', 'T')
+            assert numeq(r.ydata, n.ydata*math.cos(phi)+e.ydata*math.sin(phi),
+                         1e-9)
+            assert numeq(t.ydata, -n.ydata*math.sin(phi)+e.ydata*math.cos(phi),
+                         1e-9)
+
+        rot = num.array([[0., 1., 0.], [1., 0., 0.], [0., 0., -1.]])
+        projected = trace.project(
+            traces, rot, ['N', 'E', 'Z'], ['A', 'B', 'D'])
+        self.assertEqual(len(projected), 150)
+        for tr in projected:
+            src = [x for x in traces if x.nslc_id[:3] == tr.nslc_id[:3] and
+                   x.channel == {'A': 'E', 'B': 'N', 'D': 'Z'}[tr.channel]][0]
+            sign = -1. if tr.channel == 'D' else 1.
+            assert numeq(tr.ydata, sign*src.ydata, 1e-9)
+
+        rts = trace.rotate_to_rt_many(traces, source, stations)
+        self.assertEqual(len(rts), 100)
+        for r, t in zip(rts[::2], rts[1::2]):
+            sta = [s for s in stations if s.nsl() == r.nslc_id[:3]][0]
+            n = [tr for tr in traces if tr.nslc_id == r.nslc_id[:3]+('N',)][0]
+            e = [tr for tr in traces if tr.nslc_id == r.nslc_id[:3]+('E',)][0]
+            rref, tref = trace.rotate_to_rt(n, e, source, sta)
+            assert numeq(r.ydata, rref.ydata, 1e-6)
+            assert numeq(t.ydata, tref.ydata, 1e-6)
+
     def testProjection(self):
         s2 = math.sqrt(2.)
         ndata = num.array([s2,s2], dtype=num.float)
@@ -261,6 +371,41 @@ class TraceTestCase(unittest.TestCase):
         assert numeq( tp, [0.1, 50, 51.1, 99.9], 0.0001)
         assert numeq( ap, [1., 1., 1., 1.], 0.0001)
 
+    def testPeaksDeadtime(self):
+        num.random.seed(12)
+        for i in xrange(10):
+            n = 5000
+            ydata = num.exp(num.random.normal(scale=0.5, size=n)) + \
+                (i % 2) * num.random.uniform(size=n) * 10.
+            tr = trace.Trace(tmin=sometime, deltat=0.01, ydata=ydata)
+            for deadtime in (False, True):
+                res = tr.peaks(1.5, 0.1, deadtime=deadtime,
+                               nblock_duration_detection=13)
+                res_ref = peaks_ref(tr, 1.5, 0.1, deadtime=deadtime,
+                                    nblock_duration_detection=13)
+
+                assert len(res[0]) > 0
+                for a, b in zip(res, res_ref):
+                    self.assertEqual(len(a), len(b))
+                    assert numeq(a, b, 1e-6)
+
+        traces = [
+            trace.Trace(station=sta, tmin=sometime + i*10., deltat=0.01,
+                        ydata=num.random.uniform(size=1000))
+            for i, sta in enumerate(['B', 'A', 'B'])]
+
+        nslc_ids, peaks = trace.find_peaks(traces, 0.9, 0.1)
+        self.assertEqual([nslc_id[1] for nslc_id in nslc_ids], ['A', 'B'])
+        assert num.all(num.diff(peaks['tpeak']) >= 0.)
+        for tr in traces:
+            tpeaks, apeaks = tr.peaks(0.9, 0.1)
+            sel = peaks[
+                (peaks['inslc'] == nslc_ids.index(tr.nslc_id)) &
+                (peaks['tpeak'] >= tr.tmin) & (peaks['tpeak'] <= tr.tmax)]
+
+            assert numeq(sel['tpeak'], tpeaks, 1e-6)
+            assert numeq(sel['apeak'], apeaks, 1e-6)
+
     def testCorrelate(self):
         
         for la, lb, mode, res in [
@@ -379,7 +524,171 @@ class TraceTestCase(unittest.TestCase):
         assert numeq( trace.moving_sum(x,3,mode='valid'), [3,6,9], 0.001 )
         assert numeq( trace.moving_sum(x,3,mode='full'), [0,1,3,6,9,7,4], 0.001 )
 
-    
+
+    def testStaLtaMulti(self):
+        from pyrocko import autopick
+
+        num.random.seed(10)
+        nchannels, nsamples = 5, 1000
+        ns, nl = 10, 50
+        data = num.random.normal(size=(nchannels, nsamples))
+        data[:, 600:650] *= 10.
+
+        # centered, compare to Trace.sta_lta_centered
+        ratios = autopick.sta_lta(data, ns, nl, method='centered')
+        for ichannel in xrange(nchannels):
+            tr = trace.Trace(ydata=data[ichannel].copy(), deltat=0.5)
+            tr.sta_lta_centered(ns*0.5, nl*0.5)
+            assert numeq(ratios[ichannel] * ns / nl, tr.ydata, 1e-6)
+
+        # classic, compare to straightforward implementation
+        sqr = data**2
+        ratios = autopick.sta_lta(data, ns, nl, method='classic')
+        for i in (nl-1, nl, 300, nsamples-1):
+            ref = num.mean(sqr[:, i-ns+1:i+1], axis=1) / \
+                num.mean(sqr[:, i-nl+1:i+1], axis=1)
+
+            assert numeq(ratios[:, i], ref, 1e-6)
+
+        assert num.all(ratios[:, :nl-1] == 0.0)
+
+        # block-wise processing gives same result as processing all at once
+        for method in ('classic', 'recursive'):
+            ratios = autopick.sta_lta(data, ns, nl, method=method)
+            stalta = autopick.STALTA(ns, nl, method=method)
+            ratios2 = num.hstack([
+                stalta.process(data[:, i:i+70])
+                for i in xrange(0, nsamples, 70)])
+
+            assert numeq(ratios, ratios2, 1e-6)
+
+            traces = [
+                trace.Trace(station='S%i' % i, deltat=0.5, tmin=sometime,
+                            ydata=data[i].copy())
+                for i in xrange(nchannels)]
+
+            p = pile.Pile()
+            p.add_file(pile.MemTracesFile(None, traces))
+            stalta = autopick.STALTA(ns, nl, method=method)
+            out = {}
+            for trs in p.chopper(tmin=sometime, tmax=sometime+500., tinc=100.):
+                for tr in stalta.process_traces(trs):
+                    out.setdefault(tr.station, []).append(tr.ydata)
+
+            for i in xrange(nchannels):
+                assert numeq(num.concatenate(out['S%i' % i]), ratios[i], 1e-6)
+
+        # centered needs more than nl samples
+        self.assertRaises(
+            autopick.AutopickError,
+            autopick.sta_lta, data[:, :nl], ns, nl, method='centered')
+
+        autopick.sta_lta(data[:, :nl+1], ns, nl, method='centered')
+
+        # integer data must not overflow when squared
+        idata = (data * 1e5).astype(num.int32)
+        for method in ('classic', 'centered', 'recursive'):
+            ratios = autopick.sta_lta(idata, ns, nl, method=method)
+            ref = autopick.sta_lta(
+                idata.astype(num.float64), ns, nl, method=method)
+
+            assert numeq(ratios, ref, 1e-6)
+
+            traces = [
+                trace.Trace(station='S%i' % i, deltat=0.5, tmin=sometime,
+                            ydata=idata[i].copy())
+                for i in xrange(nchannels)]
+
+            stalta = autopick.STALTA(ns, nl, method=method)
+            for tr in stalta.process_traces(traces):
+                i = int(tr.station[1:])
+                assert numeq(tr.ydata, ref[i], 1e-6)
+
+    def testCoroutineDetection(self):
+        from pyrocko import autopick
+        from scipy.signal import hilbert
+
+        num.random.seed(11)
+        deltat = 0.1
+        n = 3000
+        t = num.arange(n) * deltat
+        ydata = num.random.normal(scale=0.1, size=n)
+        for tpulse in (40., 107.3, 200., 255.):
+            ydata += num.exp(-((t-tpulse)/0.5)**2)
+
+        tr = trace.Trace('', 'STA', '', 'Z', tmin=sometime, deltat=deltat,
+                         ydata=ydata)
+
+        splits = [0, 100, 101, 1072, 1500, 2600, n]
+        fragments = [tr.chop(sometime+i*deltat, sometime+j*deltat,
+                             inplace=False, include_last=False)
+                     for (i, j) in zip(splits[:-1], splits[1:])]
+
+        def run(pipe):
+            for fragment in fragments:
+                pipe.send(fragment)
+
+            pipe.close()
+
+        # STA/LTA
+        for method in ('classic', 'recursive'):
+            out = []
+            run(trace.co_sta_lta(trace.co_list_append(out), 1., 10.,
+                                 method=method))
+
+            ref = autopick.sta_lta(ydata, 10, 100, method=method)
+            assert numeq(num.concatenate([x.ydata for x in out]), ref, 1e-6)
+            self.assertEqual(out[0].tmin, sometime)
+
+        # envelope
+        out = []
+        run(trace.co_envelope(trace.co_list_append(out), n=50))
+        env = num.concatenate([x.ydata for x in out])
+        self.assertEqual(out[0].tmin, sometime - 50*deltat)
+        ref = num.abs(hilbert(ydata))
+        assert numeq(env[150:-100], ref[100:-150], 0.1)
+
+        # trigger
+        detections = []
+        run(trace.co_trigger(trace.co_list_append(detections), 0.5, 2.))
+        tpeaks, apeaks = tr.peaks(0.5, 2.)
+        self.assertEqual(len(detections), 4)
+        for (nslc, tpeak, apeak), tpeak_ref, apeak_ref in zip(
+                detections, tpeaks, apeaks):
+
+            self.assertEqual(nslc, tr.nslc_id)
+            assert abs(tpeak - tpeak_ref) < 1e-6
+            self.assertEqual(apeak, apeak_ref)
+
+        # search windows still open at a gap or at the end are truncated
+        tr2 = tr.copy()
+        tr2.set_ydata(ydata + num.exp(-((t-299.5)/0.5)**2))
+        pieces = [tr2.chop(sometime+i*deltat, sometime+j*deltat,
+                           inplace=False, include_last=False)
+                  for (i, j) in [(0, 1072), (1080, 2000), (2000, n)]]
+
+        detections = []
+        pipe = trace.co_trigger(trace.co_list_append(detections), 0.5, 2.)
+        for piece in pieces:
+            pipe.send(piece)
+
+        pipe.close()
+
+        refs = list(zip(*pieces[0].peaks(0.5, 2.)))
+        merged = trace.degapper([pieces[1].copy(), pieces[2].copy()])[0]
+        refs.extend(zip(*merged.peaks(0.5, 2.)))
+
+        self.assertEqual(len(detections), 5)
+        self.assertEqual(len(detections), len(refs))
+        for (nslc, tpeak, apeak), (tpeak_ref, apeak_ref) in zip(
+                detections, refs):
+
+            assert abs(tpeak - tpeak_ref) < 1e-6
+            self.assertEqual(apeak, apeak_ref)
+
+        self.assertTrue(abs(detections[1][1] - (sometime + 107.1)) < 1e-6)
+        self.assertTrue(abs(detections[-1][1] - (sometime + 299.5)) < 0.2)
+
     def testContinuousDownsample(self):
 
         y = num.random.random(1000)
@@ -399,6 +708,62 @@ class TraceTestCase(unittest.TestCase):
                 downsampler.close()
                 assert (round(c2s[0].tmin / dt2) * dt2 - c2s[0].tmin )/dt1 < 0.5001
 
+    def testPolyphaseDownsample(self):
+        num.random.seed(24)
+        y = num.random.normal(size=1000)
+        for q in (2, 3, 5):
+            for ioff in (0, 1, 4):
+                y1 = util.decimate(y, q, ftype='fir', ioff=ioff)
+                y2, _ = util.decimate(y, q, ftype='fir', ioff=ioff, zi=True)
+                assert numeq(y1, y2, 1e-9)
+
+                # chunked with history carried
+                y3, history = util.decimate(
+                    y[:337], q, ftype='fir-polyphase', ioff=ioff, zi=True)
+                istart = 15 + ioff + q * y3.size - 337
+                y4, _ = util.fir_decimate(
+                    y[337:], util.decimate_coeffs(q, None, 'fir')[0], q,
+                    istart, history)
+
+                assert numeq(num.concatenate((y3, y4)), y1, 1e-9)
+
+        tr = trace.Trace(tmin=sometime, deltat=0.005, ydata=y)
+        tr1 = tr.copy()
+        tr1.downsample_to(0.1, ftype='fir')
+        tr2 = tr.copy()
+        tr2.downsample_to(0.1, ftype='fir-polyphase')
+        assert numeq(tr1.ydata, tr2.ydata, 1e-9)
+
+        for q in (2, 3, 5):
+            for tadd in (0.0, 0.01, 0.7):
+                bs = [trace.Trace(
+                    'N', 'S', '', 'Z', tmin=sometime+i*0.1*100+tadd,
+                    deltat=0.1, ydata=y[i*100:(i+1)*100]) for i in range(10)]
+
+                # gap
+                bs[5:] = [b.copy() for b in bs[5:]]
+                for b in bs[5:]:
+                    b.shift(1.0)
+
+                b, a, n = util.decimate_coeffs(q, None, 'fir')
+                c1s = []
+                c2s = []
+                p1 = trace.co_antialias(trace.co_dropsamples(
+                    trace.co_list_append(c1s), q, n), q, n, 'fir')
+                p2 = trace.co_downsample(trace.co_list_append(c2s), q)
+                for b in bs:
+                    p1.send(b)
+                    p2.send(b)
+
+                p1.close()
+                p2.close()
+
+                self.assertEqual(len(c1s), len(c2s))
+                for c1, c2 in zip(c1s, c2s):
+                    assert abs(c1.tmin - c2.tmin) < 1e-6
+                    assert c1.deltat == c2.deltat
+                    assert numeq(c1.ydata, c2.ydata, 1e-9)
+
     def testEqualizeSamplingRates(self):
         y = num.random.random(1000)
         t1 = trace.Trace(tmin=0, ydata=y, deltat=0.01)
@@ -494,6 +859,45 @@ class TraceTestCase(unittest.TestCase):
                 m, n = rt.misfit(candidate=cand , setup=setup)
                 self.assertNotEqual(m, None, 'misfit\'s m is None')
 
+    def testMisfitMany(self):
+        num.random.seed(5)
+        observeds, candidates = [], []
+        for i in xrange(20):
+            n = 500 + (i % 3) * 7
+            observeds.append(trace.Trace(
+                station=str(i), tmin=(i % 5)*0.02,
+                deltat=0.02 if i % 4 == 0 else 0.01,
+                ydata=num.random.normal(size=n)))
+            candidates.append(trace.Trace(
+                station=str(i), tmin=0.3 + (i % 5)*0.02, deltat=0.01,
+                ydata=num.random.normal(size=n)))
+
+        taper = trace.CosFader(xfade=1.)
+        fresponse = trace.ButterworthResponse(corner=2., order=4, type='low')
+        for domain in ['time_domain', 'frequency_domain', 'envelope',
+                       'absolute', 'cc_max_norm']:
+            for filter in [fresponse, None]:
+                if domain == 'frequency_domain' and filter is None:
+                    continue
+
+                setup = trace.MisfitSetup(
+                    norm=2, taper=taper, domain=domain, filter=filter)
+
+                ref = num.array([
+                    a.misfit(b, setup, nocache=True)
+                    for (a, b) in zip(observeds, candidates)])
+
+                for nocache in (False, True, False):
+                    ms, ns = trace.misfit_many(
+                        observeds, candidates, setup, nocache=nocache)
+
+                    assert num.allclose(ms, ref[:, 0])
+                    assert num.allclose(ns, ref[:, 1])
+
+        # processing chain caches are bounded
+        for stage in observeds[0]._pchain.stages:
+            assert len(stage._cache) <= 16
+
     def testMisfitBox(self):
 
         ydata = num.zeros(9)
@@ -586,6 +990,187 @@ class TraceTestCase(unittest.TestCase):
         tr2.ydata += tr1.ydata.mean()
         assert numeq(tr1.ydata, tr2.ydata, 0.01)
 
+    def test_batch_processing(self):
+        num.random.seed(23)
+        n = 1000
+        deltat = 0.01
+        traces = []
+        for i in xrange(5):
+            traces.append(trace.Trace(
+                '', 'S%i' % i, '', 'Z', tmin=1000.0 + (i % 2)*deltat,
+                deltat=deltat, ydata=num.random.normal(size=n)))
+
+        def check(outputs, refs, eps=1e-9):
+            self.assertEqual(len(outputs), len(refs))
+            for output, ref in zip(outputs, refs):
+                self.assertEqual(output.nslc_id, ref.nslc_id)
+                assert abs(output.tmin - ref.tmin) < deltat*1e-3
+                assert abs(output.tmax - ref.tmax) < deltat*1e-3
+                assert numeq(output.ydata, ref.ydata, eps)
+
+        for filt, args in [
+                ('lowpass', (4, 5.)),
+                ('highpass', (2, 1.)),
+                ('bandpass', (3, 1., 5.))]:
+
+            refs = []
+            for tr in traces:
+                ref = tr.copy()
+                getattr(ref, filt)(*args)
+                refs.append(ref)
+
+            check(getattr(trace, filt + '_traces')(traces, *args), refs)
+
+        resp = trace.ButterworthResponse(
+            corner=2., order=4, type='low')
+
+        for tfade, cut_off_fading in ((0., True), (0.5, True), (0.5, False)):
+            refs = [tr.transfer(tfade, (0.1, 0.2, 10., 20.), resp,
+                                cut_off_fading=cut_off_fading)
+                    for tr in traces]
+
+            check(trace.transfer_traces(
+                traces, tfade, (0.1, 0.2, 10., 20.), resp,
+                cut_off_fading=cut_off_fading), refs)
+
+        taper = trace.CosTaper(1001., 1002., 1005., 1009.)
+        for chop in (False, True):
+            refs = [tr.taper(taper, inplace=False, chop=chop)
+                    for tr in traces]
+            check(trace.taper_traces(traces, taper, chop=chop), refs)
+
+        with self.assertRaises(trace.MisalignedTraces):
+            trace.lowpass_traces(
+                traces + [traces[0].chop(1000., 1005., inplace=False)],
+                4, 5.)
+
+    def test_response_cache(self):
+        num.random.seed(25)
+        pz1 = trace.PoleZeroResponse(
+            zeros=[0j, 0j],
+            poles=[-0.037+0.037j, -0.037-0.037j, -251.3+0j],
+            constant=60077000.)
+        pz2 = trace.PoleZeroResponse(
+            zeros=[], poles=[-1.+2j, -1.-2j], constant=3.)
+        intg = trace.IntegrationResponse()
+        resps = [
+            trace.FrequencyResponse(),
+            pz1,
+            trace.MultiplyResponse([pz1, intg, pz2]),
+            trace.ButterworthResponse(corner=2., order=4, type='low')]
+
+        freqs = num.linspace(0., 10., 101)
+
+        def evaluate_pz_ref(pz, freqs):
+            jomeg = 1.0j * 2.*num.pi*freqs
+            a = num.ones(freqs.size, dtype=num.complex)*pz.constant
+            for z in pz.zeros:
+                a *= jomeg-z
+            for p in pz.poles:
+                a /= jomeg-p
+            return a
+
+        assert numeq(pz1.evaluate(freqs), evaluate_pz_ref(pz1, freqs), 1e-6)
+        ref = evaluate_pz_ref(pz1, freqs) * intg.evaluate(freqs) \
+            * evaluate_pz_ref(pz2, freqs)
+        assert numeq(resps[2].evaluate(freqs), ref, 1e-6)
+
+        # keys are equal for equal content, caching is disabled for
+        # subclasses
+        pz1b = trace.PoleZeroResponse(
+            zeros=list(pz1.zeros), poles=list(pz1.poles),
+            constant=pz1.constant)
+        self.assertEqual(pz1._cache_key(), pz1b._cache_key())
+        assert pz1._cache_key() != pz2._cache_key()
+
+        class MyResponse(trace.PoleZeroResponse):
+            pass
+
+        assert MyResponse()._cache_key() is None
+
+        tr = trace.Trace(
+            tmin=0., deltat=0.01, ydata=num.random.normal(size=1000))
+
+        cache = trace.g_tapered_coefs_cache
+        for resp in resps:
+            for freqlimits in (None, (0.1, 0.2, 20., 40.)):
+                cache.clear()
+                trs = [tr.transfer(2., freqlimits, resp, invert=invert)
+                       for invert in (False, True)]
+
+                self.assertEqual(len(cache._entries), 2)
+                for invert, tr1 in zip((False, True), trs):
+                    tr2 = tr.transfer(2., freqlimits, resp, invert=invert)
+                    self.assertEqual(len(cache._entries), 2)
+                    assert numeq(tr1.ydata, tr2.ydata, 1e-9)
+
+        cache.clear()
+
+        # least recently used entries are dropped first
+        cache = trace.TaperedCoefsCache(nbytes_max=2*800)
+        for k in 'abc':
+            cache.put(k, num.zeros(100))
+            if k == 'b':
+                assert cache.get('a') is not None
+
+        assert cache.get('b') is None
+        assert cache.get('a') is not None and cache.get('c') is not None
+
+    def testEvalrespCacheKey(self):
+        import tempfile
+        import shutil
+
+        tempdir = tempfile.mkdtemp(prefix='pyrocko-test')
+        try:
+            respfile = os.path.join(tempdir, 'RESP.XX.STA..BHZ')
+            with open(respfile, 'w') as f:
+                for tmin, tmax in [
+                        ('2005,001,00:00:00.0000', '2010,001,00:00:00.0000'),
+                        ('2010,001,00:00:00.0000', 'No Ending Time')]:
+
+                    f.write('''B050F03     Station:     STA
+B050F16     Network:     XX
+B052F03     Location:    ??
+B052F04     Channel:     BHZ
+B052F22     Start date:  %s
+B052F23     End date:    %s
+''' % (tmin, tmax))
+
+            def key(cls, t, station='STA'):
+                tr = trace.Trace(
+                    'XX', station, '', 'BHZ', tmin=util.str_to_time(t),
+                    deltat=1.0, ydata=num.zeros(10))
+
+                return cls(respfile, tr)._cache_key()
+
+            for cls in (trace.InverseEvalresp, trace.Evalresp):
+                # same epoch
+                self.assertEqual(
+                    key(cls, '2006-01-01 00:00:00'),
+                    key(cls, '2009-06-01 12:00:00'))
+
+                assert key(cls, '2006-01-01 00:00:00') != \
+                    key(cls, '2011-01-01 00:00:00')
+
+                self.assertEqual(
+                    key(cls, '2011-01-01 00:00:00'),
+                    key(cls, '2020-01-01 00:00:00'))
+
+                # no matching epoch
+                assert key(cls, '2004-01-01 00:00:00') != \
+                    key(cls, '2004-06-01 00:00:00')
+                assert key(cls, '2006-01-01 00:00:00', 'STB') != \
+                    key(cls, '2006-06-01 00:00:00', 'STB')
+
+            assert key(trace.Evalresp, '2006-01-01 00:00:00') != \
+                key(trace.InverseEvalresp, '2006-01-01 00:00:00')
+
+            os.unlink(respfile)
+            assert key(trace.Evalresp, '2006-01-01 00:00:00') is None
+
+        finally:
+            shutil.rmtree(tempdir)
+
     def test_muliply_taper(self):
 
         taper = trace.CosTaper(0., 1., 2., 3.)
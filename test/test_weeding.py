@@ -0,0 +1,90 @@
+import unittest
+import numpy as num
+
+from pyrocko import weeding, util
+
+
+def dense_meandists(x, y, neighborhood):
+    dx = num.abs(x[num.newaxis, :] - x[:, num.newaxis]) % 360.
+    dx = num.where(dx > 180., 360.-dx, dx)
+    dists = num.sqrt(dx**2 + (y[num.newaxis, :] - y[:, num.newaxis])**2)
+    return weeding.neighborhood_density(dists, neighborhood)
+
+
+class WeedingTestCase(unittest.TestCase):
+
+    def test_neighborhood_density(self):
+        num.random.seed(1)
+        n = 200
+        x = num.random.uniform(-180., 360., n)
+        y = num.random.uniform(0., 90., n)
+        for neighborhood in (1, 3):
+            index = weeding.WeedingIndex(x, y)
+            assert num.allclose(
+                index.neighborhood_density(neighborhood),
+                dense_meandists(x, y, neighborhood))
+
+        # x is periodic
+        index = weeding.WeedingIndex([0.5, 359.5, 180.], [10., 10., 10.])
+        assert num.allclose(index.neighborhood_density(1), [1., 1., 179.5])
+
+    def test_weed(self):
+        num.random.seed(2)
+        n = 2000
+        x = num.random.uniform(0., 360., n)
+        y = num.random.uniform(0., 90., n)
+        badnesses = num.ones(n)
+        badnesses[:100] = 10.
+
+        deleted, meandists_kept = weeding.weed(
+            x, y, badnesses, neighborhood=3, nwanted=500)
+
+        self.assertEqual(num.sum(~deleted), 500)
+        self.assertEqual(meandists_kept.size, 500)
+        assert num.allclose(
+            meandists_kept, dense_meandists(x[~deleted], y[~deleted], 3))
+
+        # weeding evens out density
+        meandists = dense_meandists(x, y, 3)
+        assert num.std(meandists_kept) / num.mean(meandists_kept) < \
+            num.std(meandists) / num.mean(meandists)
+
+        # bad points are removed preferably
+        assert num.mean(deleted[:100]) > num.mean(deleted[100:])
+
+    def test_weed_few(self):
+        deleted, meandists_kept = weeding.weed([], [], [])
+        self.assertEqual(deleted.size, 0)
+        self.assertEqual(meandists_kept.size, 0)
+
+        deleted, meandists_kept = weeding.weed([10.], [20.], [1.])
+        self.assertEqual(deleted.tolist(), [False])
+        self.assertEqual(meandists_kept.size, 1)
+
+        for nwanted in (None, 0, 1, 2):
+            deleted, meandists_kept = weeding.weed(
+                [10., 20.], [20., 20.], [1., 2.], nwanted=nwanted)
+
+            nkept = num.sum(~deleted)
+            self.assertEqual(meandists_kept.size, nkept)
+            self.assertTrue(nkept >= 1)
+            if nkept == 2:
+                assert num.allclose(meandists_kept, [10., 10.])
+
+        # azimuths slightly below zero, e.g. of stations due north
+        deleted, meandists_kept = weeding.weed(
+            num.array([-1e-20, 10., 20., 30.]), num.array([1., 2., 3., 4.]),
+            num.ones(4))
+
+        self.assertEqual(num.sum(~deleted), 2)
+        index = weeding.WeedingIndex([-1e-20, 10.], [0., 0.])
+        assert num.allclose(index.neighborhood_density(1), [10., 10.])
+
+        stations, meandists_kept, deleted = weeding.weed_stations([], 0)
+        self.assertEqual(stations, [])
+        self.assertEqual(deleted.size, 0)
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_weeding', 'warning')
+    unittest.main()